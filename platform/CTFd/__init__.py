@@ -27,6 +27,7 @@ from CTFd.utils.initialization import (
     init_request_processors,
     init_template_filters,
     init_template_globals,
+    init_tracking,
 )
 from CTFd.utils.migrations import create_database, migrations, stamp_latest_revision
 from CTFd.utils.sessions import CachingSessionInterface
@@ -336,6 +337,7 @@ def create_app(config="CTFd.config.Config"):
 
         init_logs(app)
         init_events(app)
+        init_tracking(app)
         init_plugins(app)
         init_cli(app)
 
@@ -1,7 +1,6 @@
 import math
 from datetime import datetime, timedelta
 from typing import List  # noqa: I001
-import pytz
 
 from flask import abort, render_template, request, url_for
 from flask_restx import Namespace, Resource
@@ -10,7 +9,13 @@ from sqlalchemy.sql import and_
 from CTFd.api.v1.helpers.request import validate_args
 from CTFd.api.v1.helpers.schemas import sqlalchemy_to_pydantic
 from CTFd.api.v1.schemas import APIDetailedSuccessResponse, APIListSuccessResponse
-from CTFd.cache import clear_challenges, clear_ratings, clear_standings
+from CTFd.cache import (
+    clear_challenges,
+    clear_ratings,
+    clear_solves,
+    clear_standings,
+    clear_submissions,
+)
 from CTFd.constants import RawEnum
 from CTFd.exceptions.challenges import (
     ChallengeCreateException,
@@ -20,7 +25,6 @@ from CTFd.models import ChallengeFiles as ChallengeFilesModel
 from CTFd.models import Challenges
 from CTFd.models import ChallengeTopics as ChallengeTopicsModel
 from CTFd.models import (
-    Fails,
     Flags,
     Hints,
     HintUnlocks,
@@ -50,6 +54,7 @@ from CTFd.utils.config.visibility import (
     challenges_visible,
     scores_visible,
 )
+from CTFd.utils.counters import get_challenge_fails
 from CTFd.utils.dates import ctf_ended, ctf_paused, ctftime, isoformat
 from CTFd.utils.decorators import (
     admins_only,
@@ -64,9 +69,11 @@ from CTFd.utils.decorators.visibility import (
 )
 from CTFd.utils.humanize.words import pluralize
 from CTFd.utils.logging import log
+from CTFd.utils.ratelimit import SLIDING_WINDOW, get_rate_limiter
 from CTFd.utils.security.signing import serialize
 from CTFd.utils.user import (
     authed,
+    get_account_user_ids,
     get_current_team,
     get_current_team_attrs,
     get_current_user,
@@ -191,6 +198,15 @@ class ChallengeList(Resource):
         all_challenge_ids = {
             c.id for c in Challenges.query.with_entities(Challenges.id).all()
         }
+
+        # Load the deadlines of all SQL challenges at once
+        deadlines = {}
+        sql_challenge_ids = [c.id for c in chal_q if c.type == "sql"]
+        if sql_challenge_ids and "sql" in CHALLENGE_CLASSES:
+            from CTFd.plugins.sql_challenges import get_deadlines
+
+            deadlines = get_deadlines(sql_challenge_ids)
+
         for challenge in chal_q:
             if challenge.requirements:
                 requirements = challenge.requirements.get("prerequisites", [])
@@ -223,28 +239,8 @@ class ChallengeList(Resource):
                 # Challenge type does not exist. Fall through to next challenge.
                 continue
 
-            # Get deadline if it's a SQL challenge
-            deadline = None
-            deadline_status = None
-            if challenge.type == "sql":
-                from CTFd.plugins.sql_challenges import SQLChallenge
-                sql_challenge = SQLChallenge.query.filter_by(id=challenge.id).first()
-                if sql_challenge and sql_challenge.deadline:
-                    # Convert UTC to KST for display
-                    KST = pytz.timezone('Asia/Seoul')
-                    utc_dt = pytz.UTC.localize(sql_challenge.deadline)
-                    kst_dt = utc_dt.astimezone(KST)
-                    deadline = kst_dt.strftime('%Y-%m-%d %H:%M')
-                    
-                    # Determine deadline status
-                    now_kst = datetime.now(KST)
-                    if now_kst > kst_dt:
-                        deadline_status = 'expired'  # 지난 경우 - 빨간색
-                    elif now_kst.date() == kst_dt.date():
-                        deadline_status = 'today'    # 당일 - 노란색
-                    else:
-                        deadline_status = 'active'   # 아직 안 지난 경우 - 초록색
-            
+            deadline, deadline_status = deadlines.get(challenge.id, (None, None))
+
             # Challenge passes all checks, add it to response
             response.append(
                 {
@@ -604,6 +600,23 @@ class ChallengeAttempt(Resource):
         if authed() is False:
             return {"success": True, "data": {"status": "authentication_required"}}, 403
 
+        # Optionally limit every attempt including previews so that the judges can't be flooded
+        limit = int(get_config("submissions_per_min", default=0) or 0)
+        if limit > 0 and is_admin() is False:
+            key = "attempt:{}".format(get_current_user_attrs().id)
+            limiter = get_rate_limiter()
+            if limiter.hit(key, limit, 60, algorithm=SLIDING_WINDOW) is False:
+                return (
+                    {
+                        "success": True,
+                        "data": {
+                            "status": "ratelimited",
+                            "message": "You're submitting too fast. Slow down.",
+                        },
+                    },
+                    429,
+                )
+
         if not request.is_json:
             request_data = request.form
         else:
@@ -725,32 +738,22 @@ class ChallengeAttempt(Resource):
             max_tries = challenge.max_attempts
             if max_tries and max_tries > 0:
                 max_attempts_behavior = get_config("max_attempts_behavior", "lockout")
-                fails_query = Fails.query.filter_by(
-                    account_id=user.account_id, challenge_id=challenge_id
-                )
                 if max_attempts_behavior == "timeout":  # Use timeout behavior
                     max_attempts_timeout = int(get_config("max_attempts_timeout", 300))
-                    timeout_delta = datetime.utcnow() - timedelta(
-                        seconds=max_attempts_timeout
+                    fails, most_recent_fail_date = get_challenge_fails(
+                        user.account_id, challenge_id, seconds=max_attempts_timeout
                     )
-                    fails = fails_query.filter(Fails.date >= timeout_delta).count()
                     # Calculate actual time remaining for the most recent fail
                     response = f"Not accepted. Try again in {math.ceil(max_attempts_timeout / 60)} minutes"
-                    if fails > 0:
-                        most_recent_fail = (
-                            fails_query.filter(Fails.date >= timeout_delta)
-                            .order_by(Fails.date.asc())
-                            .first()
-                        )
-                        if most_recent_fail:
-                            time_since_fail = (
-                                datetime.utcnow() - most_recent_fail.date
-                            ).total_seconds()
-                            remaining_seconds = max_attempts_timeout - time_since_fail
-                            remaining_minutes = math.ceil(remaining_seconds / 60)
-                            response = f"Not accepted. Try again in {remaining_minutes} minutes"
+                    if fails > 0 and most_recent_fail_date:
+                        time_since_fail = (
+                            datetime.utcnow() - most_recent_fail_date
+                        ).total_seconds()
+                        remaining_seconds = max_attempts_timeout - time_since_fail
+                        remaining_minutes = math.ceil(remaining_seconds / 60)
+                        response = f"Not accepted. Try again in {remaining_minutes} minutes"
                 else:  # Use lockout behavior
-                    fails = fails_query.count()
+                    fails, _ = get_challenge_fails(user.account_id, challenge_id)
                     response = "Not accepted. You have 0 tries remaining"
 
                 if fails >= max_tries:
@@ -777,11 +780,15 @@ class ChallengeAttempt(Resource):
             if status == "correct" or status is True:
                 # The challenge plugin says the input is right
                 if ctftime() or current_user.is_admin():
+                    value = challenge.value
                     chal_class.solve(
                         user=user, team=team, challenge=challenge, request=request
                     )
                     clear_standings()
-                    clear_challenges()
+                    clear_solves(challenge.id, get_account_user_ids(user, team))
+                    # Some challenge types (e.g. dynamic) change their value on solve
+                    if challenge.value != value:
+                        clear_challenges()
 
                 log(
                     "submissions",
@@ -816,14 +823,46 @@ class ChallengeAttempt(Resource):
                     "success": True,
                     "data": {"status": "partial", "message": message},
                 }
+            elif status == "queued":
+                # The challenge plugin accepted the input for asynchronous judging
+                # The plugin records the Solve or Fail once the input has been judged
+                log(
+                    "submissions",
+                    "[{date}] {name} submitted {submission} on {challenge_id} with kpm {kpm} [QUEUED]",
+                    name=user.name,
+                    submission=request_data.get("submission", "").encode("utf-8"),
+                    challenge_id=challenge_id,
+                    kpm=kpm,
+                )
+                data = {"status": "queued", "message": message}
+                data.update(getattr(response, "data", None) or {})
+                return {"success": True, "data": data}, 202
+            elif status == "ratelimited":
+                # The challenge plugin could not judge the input right now (e.g. its backend is overloaded)
+                # Nothing is recorded so the attempt does not count against the user
+                log(
+                    "submissions",
+                    "[{date}] {name} submitted {submission} on {challenge_id} with kpm {kpm} [RATELIMITED]",
+                    name=user.name,
+                    submission=request_data.get("submission", "").encode("utf-8"),
+                    challenge_id=challenge_id,
+                    kpm=kpm,
+                )
+                return (
+                    {
+                        "success": True,
+                        "data": {"status": "ratelimited", "message": message},
+                    },
+                    429,
+                )
             elif status == "incorrect" or status is False:
                 # The challenge plugin says the input is wrong
                 if ctftime() or current_user.is_admin():
                     chal_class.fail(
                         user=user, team=team, challenge=challenge, request=request
                     )
-                    clear_standings()
-                    clear_challenges()
+                    # A Fail changes neither scores nor solves, only the submission history
+                    clear_submissions(challenge.id, get_account_user_ids(user, team))
 
                 log(
                     "submissions",
@@ -853,21 +892,14 @@ class ChallengeAttempt(Resource):
                                 get_config("max_attempts_timeout", 300)
                             )
                             # Calculate actual time remaining based on the most recent fail
-                            timeout_delta = datetime.utcnow() - timedelta(
-                                seconds=max_attempts_timeout
-                            )
-                            most_recent_fail = (
-                                Fails.query.filter_by(
-                                    account_id=user.account_id,
-                                    challenge_id=challenge_id,
-                                )
-                                .filter(Fails.date >= timeout_delta)
-                                .order_by(Fails.date.asc())
-                                .first()
+                            _, most_recent_fail_date = get_challenge_fails(
+                                user.account_id,
+                                challenge_id,
+                                seconds=max_attempts_timeout,
                             )
-                            if most_recent_fail:
+                            if most_recent_fail_date:
                                 time_since_fail = (
-                                    datetime.utcnow() - most_recent_fail.date
+                                    datetime.utcnow() - most_recent_fail_date
                                 ).total_seconds()
                                 remaining_seconds = (
                                     max_attempts_timeout - time_since_fail
@@ -148,7 +148,13 @@ class NotificantionList(Resource):
         response.data["type"] = notif_type
         response.data["sound"] = notif_sound
 
-        current_app.events_manager.publish(data=response.data, type="notification")
+        # Notifications for a user or team are only sent to their connections
+        current_app.events_manager.publish(
+            data=response.data,
+            type="notification",
+            user_id=response.data.get("user_id"),
+            team_id=response.data.get("team_id"),
+        )
 
         return {"success": True, "data": response.data}
 
@@ -5,7 +5,9 @@ statistics_namespace = Namespace(
 )
 
 # isort:imports-firstparty
-from CTFd.api.v1.statistics import challenges  # noqa: F401,I001
+from CTFd.api.v1.statistics import cache  # noqa: F401,I001
+from CTFd.api.v1.statistics import challenges  # noqa: F401
+from CTFd.api.v1.statistics import events  # noqa: F401
 from CTFd.api.v1.statistics import scores  # noqa: F401
 from CTFd.api.v1.statistics import submissions  # noqa: F401
 from CTFd.api.v1.statistics import teams  # noqa: F401
@@ -0,0 +1,13 @@
+from flask_restx import Resource
+
+from CTFd.api.v1.statistics import statistics_namespace
+from CTFd.cache import get_memoize_stats
+from CTFd.utils.decorators import admins_only
+
+
+@statistics_namespace.route("/cache")
+class CacheStatistics(Resource):
+    @admins_only
+    def get(self):
+        # Counters are kept by each worker so these are the current worker's
+        return {"success": True, "data": get_memoize_stats()}
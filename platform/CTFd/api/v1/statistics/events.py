@@ -0,0 +1,13 @@
+from flask import current_app
+from flask_restx import Resource
+
+from CTFd.api.v1.statistics import statistics_namespace
+from CTFd.utils.decorators import admins_only
+
+
+@statistics_namespace.route("/events")
+class EventStatistics(Resource):
+    @admins_only
+    def get(self):
+        # Connections are held by each worker so these are the current worker's
+        return {"success": True, "data": current_app.events_manager.stats()}
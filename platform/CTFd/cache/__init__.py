@@ -1,11 +1,46 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache, wraps
 from hashlib import md5
-from time import monotonic_ns
+from time import monotonic, monotonic_ns
+from uuid import uuid4
 
-from flask import request
+from flask import current_app, g, request
 from flask_caching import Cache, make_template_fragment_key
 
-cache = Cache()
+log = logging.getLogger(__name__)
+
+
+class TieredCache(Cache):
+    """
+    Flask-Caching's Cache which also clears the process local tier of
+    local_memoize'd functions in every worker
+    """
+
+    def delete_memoized(self, f, *args, **kwargs):
+        super().delete_memoized(f, *args, **kwargs)
+        name = getattr(f, "local_name", None)
+        local = get_local_cache()
+        if name and local:
+            key = None
+            if args or kwargs:
+                key = local.make_key(f.uncached, *args, **kwargs)
+            local.invalidate(function=name, key=key)
+
+    def clear(self):
+        cleared = super().clear()
+        local = get_local_cache()
+        if local:
+            local.invalidate()
+        return cleared
+
+
+cache = TieredCache()
 
 
 def timed_lru_cache(timeout: int = 300, maxsize: int = 64, typed: bool = False):
@@ -39,6 +74,363 @@ def timed_lru_cache(timeout: int = 300, maxsize: int = 64, typed: bool = False):
     return wrapper_cache
 
 
+# Memoized functions that are cleared together are put in namespaces whose
+# generation is part of their cache keys. Clearing a namespace increments its
+# generation and the keys of the old one are left to expire.
+NAMESPACE_KEY_PREFIX = "namespace/"
+
+
+def _new_generation():
+    # Generations that were evicted or cleared restart from a random number
+    # so that they don't go back to one that is still cached somewhere. It's
+    # kept within 62 bits so that it can still be incremented.
+    return uuid4().int >> 66
+
+
+def get_namespace_generations(*names):
+    """
+    Get the generations of cache namespaces. They're read from the cache once
+    per app context (i.e. request).
+    """
+    generations = g.setdefault("cache_namespaces", {})
+    missing = [name for name in names if name not in generations]
+    if missing:
+        keys = [NAMESPACE_KEY_PREFIX + name for name in missing]
+        for name, key, generation in zip(missing, keys, cache.get_many(*keys)):
+            if generation is None:
+                cache.add(key, _new_generation(), timeout=0)
+                generation = cache.get(key)
+            generations[name] = generation
+    return [generations[name] for name in names]
+
+
+def clear_namespace(name):
+    """
+    Clear every memoized value in a cache namespace with one atomic increment
+    """
+    key = NAMESPACE_KEY_PREFIX + name
+    generation = cache.cache.inc(key)
+    if generation is None or generation == 1:
+        # The generation didn't exist
+        generation = _new_generation()
+        cache.set(key, generation, timeout=0)
+    g.setdefault("cache_namespaces", {})[name] = generation
+
+    local = get_local_cache()
+    if local and any(name in names for names in local_memoized.values()):
+        local.invalidate(namespace=name)
+
+
+def namespaced(*names):
+    """
+    Put a memoized function in cache namespaces. Must be applied on top of
+    cache.memoize or stale_memoize.
+    """
+
+    def decorator(f):
+        make_cache_key = f.make_cache_key
+
+        def make_namespaced_cache_key(*args, **kwargs):
+            generations = get_namespace_generations(*names)
+            return make_cache_key(*args, **kwargs) + "".join(
+                "/{}".format(generation) for generation in generations
+            )
+
+        f.make_cache_key = make_namespaced_cache_key
+        f.namespaces = names
+        return f
+
+    return decorator
+
+
+# Old values of stale_memoize'd functions are kept this long after they expire
+# or are deleted to be served while they are recomputed
+STALE_TIMEOUT = 300
+RECOMPUTE_LOCK_TIMEOUT = 30
+RECOMPUTE_POLL_INTERVAL = 0.05
+
+memoize_stats = {}
+
+
+def stale_memoize(timeout=60, stale_timeout=STALE_TIMEOUT, beta=1.0):
+    """
+    cache.memoize with stampede protection.
+
+    Only the caller holding a per-key lock recomputes a missing or expired
+    value. Others get the previous value while it is recomputed or wait for
+    the new one if there is none. Values are also refreshed early with a
+    probability that grows as they near their expiry and with how long they
+    took to compute (XFetch), so that hot keys are rarely recomputed by
+    several callers at once. The decorated functions can be cleared with
+    cache.delete_memoized as before.
+
+    Parameters:
+    timeout (int): Seconds until a value is recomputed
+    stale_timeout (int): Seconds an old value can be served for after that
+    beta (float): Values above 1 favor refreshing earlier
+    """
+
+    def memoize(f):
+        stats = {"hits": 0, "misses": 0, "stale": 0, "recomputes": 0, "early": 0}
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                key = decorated_function.make_cache_key(f, *args, **kwargs)
+                entry = cache.get(key)
+            except Exception:
+                if current_app.debug:
+                    raise
+                return f(*args, **kwargs)
+
+            # The first 16 characters of a memoized key hash the function and
+            # its arguments and the rest is the version that delete_memoized
+            # swaps out and the generations of its namespaces. The stale copy
+            # is kept under a key without them.
+            stale_key = "stale/" + key[:16]
+            now = time.time()
+            if entry is not None:
+                value, expires, delta = entry
+                if now - delta * beta * math.log(1 - random.random()) < expires:
+                    stats["hits"] += 1
+                    return value
+                stale = entry
+            else:
+                stale = cache.get(stale_key)
+
+            lock_key = "lock/" + key
+            token = uuid4().hex
+            deadline = now + RECOMPUTE_LOCK_TIMEOUT
+            while not cache.add(lock_key, token, timeout=RECOMPUTE_LOCK_TIMEOUT):
+                if entry is not None:
+                    # Another caller is already refreshing this value early
+                    stats["hits"] += 1
+                    return entry[0]
+                if stale is not None:
+                    stats["stale"] += 1
+                    # Tell local_memoize not to keep the old value
+                    g.stale_served = g.get("stale_served", 0) + 1
+                    return stale[0]
+                if time.time() > deadline:
+                    break
+                time.sleep(RECOMPUTE_POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    stats["hits"] += 1
+                    return entry[0]
+
+            if entry is not None:
+                stats["early"] += 1
+            else:
+                stats["misses"] += 1
+            stats["recomputes"] += 1
+            try:
+                start = time.time()
+                value = f(*args, **kwargs)
+                entry = (value, time.time() + timeout, time.time() - start)
+                cache.set(key, entry, timeout=timeout)
+                cache.set(stale_key, entry, timeout=timeout + stale_timeout)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+            return value
+
+        decorated_function.uncached = f
+        decorated_function.cache_timeout = timeout
+        # Values are stored with their expiry so they must not share keys with
+        # values stored by cache.memoize
+        decorated_function.make_cache_key = cache._memoize_make_cache_key(
+            make_name=lambda fname: fname + "/stale_memoize",
+            timeout=decorated_function,
+        )
+        decorated_function.delete_memoized = lambda: cache.delete_memoized(f)
+        decorated_function.stats = stats
+        memoize_stats[f.__module__ + "." + f.__qualname__] = stats
+        return decorated_function
+
+    return memoize
+
+
+# Values served from the process local tier are shared between callers and
+# must not be modified. The tier is only used with caches whose invalidations
+# can reach every worker.
+LOCAL_TIMEOUT = 30
+LOCAL_MAXSIZE = 1024
+LOCAL_CACHE_TYPES = ("simple", "redis")
+LOCAL_CHANNEL = "local_cache"
+LISTEN_RETRY_INTERVAL = 5
+
+# The namespaces of every local_memoize'd function by name
+local_memoized = {}
+
+
+class LocalCache(object):
+    """
+    Bounded, per process LRU caches of local_memoize'd functions. With Redis
+    invalidations are published to the other workers, which drop the same
+    values on receipt.
+    """
+
+    def __init__(self, client=None, channel=LOCAL_CHANNEL):
+        self.lock = threading.Lock()
+        self.functions = {}
+        # Values read from the shared cache before an invalidation may already
+        # be stale so they're only kept if nothing was invalidated since
+        self.version = 0
+        self.client = client
+        self.channel = channel
+        self.listener = None
+        if client is not None:
+            self.listener = threading.Thread(target=self.listen, daemon=True)
+            self.listener.start()
+
+    def make_key(self, f, *args, **kwargs):
+        return repr(cache._memoize_kwargs_to_args(f, *args, **kwargs))
+
+    def get(self, name, key):
+        with self.lock:
+            entries = self.functions.get(name)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires <= monotonic():
+                del entries[key]
+                return False, None
+            entries.move_to_end(key)
+            return True, value
+
+    def set(self, name, key, value, version, timeout, maxsize):
+        with self.lock:
+            if version != self.version:
+                return
+            entries = self.functions.setdefault(name, OrderedDict())
+            entries[key] = (value, monotonic() + timeout)
+            entries.move_to_end(key)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+
+    def apply(self, function=None, key=None, namespace=None):
+        with self.lock:
+            self.version += 1
+            if namespace is not None:
+                for name, names in local_memoized.items():
+                    if namespace in names:
+                        self.functions.pop(name, None)
+            elif function is None:
+                self.functions.clear()
+            elif key is None:
+                self.functions.pop(function, None)
+            else:
+                self.functions.get(function, {}).pop(key, None)
+
+    def invalidate(self, function=None, key=None, namespace=None):
+        """
+        Drop values of a function (or all functions or a namespace) from this
+        worker and publish the invalidation to the others
+        """
+        self.apply(function=function, key=key, namespace=namespace)
+        if self.client is not None:
+            message = {"function": function, "key": key, "namespace": namespace}
+            try:
+                self.client.publish(self.channel, json.dumps(message))
+            except Exception:
+                log.exception("Failed to publish local cache invalidation")
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while not subscribed
+                self.apply()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.apply(**json.loads(message["data"]))
+            except Exception:
+                log.exception("Lost local cache invalidations. Resubscribing.")
+                time.sleep(LISTEN_RETRY_INTERVAL)
+
+
+def get_local_cache():
+    """
+    Get the process local cache tier of the current app or None if the app's
+    cache can't invalidate it in every worker
+    """
+    if "local_cache" not in current_app.extensions:
+        local = None
+        cache_type = current_app.config.get("CACHE_TYPE")
+        if cache_type == "redis":
+            local = LocalCache(
+                client=cache.cache._write_client,
+                channel=(cache.cache.key_prefix or "") + LOCAL_CHANNEL,
+            )
+        elif cache_type in LOCAL_CACHE_TYPES:
+            local = LocalCache()
+        current_app.extensions["local_cache"] = local
+    return current_app.extensions["local_cache"]
+
+
+def local_memoize(timeout=LOCAL_TIMEOUT, maxsize=LOCAL_MAXSIZE):
+    """
+    Keep the values of a memoized function in a bounded LRU cache in each
+    process in front of the shared cache. Must be applied on top of
+    cache.memoize or stale_memoize (and namespaced).
+
+    Parameters:
+    timeout (int): Seconds a value is kept in the process
+    maxsize (int): Maximum number of values kept per function
+    """
+
+    def decorator(f):
+        name = f.__module__ + "." + f.__qualname__
+        stats = memoize_stats.setdefault(name, {})
+        stats.update({"local_hits": 0, "local_misses": 0})
+        local_memoized[name] = getattr(f, "namespaces", ())
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            local = get_local_cache()
+            if local is None:
+                return f(*args, **kwargs)
+            key = local.make_key(f.uncached, *args, **kwargs)
+            found, value = local.get(name, key)
+            if found:
+                stats["local_hits"] += 1
+                return value
+            stats["local_misses"] += 1
+            version = local.version
+            stale_served = g.get("stale_served", 0)
+            value = f(*args, **kwargs)
+            # An old value served by stale_memoize while another worker
+            # recomputes it may predate an invalidation that was already
+            # applied. No invalidation follows the recompute so it isn't kept.
+            if g.get("stale_served", 0) == stale_served:
+                local.set(name, key, value, version, timeout, maxsize)
+            return value
+
+        decorated_function.local_name = name
+        return decorated_function
+
+    return decorator
+
+
+def get_memoize_stats():
+    """
+    Get the hit, miss and recompute counters of stale_memoize'd functions and
+    the hit ratios of local_memoize'd functions in this worker
+    """
+    results = {}
+    for name, stats in memoize_stats.items():
+        results[name] = dict(stats)
+        if "local_hits" in stats:
+            lookups = stats["local_hits"] + stats["local_misses"]
+            results[name]["local_hit_ratio"] = (
+                stats["local_hits"] / lookups if lookups else None
+            )
+    return results
+
+
 def make_cache_key(path=None, key_prefix="view/%s"):
     """
     This function mostly emulates Flask-Caching's `make_cache_key` function so we can delete cached api responses.
@@ -87,9 +479,9 @@ def calculate_param_hash(params, allowed_params=None):
 
 
 def clear_config():
-    from CTFd.utils import _get_config, get_app_config
+    from CTFd.utils import bump_config_generation, get_app_config
 
-    cache.delete_memoized(_get_config)
+    bump_config_generation()
     cache.delete_memoized(get_app_config)
 
 
@@ -97,60 +489,65 @@ def clear_standings():
     from CTFd.api import api
     from CTFd.api.v1.scoreboard import ScoreboardDetail, ScoreboardList
     from CTFd.constants.static import CacheKeys
-    from CTFd.models import Teams, Users  # noqa: I001
-    from CTFd.utils.scoreboard import get_scoreboard_detail
-    from CTFd.utils.scores import get_standings, get_team_standings, get_user_standings
-    from CTFd.utils.user import (
-        get_team_place,
-        get_team_score,
-        get_user_place,
-        get_user_score,
-    )
-
-    # Clear out the bulk standings functions
-    cache.delete_memoized(get_standings)
-    cache.delete_memoized(get_team_standings)
-    cache.delete_memoized(get_user_standings)
-    cache.delete_memoized(get_scoreboard_detail)
-
-    # Clear out the individual helpers for accessing score via the model
-    cache.delete_memoized(Users.get_score)
-    cache.delete_memoized(Users.get_place)
-    cache.delete_memoized(Teams.get_score)
-    cache.delete_memoized(Teams.get_place)
 
-    # Clear the Jinja Attrs constants
-    cache.delete_memoized(get_user_score)
-    cache.delete_memoized(get_user_place)
-    cache.delete_memoized(get_team_score)
-    cache.delete_memoized(get_team_place)
+    # Clear out the standings functions, the individual helpers for accessing
+    # score via the model and the Jinja Attrs constants
+    clear_namespace("standings")
 
     # Clear out HTTP request responses
     cache.delete(make_cache_key(path=api.name + "." + ScoreboardList.endpoint))
     cache.delete(make_cache_key(path=api.name + "." + ScoreboardDetail.endpoint))
-    cache.delete_memoized(ScoreboardList.get)
-    cache.delete_memoized(ScoreboardDetail.get)
 
     # Clear out scoreboard templates
     cache.delete(make_template_fragment_key(CacheKeys.PUBLIC_SCOREBOARD_TABLE))
 
 
 def clear_challenges():
-    from CTFd.utils.challenges import get_all_challenges  # noqa: I001
-    from CTFd.utils.challenges import (
-        get_rating_average_for_challenge_id,
+    clear_namespace("challenges")
+
+
+def _challenge_id_variants(challenge_id):
+    # Challenge IDs reach memoized functions both as ints and as the strings
+    # taken from URLs or form data, which are cached under different keys
+    return {int(challenge_id), str(challenge_id)}
+
+
+def clear_submissions(challenge_id, user_ids):
+    """
+    Clear the cached submission history of the given users for a challenge.
+    This is all a new Fail changes.
+    """
+    from CTFd.utils.challenges import get_submissions_for_user_id_for_challenge_id
+
+    for user_id in user_ids:
+        for chal_id in _challenge_id_variants(challenge_id):
+            cache.delete_memoized(
+                get_submissions_for_user_id_for_challenge_id, user_id, chal_id
+            )
+
+
+def clear_solves(challenge_id, user_ids):
+    """
+    Clear the challenge caches affected by a new Solve of the given users.
+    The users should be all members of the solving account.
+    """
+    from CTFd.utils.challenges import (  # noqa: I001
         get_solve_counts_for_challenges,
         get_solve_ids_for_user_id,
         get_solves_for_challenge_id,
-        get_submissions_for_user_id_for_challenge_id,
     )
 
-    cache.delete_memoized(get_all_challenges)
-    cache.delete_memoized(get_solves_for_challenge_id)
-    cache.delete_memoized(get_submissions_for_user_id_for_challenge_id)
-    cache.delete_memoized(get_solve_ids_for_user_id)
-    cache.delete_memoized(get_solve_counts_for_challenges)
-    cache.delete_memoized(get_rating_average_for_challenge_id)
+    clear_submissions(challenge_id, user_ids)
+    for user_id in user_ids:
+        cache.delete_memoized(get_solve_ids_for_user_id, user_id)
+
+    # The freeze and admin flags are cached as given, which may also be None
+    # when the argument is omitted or read from an unset config
+    for flag in (None, False, True):
+        cache.delete_memoized(get_solve_counts_for_challenges, None, flag)
+        for chal_id in _challenge_id_variants(challenge_id):
+            cache.delete_memoized(get_solves_for_challenge_id, chal_id, flag)
+            cache.delete_memoized(get_solve_counts_for_challenges, chal_id, flag)
 
 
 def clear_ratings():
@@ -166,6 +563,11 @@ def clear_pages():
     cache.delete_memoized(get_page)
 
 
+def clear_identity():
+    # The identity of the current request holds the user and team it loaded
+    g.pop("identity", None)
+
+
 def clear_user_recent_ips(user_id):
     from CTFd.utils.user import get_user_recent_ips
 
@@ -184,20 +586,12 @@ def clear_user_session(user_id):
     cache.delete_memoized(get_user_place, user_id=user_id)
     cache.delete_memoized(get_user_score, user_id=user_id)
     cache.delete_memoized(get_user_recent_ips, user_id=user_id)
+    clear_identity()
 
 
 def clear_all_user_sessions():
-    from CTFd.utils.user import (  # noqa: I001
-        get_user_attrs,
-        get_user_place,
-        get_user_recent_ips,
-        get_user_score,
-    )
-
-    cache.delete_memoized(get_user_attrs)
-    cache.delete_memoized(get_user_place)
-    cache.delete_memoized(get_user_score)
-    cache.delete_memoized(get_user_recent_ips)
+    clear_namespace("users")
+    clear_identity()
 
 
 def clear_team_session(team_id):
@@ -206,11 +600,9 @@ def clear_team_session(team_id):
     cache.delete_memoized(get_team_attrs, team_id=team_id)
     cache.delete_memoized(get_team_place, team_id=team_id)
     cache.delete_memoized(get_team_score, team_id=team_id)
+    clear_identity()
 
 
 def clear_all_team_sessions():
-    from CTFd.utils.user import get_team_attrs, get_team_place, get_team_score
-
-    cache.delete_memoized(get_team_attrs)
-    cache.delete_memoized(get_team_place)
-    cache.delete_memoized(get_team_score)
+    clear_namespace("teams")
+    clear_identity()
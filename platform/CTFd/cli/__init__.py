@@ -53,8 +53,14 @@ def build(cmd):
 
 @_cli.cli.command("export_ctf")
 @click.argument("path", default="")
-def export_ctf(path):
-    backup = export_ctf_util()
+@click.option(
+    "--compresslevel",
+    default=None,
+    type=click.IntRange(0, 9),
+    help="Deflate the export with this compression level instead of storing it",
+)
+def export_ctf(path, compresslevel):
+    backup = export_ctf_util(compresslevel=compresslevel)
 
     if path:
         with open(path, "wb") as target:
@@ -78,9 +84,15 @@ def export_ctf(path):
     is_flag=True,
     help="Delete import file when import is finished",
 )
-def import_ctf(path, delete_import_on_finish=False):
+@click.option(
+    "--workers",
+    default=None,
+    type=click.IntRange(1),
+    help="Load tables with bulk inserts on this many parallel connections",
+)
+def import_ctf(path, delete_import_on_finish=False, workers=None):
     try:
-        import_ctf_util(path)
+        import_ctf_util(path, workers=workers)
     except Exception as e:
         from CTFd.utils.dates import unix_time
 
@@ -251,6 +251,8 @@ class ServerConfig(object):
 
     EMAIL_CONFIRMATION_REQUIRE_INTERACTION: bool = process_boolean_str(empty_str_cast(config_ini["optional"].get("EMAIL_CONFIRMATION_REQUIRE_INTERACTION", False), default=False))
 
+    TRACKING_FLUSH_INTERVAL: int = int(empty_str_cast(config_ini["optional"].get("TRACKING_FLUSH_INTERVAL", ""), default=5))
+
     if DATABASE_URL.startswith("sqlite") is False:
         SQLALCHEMY_ENGINE_OPTIONS = {
             "max_overflow": int(empty_str_cast(config_ini["optional"]["SQLALCHEMY_MAX_OVERFLOW"], default=20)),  # noqa: E131
@@ -298,6 +300,7 @@ class TestingConfig(ServerConfig):
     CACHE_TYPE = "simple"
     CACHE_THRESHOLD = 500
     SAFE_MODE = True
+    TRACKING_FLUSH_INTERVAL = 0
 
 
 # Actually initialize ServerConfig to allow us to add more attributes on
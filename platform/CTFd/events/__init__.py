@@ -1,19 +1,28 @@
-from flask import Blueprint, Response, current_app, stream_with_context
+from flask import Blueprint, Response, current_app, request, stream_with_context
 
 from CTFd.models import db
 from CTFd.utils import get_app_config
 from CTFd.utils.decorators import authed_only, ratelimit
+from CTFd.utils.ratelimit import TOKEN_BUCKET
+from CTFd.utils.user import get_current_user_attrs
 
 events = Blueprint("events", __name__)
 
 
 @events.route("/events")
 @authed_only
-@ratelimit(method="GET", limit=150, interval=60)
+@ratelimit(method="GET", limit=150, interval=60, algorithm=TOKEN_BUCKET)
 def subscribe():
+    user = get_current_user_attrs()
+    # Browsers send the ID of the last event they got when they reconnect
+    last_event_id = request.headers.get("Last-Event-ID")
+
     @stream_with_context
     def gen():
-        for event in current_app.events_manager.subscribe():
+        events = current_app.events_manager.subscribe(
+            user_id=user.id, team_id=user.team_id, last_event_id=last_event_id
+        )
+        for event in events:
             yield str(event)
 
     enabled = get_app_config("SERVER_SENT_EVENTS")
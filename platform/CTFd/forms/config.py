@@ -108,6 +108,11 @@ class AccountSettingsForm(BaseForm):
         widget=NumberInput(min=1),
         description="Number of submissions allowed per minute for flag bruteforce protection (default: 10)",
     )
+    submissions_per_min = IntegerField(
+        "Submissions per Minute",
+        widget=NumberInput(min=0),
+        description="Number of attempts (correct, incorrect and previews) a user can make per minute before being rate limited (default: 0, no limit)",
+    )
 
     submit = SubmitField("Update")
 
@@ -7,7 +7,7 @@ from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import column_property, validates
 
-from CTFd.cache import cache
+from CTFd.cache import cache, namespaced
 
 db = SQLAlchemy()
 ma = Marshmallow()
@@ -549,6 +549,7 @@ class Users(db.Model):
             awards = awards.filter(Awards.date < dt)
         return awards.all()
 
+    @namespaced("standings")
     @cache.memoize()
     def get_score(self, admin=False):
         score = db.func.sum(Challenges.value).label("score")
@@ -582,27 +583,24 @@ class Users(db.Model):
         else:
             return 0
 
+    @namespaced("standings")
     @cache.memoize()
     def get_place(self, admin=False, numeric=False):
         """
-        This method is generally a clone of CTFd.scoreboard.get_standings.
-        The point being that models.py must be self-reliant and have little
-        to no imports within the CTFd application as importing from the
-        application itself will result in a circular import.
+        This method looks the user up in the place map built from
+        CTFd.utils.scores.get_user_standings instead of scanning the standings.
+        The imports are done here because models.py must be self-reliant and
+        importing from the application itself will result in a circular import.
         """
         from CTFd.utils.humanize.numbers import ordinalize
-        from CTFd.utils.scores import get_user_standings
+        from CTFd.utils.scores import get_user_places
 
-        standings = get_user_standings(admin=admin)
-
-        for i, user in enumerate(standings):
-            if user.user_id == self.id:
-                n = i + 1
-                if numeric:
-                    return n
-                return ordinalize(n)
-        else:
+        n = get_user_places(admin=admin).get(self.id)
+        if n is None:
             return None
+        if numeric:
+            return n
+        return ordinalize(n)
 
 
 class Admins(Users):
@@ -833,6 +831,7 @@ class Teams(db.Model):
 
         return awards.all()
 
+    @namespaced("standings")
     @cache.memoize()
     def get_score(self, admin=False):
         score = 0
@@ -840,27 +839,24 @@ class Teams(db.Model):
             score += member.get_score(admin=admin)
         return score
 
+    @namespaced("standings")
     @cache.memoize()
     def get_place(self, admin=False, numeric=False):
         """
-        This method is generally a clone of CTFd.scoreboard.get_standings.
-        The point being that models.py must be self-reliant and have little
-        to no imports within the CTFd application as importing from the
-        application itself will result in a circular import.
+        This method looks the team up in the place map built from
+        CTFd.utils.scores.get_team_standings instead of scanning the standings.
+        The imports are done here because models.py must be self-reliant and
+        importing from the application itself will result in a circular import.
         """
         from CTFd.utils.humanize.numbers import ordinalize
-        from CTFd.utils.scores import get_team_standings  # noqa: I001
+        from CTFd.utils.scores import get_team_places
 
-        standings = get_team_standings(admin=admin)
-
-        for i, team in enumerate(standings):
-            if team.team_id == self.id:
-                n = i + 1
-                if numeric:
-                    return n
-                return ordinalize(n)
-        else:
+        n = get_team_places(admin=admin).get(self.id)
+        if n is None:
             return None
+        if numeric:
+            return n
+        return ordinalize(n)
 
 
 class Submissions(db.Model):
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 from flask import Blueprint
 
@@ -27,6 +28,8 @@ from CTFd.utils.user import get_ip
 class ChallengeResponse:
     status: str
     message: str
+    # Extra fields merged into the attempt response (e.g. the job id of a queued attempt)
+    data: Optional[dict] = None
 
     def __iter__(self):
         """Allow tuple-like unpacking for backwards compatibility."""
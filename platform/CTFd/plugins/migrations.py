@@ -43,7 +43,7 @@ def current(plugin_name=None):
         plugin_name = os.path.basename(os.path.dirname(caller_path))
 
     # Specifically bypass the cached config so that we always get the database value
-    version = _get_config.__wrapped__(plugin_name + "_alembic_version")
+    version = _get_config(plugin_name + "_alembic_version")
     if version == KeyError:
         version = None
     return version
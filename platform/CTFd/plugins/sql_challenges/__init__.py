@@ -1,3 +1,4 @@
+import hashlib
 import os
 import sqlite3
 import tempfile
@@ -8,14 +9,34 @@ import socket
 from datetime import datetime, timezone
 import pytz
 from flask import Blueprint, request, jsonify
+from CTFd.cache import cache
 from CTFd.models import Challenges, db
 from CTFd.plugins import register_plugin_assets_directory
 from CTFd.plugins.challenges import CHALLENGE_CLASSES, BaseChallenge, ChallengeResponse
-from CTFd.utils.decorators import admins_only
+from CTFd.plugins.sql_challenges.judge import (
+    JudgeBusy,
+    JudgeServerError,
+    get_judge_admission,
+    get_judge_client,
+    get_judge_memo,
+    normalize_query,
+)
+from CTFd.plugins.sql_challenges.jobs import (
+    JobPending,
+    get_job,
+    get_judge_jobs,
+    init_judge_jobs,
+)
+from CTFd.utils.decorators import admins_only, authed_only
+from CTFd.utils.user import get_current_team, get_current_user, is_admin
 
 # Set KST timezone
 KST = pytz.timezone('Asia/Seoul')
 
+# Expected results are keyed by a content hash of the init and solution queries
+# so an edited challenge never reads a stale entry and old ones simply expire
+EXPECTED_RESULT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 
 class SQLChallenge(Challenges):
     __mapper_args__ = {"polymorphic_identity": "sql"}
@@ -139,7 +160,9 @@ class SQLChallengeType(BaseChallenge):
         data = request.form or request.get_json()
         
         # Update SQL-specific fields
+        init_query_changed = False
         if "init_query" in data:
+            init_query_changed = data["init_query"] != challenge.init_query
             challenge.init_query = data["init_query"]
         if "solution_query" in data:
             challenge.solution_query = data["solution_query"]
@@ -166,6 +189,14 @@ class SQLChallengeType(BaseChallenge):
                 setattr(challenge, attr, value)
         
         db.session.commit()
+
+        # Drop the judge's pre-initialized schema snapshot so the next
+        # submission rebuilds it from the new init query
+        if init_query_changed:
+            invalidate_judge_snapshot(challenge.id)
+
+        # The expected result of the new revision is cached by the first
+        # submission since it is keyed by the init and solution queries
         return challenge
 
     @classmethod
@@ -194,92 +225,144 @@ class SQLChallengeType(BaseChallenge):
                 message="Submission deadline has passed"
             )
         
+        # In async mode the submission is judged by a background worker which
+        # records the Solve/Fail and notifies the user when it is done
+        jobs = get_judge_jobs()
+        if jobs is not None and not is_preview:
+            try:
+                job_id = jobs.submit(
+                    challenge,
+                    user=get_current_user(),
+                    team=get_current_team(),
+                    submission=submission,
+                    request=request,
+                )
+            except JudgeBusy:
+                return ChallengeResponse(
+                    status="ratelimited",
+                    message="The SQL judge is busy right now. Please retry in a few seconds."
+                )
+            except JobPending:
+                return ChallengeResponse(
+                    status="ratelimited",
+                    message="Your previous query for this challenge is still being judged."
+                )
+            return ChallengeResponse(
+                status="queued",
+                message="Your query is being judged...",
+                data={"job_id": job_id}
+            )
+
         # Execute SQL queries using Go MySQL server
         try:
-            import requests
-            import json
-            
-            # Use Go MySQL server
-            go_server_url = os.environ.get('SQL_JUDGE_SERVER_URL', 'http://localhost:8080')
+            return cls.judge(challenge, submission, is_preview)
+        except JudgeBusy:
+            return ChallengeResponse(
+                status="ratelimited",
+                message="The SQL judge is busy right now. Please retry in a few seconds."
+            )
+        except Exception as e:
+            return ChallengeResponse(
+                status="incorrect",
+                message=f"Error executing query: {str(e)}"
+            )
+
+    @classmethod
+    def judge(cls, challenge, submission, is_preview=False):
+        """
+        Judge a submission. Identical submissions to the same challenge
+        revision share one judge call and its result for a short while.
+        """
+        def run():
+            # The admission controller bounds how many judgings this worker runs at once
+            with get_judge_admission().slot():
+                return cls.run_judge(challenge, submission, is_preview)
+
+        key = submission_memo_key(challenge, submission, is_preview)
+        try:
+            return get_judge_memo().run(key, run)
+        except JudgeServerError as e:
+            prefix = "[PREVIEW]\n" if is_preview else ""
+            return ChallengeResponse(
+                status="incorrect",
+                message=f"{prefix}SQL judge server error: HTTP {e.status_code}"
+            )
+
+    @classmethod
+    def run_judge(cls, challenge, submission, is_preview=False):
+        """
+        Run a submission on the judge server and build the challenge response.
+        """
+        import json
+
+        if is_preview:
+            # For preview, only execute the user query without comparing
+            response = get_judge_client().post(
+                "/execute",
+                {
+                    'init_query': challenge.init_query,
+                    'user_query': submission,
+                    'challenge_id': str(challenge.id)
+                }
+            )
             
-            if is_preview:
-                # For preview, only execute the user query without comparing
-                response = requests.post(
-                    f"{go_server_url}/judge",
-                    json={
-                        'init_query': challenge.init_query,
-                        'solution_query': submission,  # Use user query as solution to get its result
-                        'user_query': submission
-                    },
-                    timeout=10
-                )
+            if response.status_code == 200:
+                result = response.json()
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    if not result.get('success'):
-                        return ChallengeResponse(
-                            status="incorrect",
-                            message=f"[PREVIEW]\nError: {result.get('error', 'Unknown error')}"
-                        )
-                    
-                    # Just show the query result without grading
-                    user_result_str = json.dumps(result['user_result'])
+                if not result.get('success'):
                     return ChallengeResponse(
                         status="incorrect",
-                        message=f"[PREVIEW]\nQuery executed successfully:\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]"
+                        message=f"[PREVIEW]\nError: {result.get('error', 'Unknown error')}"
                     )
-                else:
+                
+                # Just show the query result without grading
+                user_result_str = json.dumps(result['result'])
+                return ChallengeResponse(
+                    status="incorrect",
+                    message=f"[PREVIEW]\nQuery executed successfully:\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]"
+                )
+            else:
+                raise JudgeServerError(response.status_code)
+        else:
+            # Normal submission - compare with solution
+            payload = {
+                'init_query': challenge.init_query,
+                'solution_query': challenge.solution_query,
+                'user_query': submission,
+                'challenge_id': str(challenge.id)
+            }
+            # With a cached expected result the judge only runs the user query
+            expected_result = get_expected_result(challenge)
+            if expected_result is not None:
+                payload['expected_result'] = expected_result
+
+            response = get_judge_client().post("/judge", payload)
+            
+            if response.status_code == 200:
+                result = response.json()
+                
+                if not result.get('success'):
                     return ChallengeResponse(
                         status="incorrect",
-                        message=f"[PREVIEW]\nSQL judge server error: HTTP {response.status_code}"
+                        message=f"Error: {result.get('error', 'Unknown error')}"
                     )
-            else:
-                # Normal submission - compare with solution
-                response = requests.post(
-                    f"{go_server_url}/judge",
-                    json={
-                        'init_query': challenge.init_query,
-                        'solution_query': challenge.solution_query,
-                        'user_query': submission
-                    },
-                    timeout=10
-                )
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    if not result.get('success'):
-                        return ChallengeResponse(
-                            status="incorrect",
-                            message=f"Error: {result.get('error', 'Unknown error')}"
-                        )
-                    
-                    # Format results for display
-                    user_result_str = json.dumps(result['user_result'])
-                    expected_result_str = json.dumps(result['expected_result'])
-                    
-                    if result['match']:
-                        return ChallengeResponse(
-                            status="correct",
-                            message=f"✅ Correct! Your query produced the expected result.\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]"
-                        )
-                    else:
-                        return ChallengeResponse(
-                            status="incorrect",
-                            message=f"❌ Incorrect. Your query did not produce the expected result.\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]\n\n[EXPECTED_RESULT]\n{expected_result_str}\n[/EXPECTED_RESULT]"
-                        )
+                # Format results for display
+                user_result_str = json.dumps(result['user_result'])
+                expected_result_str = json.dumps(result['expected_result'])
+                
+                if result['match']:
+                    return ChallengeResponse(
+                        status="correct",
+                        message=f"✅ Correct! Your query produced the expected result.\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]"
+                    )
                 else:
                     return ChallengeResponse(
                         status="incorrect",
-                        message=f"SQL judge server error: HTTP {response.status_code}"
+                        message=f"❌ Incorrect. Your query did not produce the expected result.\n\n[USER_RESULT]\n{user_result_str}\n[/USER_RESULT]\n\n[EXPECTED_RESULT]\n{expected_result_str}\n[/EXPECTED_RESULT]"
                     )
-                    
-        except Exception as e:
-            return ChallengeResponse(
-                status="incorrect",
-                message=f"Error executing query: {str(e)}"
-            )
+            else:
+                raise JudgeServerError(response.status_code)
 
     @classmethod
     def execute_and_compare_with_details(cls, init_query, solution_query, user_query):
@@ -428,29 +511,20 @@ class SQLChallengeType(BaseChallenge):
         Used for testing in the admin interface.
         """
         try:
-            import requests
-            
-            # Use Go MySQL server for testing
-            go_server_url = os.environ.get('SQL_JUDGE_SERVER_URL', 'http://localhost:8080')
-            
-            # We need to execute the test query and get its result
-            # Use the judge endpoint with the test query as both solution and user query
-            response = requests.post(
-                f"{go_server_url}/judge",
-                json={
+            # Execute only the test query against the initialized database
+            response = get_judge_client().post(
+                "/execute",
+                {
                     'init_query': init_query,
-                    'solution_query': test_query,  # Use test query as solution
-                    'user_query': test_query  # And as user query to get the result
-                },
-                timeout=10
+                    'user_query': test_query
+                }
             )
             
             if response.status_code == 200:
                 result = response.json()
                 
                 if result.get('success'):
-                    # Extract the result from user_result
-                    user_result = result.get('user_result', {})
+                    user_result = result.get('result', {})
                     return {
                         "success": True,
                         "columns": user_result.get('columns', []),
@@ -474,6 +548,109 @@ class SQLChallengeType(BaseChallenge):
             }
 
 
+def expected_result_cache_key(init_query, solution_query):
+    digest = hashlib.sha256(
+        f"{init_query or ''}\0{solution_query or ''}".encode("utf-8")
+    ).hexdigest()
+    return f"sql_challenges:expected_result:{digest}"
+
+
+def get_deadlines(challenge_ids):
+    """
+    Get the display deadline (KST) and deadline status of SQL challenges in a
+    single query. Returns a dict of challenge id to a (deadline, status) tuple
+    for the challenges that have a deadline.
+    """
+    if not challenge_ids:
+        return {}
+
+    rows = (
+        SQLChallenge.query.with_entities(SQLChallenge.id, SQLChallenge.deadline)
+        .filter(SQLChallenge.id.in_(challenge_ids), SQLChallenge.deadline.isnot(None))
+        .all()
+    )
+
+    now_kst = datetime.now(KST)
+    today_kst = now_kst.date()
+    deadlines = {}
+    for challenge_id, deadline in rows:
+        # Convert UTC to KST for display
+        kst_dt = pytz.UTC.localize(deadline).astimezone(KST)
+        if now_kst > kst_dt:
+            status = 'expired'  # 지난 경우 - 빨간색
+        elif today_kst == kst_dt.date():
+            status = 'today'    # 당일 - 노란색
+        else:
+            status = 'active'   # 아직 안 지난 경우 - 초록색
+        deadlines[challenge_id] = (kst_dt.strftime('%Y-%m-%d %H:%M'), status)
+    return deadlines
+
+
+def submission_memo_key(challenge, submission, is_preview=False):
+    """
+    Key of a submission's judge result. It changes with the challenge's init
+    and solution queries so edits never serve results of the old revision.
+    """
+    digest = hashlib.sha256(
+        "\0".join([
+            str(challenge.id),
+            challenge.init_query or '',
+            '' if is_preview else (challenge.solution_query or ''),
+            normalize_query(submission),
+        ]).encode("utf-8")
+    ).hexdigest()
+    mode = "preview" if is_preview else "judge"
+    return f"sql_challenges:submission:{mode}:{digest}"
+
+
+def get_expected_result(challenge):
+    """
+    Get the result of a challenge's solution query from the shared cache,
+    executing it on the judge server on a miss.
+    Returns None if the solution query could not be executed.
+    """
+    key = expected_result_cache_key(challenge.init_query, challenge.solution_query)
+    expected_result = cache.get(key)
+    if expected_result is not None:
+        return expected_result
+
+    try:
+        response = get_judge_client().post(
+            "/execute",
+            {
+                'init_query': challenge.init_query,
+                'user_query': challenge.solution_query,
+                'challenge_id': str(challenge.id)
+            }
+        )
+        result = response.json() if response.status_code == 200 else {}
+    except Exception:
+        return None
+
+    if not result.get('success'):
+        return None
+
+    expected_result = result['result']
+    cache.set(key, expected_result, timeout=EXPECTED_RESULT_CACHE_TIMEOUT)
+    return expected_result
+
+
+def invalidate_judge_snapshot(challenge_id):
+    """
+    Ask the judge server to drop the cached schema snapshot of a challenge.
+    Failures are ignored since the judge also rebuilds snapshots whenever the
+    init query hash it receives changes.
+    """
+    try:
+        get_judge_client().post(
+            "/snapshots/invalidate",
+            {'challenge_id': str(challenge_id)},
+            timeout=2
+        )
+    except Exception:
+        pass
+
+
 # Global variable to store the Go server process
 go_server_process = None
 
@@ -608,6 +785,9 @@ def load(app):
     
     # Register challenge type
     CHALLENGE_CLASSES["sql"] = SQLChallengeType
+
+    # Judge submissions on background workers when SQL_JUDGE_ASYNC is enabled
+    init_judge_jobs(app)
     
     # Register assets directory
     register_plugin_assets_directory(app, base_path="/plugins/sql_challenges/assets/")
@@ -628,4 +808,34 @@ def load(app):
             }), 400
         
         result = SQLChallengeType.test_query(init_query, test_query)
-        return jsonify(result)
\ No newline at end of file
+        return jsonify(result)
+
+    @app.route('/api/v1/challenges/sql-judge/jobs/<job_id>', methods=['GET'])
+    @authed_only
+    def sql_judge_job(job_id):
+        """Polling fallback for clients that miss the sql_judge_result event"""
+        job = get_job(job_id)
+        if job is None or (job['user_id'] != get_current_user().id and not is_admin()):
+            return jsonify({
+                'success': False,
+                'errors': {'job_id': ['Job not found']}
+            }), 404
+        return jsonify({
+            'success': True,
+            'data': job
+        })
+
+    @app.route('/api/v1/challenges/sql-judge/metrics', methods=['GET'])
+    @admins_only
+    def sql_judge_metrics():
+        """Latency and error counters of this worker's judge client"""
+        data = get_judge_client().metrics.snapshot()
+        data['admission'] = get_judge_admission().snapshot()
+        data['memo'] = get_judge_memo().snapshot()
+        jobs = get_judge_jobs()
+        if jobs is not None:
+            data['jobs'] = {'pending': jobs.queue.qsize(), 'workers': jobs.workers}
+        return jsonify({
+            'success': True,
+            'data': data
+        })
\ No newline at end of file
@@ -486,6 +486,65 @@ CTFd._internal.challenge.postRender = function() {
     }, 500);
 };
 
+// Resolve with the attempt response of an asynchronously judged submission.
+// The sql_judge_result event tells us when the job is done, polling covers
+// clients without an event stream and events that were missed.
+function waitForJudgeResult(jobId) {
+  return new Promise(function(resolve) {
+    var source = CTFd.events && CTFd.events.source;
+    var done = false;
+    var timer = null;
+
+    function finish(job) {
+      if (done) {
+        return;
+      }
+      done = true;
+      clearTimeout(timer);
+      if (source) {
+        source.removeEventListener('sql_judge_result', onEvent);
+      }
+      resolve({
+        success: true,
+        data: job.result
+      });
+    }
+
+    function poll(delay) {
+      timer = setTimeout(function() {
+        CTFd.fetch('/api/v1/challenges/sql-judge/jobs/' + jobId, {
+          method: 'GET'
+        }).then(function(r) {
+          return r.json();
+        }).then(function(r) {
+          if (r.success && r.data.status === 'done') {
+            finish(r.data);
+          } else if (!done) {
+            poll(Math.min(delay * 2, 5000));
+          }
+        }).catch(function() {
+          if (!done) {
+            poll(5000);
+          }
+        });
+      }, delay);
+    }
+
+    function onEvent(event) {
+      var data = JSON.parse(event.data);
+      if (data.job_id === jobId) {
+        clearTimeout(timer);
+        poll(0);
+      }
+    }
+
+    if (source) {
+      source.addEventListener('sql_judge_result', onEvent);
+    }
+    poll(500);
+  });
+}
+
 CTFd._internal.challenge.submit = function(preview) {
   var challenge_id = parseInt(CTFd.lib.$("#challenge-id").val());
   var submission = CTFd.lib.$("#challenge-input").val();
@@ -505,6 +564,10 @@ CTFd._internal.challenge.submit = function(preview) {
   }
 
   return CTFd.api.post_challenge_attempt(params, body).then(function(response) {
+    if (response.data && response.data.status === 'queued' && response.data.job_id) {
+      // Judged asynchronously, resolve once the result is in
+      return waitForJudgeResult(response.data.job_id);
+    }
     if (response.status === 429) {
       // User was ratelimited but process response
       return response;
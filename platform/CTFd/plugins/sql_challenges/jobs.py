@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+import uuid
+from queue import Full, Queue
+
+from sqlalchemy.exc import IntegrityError
+
+from CTFd.cache import cache, clear_solves, clear_standings, clear_submissions
+from CTFd.models import Challenges, Teams, Users, db
+from CTFd.plugins.sql_challenges.judge import JudgeBusy, _env
+from CTFd.utils import get_config
+from CTFd.utils.counters import get_challenge_fails
+from CTFd.utils.dates import ctftime
+from CTFd.utils.user import get_account_user_ids
+
+JOB_CACHE_PREFIX = "sql_challenges:job:"
+PENDING_CACHE_PREFIX = "sql_challenges:pending:"
+
+
+class JobPending(Exception):
+    """
+    Raised when the account already has a job queued for the challenge
+    """
+
+
+class JobRequest(object):
+    """
+    The parts of a Flask request the challenge bookkeeping reads, captured when
+    the submission is enqueued so that it can be recorded outside the request
+    """
+
+    def __init__(self, form, access_route, remote_addr):
+        self.form = form
+        self.access_route = access_route
+        self.remote_addr = remote_addr
+
+    def get_json(self):
+        return self.form
+
+
+def job_cache_key(job_id):
+    return JOB_CACHE_PREFIX + job_id
+
+
+def pending_cache_key(account_id, challenge_id):
+    return "{}{}:{}".format(PENDING_CACHE_PREFIX, account_id, challenge_id)
+
+
+def get_job(job_id):
+    return cache.get(job_cache_key(job_id))
+
+
+def attempts_exhausted(user, challenge):
+    """
+    Check whether the account has used up the challenge's max_attempts
+    """
+    max_tries = challenge.max_attempts
+    if not max_tries or max_tries <= 0:
+        return False
+    seconds = None
+    if get_config("max_attempts_behavior", "lockout") == "timeout":
+        seconds = int(get_config("max_attempts_timeout", 300))
+    fails, _ = get_challenge_fails(user.account_id, challenge.id, seconds=seconds)
+    return fails >= max_tries
+
+
+class JudgeJobQueue(object):
+    """
+    Judges submissions on a pool of background threads so that web workers
+    do not block for the judge round trip. Job state is kept in the cache so
+    that any worker can answer a poll for it, and the outcome is published to
+    the submitting user through the event manager.
+
+    An account can only have one job pending per challenge. The max_attempts
+    and incorrect submission limits count recorded Fails, so allowing more
+    would let a burst of guesses through before any of them is recorded.
+    """
+
+    def __init__(self, app, workers=4, max_pending=256, ttl=600):
+        self.app = app
+        self.workers = workers
+        self.ttl = ttl
+        self.queue = Queue(maxsize=max_pending)
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        # Threads so that jobs are also judged without gevent monkey patching,
+        # with which they become greenlets
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, challenge, user, team, submission, request):
+        job_id = uuid.uuid4().hex
+        pending_key = pending_cache_key(user.account_id, challenge.id)
+        if not cache.add(pending_key, job_id, timeout=self.ttl):
+            raise JobPending
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "challenge_id": challenge.id,
+            "account_id": user.account_id,
+            "user_id": user.id,
+            "team_id": team.id if team else None,
+            "submission": submission,
+            "request": JobRequest(
+                form={"submission": submission},
+                access_route=list(request.access_route),
+                remote_addr=request.remote_addr,
+            ),
+        }
+        self._save(job_id, status="queued", user_id=user.id)
+        try:
+            self.queue.put_nowait(job)
+        except Full:
+            cache.delete(job_cache_key(job_id))
+            cache.delete(pending_key)
+            raise JudgeBusy
+        self.start()
+        return job_id
+
+    def _save(self, job_id, status, user_id, result=None):
+        cache.set(
+            job_cache_key(job_id),
+            {"id": job_id, "status": status, "user_id": user_id, "result": result},
+            timeout=self.ttl,
+        )
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            with self.app.app_context():
+                try:
+                    self.run(job)
+                except Exception as e:
+                    self._save(
+                        job["id"],
+                        status="done",
+                        user_id=job["user_id"],
+                        result={
+                            "status": "incorrect",
+                            "message": f"Error executing query: {str(e)}",
+                        },
+                    )
+                finally:
+                    db.session.remove()
+
+    def run(self, job):
+        """
+        Judge a job and record its Solve or Fail. Must be called inside an app context.
+        """
+        try:
+            return self._run(job)
+        finally:
+            cache.delete(pending_cache_key(job["account_id"], job["challenge_id"]))
+
+    def _run(self, job):
+        # Imported here to avoid a circular import with the plugin module
+        from CTFd.plugins.sql_challenges import SQLChallengeType
+
+        self._save(job["id"], status="running", user_id=job["user_id"])
+
+        challenge = Challenges.query.filter_by(id=job["challenge_id"]).first()
+        user = Users.query.filter_by(id=job["user_id"]).first()
+        team = (
+            Teams.query.filter_by(id=job["team_id"]).first() if job["team_id"] else None
+        )
+
+        try:
+            # Fails may have been recorded since the job was queued
+            if attempts_exhausted(user, challenge):
+                status = "ratelimited"
+                message = "Not accepted. You have 0 tries remaining"
+            else:
+                response = SQLChallengeType.judge(challenge, job["submission"])
+                status, message = response.status, response.message
+        except JudgeBusy:
+            status = "ratelimited"
+            message = "The SQL judge is busy right now. Please retry in a few seconds."
+        except Exception as e:
+            status, message = "incorrect", f"Error executing query: {str(e)}"
+
+        # Like a ratelimited attempt a busy judge or a lockout is not counted
+        if status != "ratelimited" and (ctftime() or user.type == "admin"):
+            if status == "correct":
+                try:
+                    SQLChallengeType.solve(
+                        user=user,
+                        team=team,
+                        challenge=challenge,
+                        request=job["request"],
+                    )
+                except IntegrityError:
+                    # Another submission from this account already solved it
+                    db.session.rollback()
+                    status = "already_solved"
+                else:
+                    clear_standings()
+                    clear_solves(challenge.id, get_account_user_ids(user, team))
+            else:
+                SQLChallengeType.fail(
+                    user=user, team=team, challenge=challenge, request=job["request"]
+                )
+                clear_submissions(challenge.id, get_account_user_ids(user, team))
+
+        # CTFd.utils.logging.log reads the session so log through the logger directly
+        logging.getLogger("submissions").info(
+            "[{date}] {name} submitted {submission} on {challenge_id} [ASYNC {status}]".format(
+                date=time.strftime("%m/%d/%Y %X"),
+                name=user.name,
+                submission=job["submission"].encode("utf-8"),
+                challenge_id=challenge.id,
+                status=status.upper(),
+            )
+        )
+
+        result = {"status": status, "message": message}
+        self._save(job["id"], status="done", user_id=user.id, result=result)
+
+        # The event only says that the job finished. Query results stay private
+        # to the submitter who fetches them through the polling endpoint.
+        self.app.events_manager.publish(
+            data={
+                "job_id": job["id"],
+                "user_id": user.id,
+                "challenge_id": challenge.id,
+                "status": status,
+            },
+            type="sql_judge_result",
+            user_id=user.id,
+        )
+        return result
+
+
+_jobs = None
+
+
+def init_judge_jobs(app):
+    """
+    Enable asynchronous judging when SQL_JUDGE_ASYNC is set in the environment
+    """
+    global _jobs
+    if _env("SQL_JUDGE_ASYNC", 0):
+        _jobs = JudgeJobQueue(
+            app,
+            workers=_env("SQL_JUDGE_ASYNC_WORKERS", 4),
+            max_pending=_env("SQL_JUDGE_ASYNC_MAX_PENDING", 256),
+            ttl=_env("SQL_JUDGE_ASYNC_RESULT_TTL", 600),
+        )
+    return _jobs
+
+
+def get_judge_jobs():
+    """
+    Return the process wide job queue or None when judging is synchronous
+    """
+    return _jobs
@@ -0,0 +1,331 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from CTFd.cache import cache
+
+# Comments, quoted strings and identifiers are kept verbatim when normalizing
+# a query. They're matched together so that whichever starts first wins, e.g.
+# a quote inside a comment doesn't start a string.
+QUOTED_PATTERN = re.compile(
+    r"""(--[^\n]*|#[^\n]*|/\*.*?\*/|'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""",
+    re.DOTALL,
+)
+# Left outside of the verbatim parts when a string or comment isn't closed
+UNCLOSED_PATTERN = re.compile(r"""['"`]|/\*""")
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+class JudgeBusy(Exception):
+    pass
+
+
+class JudgeServerError(Exception):
+    def __init__(self, status_code):
+        super(JudgeServerError, self).__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def normalize_query(query):
+    """
+    Collapse whitespace and drop trailing semicolons outside of quoted strings
+    so that trivially different copies of a query share a judge result
+    """
+    parts = QUOTED_PATTERN.split(query.strip())
+    if any(UNCLOSED_PATTERN.search(part) for part in parts[::2]):
+        # Where the unclosed text ends is up to the server so keep it all
+        return query
+    for i in range(0, len(parts), 2):
+        # Line breaks are kept since they end "--" and "#" comments
+        part = re.sub(r"\s*\n\s*", "\n", parts[i])
+        parts[i] = re.sub(r"[^\S\n]+", " ", part)
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+class JudgeAdmission(object):
+    """
+    Bounds the number of judgings a worker runs concurrently. Callers beyond
+    `max_in_flight` wait in a queue of at most `max_queued` entries for up to
+    `queue_timeout` seconds. Anything beyond that is rejected with JudgeBusy
+    so that a burst of submissions can not make every request slow.
+    """
+
+    def __init__(self, max_in_flight=8, max_queued=32, queue_timeout=10):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.semaphore = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if not self.semaphore.acquire(blocking=False):
+            with self.lock:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise JudgeBusy
+                self.queued += 1
+            try:
+                acquired = self.semaphore.acquire(timeout=self.queue_timeout)
+            finally:
+                with self.lock:
+                    self.queued -= 1
+            if not acquired:
+                with self.lock:
+                    self.rejected += 1
+                raise JudgeBusy
+
+        with self.lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.semaphore.release()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued,
+            }
+
+
+class _Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class JudgeMemo(object):
+    """
+    Shares judge results between identical submissions. Concurrent callers
+    with the same key in this worker wait for a single judge call and its
+    result is kept in the cache for `ttl` seconds so that resubmissions from
+    any worker are answered without judging again. Errors are never cached.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def run(self, key, func):
+        if self.ttl > 0:
+            value = cache.get(key)
+            if value is not None:
+                with self.lock:
+                    self.hits += 1
+                return value
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = func()
+            if self.ttl > 0:
+                cache.set(key, flight.value, timeout=self.ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.flights),
+                "ttl": self.ttl,
+            }
+
+
+class JudgeMetrics(object):
+    """
+    Per-process latency and error counters for requests to the SQL judge server
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, path, elapsed, error=False):
+        with self.lock:
+            stats = self.endpoints.setdefault(
+                path,
+                {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            )
+            stats["count"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            if error:
+                stats["errors"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            data = {}
+            for path, stats in self.endpoints.items():
+                data[path] = dict(stats)
+                data[path]["avg_seconds"] = (
+                    stats["total_seconds"] / stats["count"] if stats["count"] else 0.0
+                )
+            return data
+
+
+class JudgeClient(object):
+    """
+    HTTP client for the SQL judge server that keeps connections alive in a
+    pool and retries requests with exponential backoff when the connection
+    to the judge cannot be established.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        pool_size=20,
+        connect_timeout=3,
+        read_timeout=10,
+        retries=2,
+        backoff_factor=0.1,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = JudgeMetrics()
+
+        # Only connection errors are retried. Judging is not idempotent from
+        # the judge's point of view (it burns CPU), so read timeouts and error
+        # responses are surfaced to the caller immediately.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, payload, timeout=None):
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                self.base_url + path, json=payload, timeout=timeout or self.timeout
+            )
+        except requests.RequestException:
+            self.metrics.record(path, time.monotonic() - start, error=True)
+            raise
+        self.metrics.record(
+            path, time.monotonic() - start, error=response.status_code != 200
+        )
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_admission = None
+_memo = None
+_client_lock = threading.Lock()
+
+
+def get_judge_client():
+    """
+    Return the process wide judge client, creating it from the environment on first use
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = JudgeClient(
+                    base_url=os.environ.get(
+                        "SQL_JUDGE_SERVER_URL", "http://localhost:8080"
+                    ),
+                    pool_size=_env("SQL_JUDGE_POOL_SIZE", 20),
+                    connect_timeout=_env("SQL_JUDGE_CONNECT_TIMEOUT", 3, float),
+                    read_timeout=_env("SQL_JUDGE_READ_TIMEOUT", 10, float),
+                    retries=_env("SQL_JUDGE_RETRIES", 2),
+                    backoff_factor=_env("SQL_JUDGE_RETRY_BACKOFF", 0.1, float),
+                )
+    return _client
+
+
+def get_judge_admission():
+    """
+    Return the process wide admission controller for judge requests
+    """
+    global _admission
+    if _admission is None:
+        with _client_lock:
+            if _admission is None:
+                _admission = JudgeAdmission(
+                    max_in_flight=_env("SQL_JUDGE_MAX_IN_FLIGHT", 8),
+                    max_queued=_env("SQL_JUDGE_MAX_QUEUED", 32),
+                    queue_timeout=_env("SQL_JUDGE_QUEUE_TIMEOUT", 10, float),
+                )
+    return _admission
+
+
+def get_judge_memo():
+    """
+    Return the process wide memo of recent judge results
+    """
+    global _memo
+    if _memo is None:
+        with _client_lock:
+            if _memo is None:
+                _memo = JudgeMemo(ttl=_env("SQL_JUDGE_MEMO_TTL", 30))
+    return _memo
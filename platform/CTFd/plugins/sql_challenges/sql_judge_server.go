@@ -2,12 +2,17 @@ package main
 
 import (
 	"context"
+	"crypto/sha256"
+	"encoding/hex"
 	"encoding/json"
 	"fmt"
 	"log"
 	"net/http"
+	"os"
 	"regexp"
+	"strconv"
 	"strings"
+	"sync"
 	"time"
 
 	sqle "github.com/dolthub/go-mysql-server"
@@ -22,6 +27,9 @@ type QueryRequest struct {
 	ClientIP      string `json:"client_ip,omitempty"`
 	UserID        string `json:"user_id,omitempty"`
 	ChallengeID   string `json:"challenge_id,omitempty"`
+	// ExpectedResult is the cached result of SolutionQuery. When present the
+	// solution query is not executed again.
+	ExpectedResult *QueryResult `json:"expected_result,omitempty"`
 }
 
 type QueryResponse struct {
@@ -32,6 +40,12 @@ type QueryResponse struct {
 	Error          string      `json:"error,omitempty"`
 }
 
+type ExecuteResponse struct {
+	Success bool        `json:"success"`
+	Result  QueryResult `json:"result"`
+	Error   string      `json:"error,omitempty"`
+}
+
 type QueryResult struct {
 	Columns  []string   `json:"columns"`
 	Rows     [][]string `json:"rows"`
@@ -208,12 +222,233 @@ func cleanupSQLStatement(stmt string) string {
 	return stmt
 }
 
-func executeQuery(initQueries []string, query string, req *QueryRequest) (*QueryResult, error) {
-	// Security: Validate the user query before execution
-	if err := validateSQLQuery(query, req); err != nil {
+// schemaSnapshot is a fully initialized challenge database captured once per
+// (challenge, init_query hash). Judging runs are seeded from it by recreating
+// the captured tables and bulk-loading their rows, which skips parsing and
+// planning the whole init script for every query.
+type schemaSnapshot struct {
+	ddl    []string
+	tables []string
+	rows   map[string][]sql.Row
+}
+
+type snapshotEntry struct {
+	hash     string
+	ready    chan struct{}
+	snapshot *schemaSnapshot
+	err      error
+	lastUsed time.Time
+}
+
+// snapshotStore keeps one snapshot per challenge (or per init_query hash for
+// requests without a challenge ID) and evicts the least recently used ones.
+type snapshotStore struct {
+	mu         sync.Mutex
+	entries    map[string]*snapshotEntry
+	maxEntries int
+}
+
+// Views, triggers, stored routines and temporary tables are not captured by
+// SHOW CREATE TABLE, so init scripts defining them are always replayed
+var unsnapshottablePattern = regexp.MustCompile(`(?i)\b(VIEW|TRIGGER|PROCEDURE|FUNCTION|EVENT|TEMPORARY)\b`)
+
+const (
+	queryTimeout         = 5 * time.Second
+	snapshotBuildTimeout = 30 * time.Second
+)
+
+var snapshots = newSnapshotStore(envInt("SQL_JUDGE_SNAPSHOT_CACHE_SIZE", 128))
+
+func envInt(name string, fallback int) int {
+	if value, err := strconv.Atoi(os.Getenv(name)); err == nil {
+		return value
+	}
+	return fallback
+}
+
+func newSnapshotStore(maxEntries int) *snapshotStore {
+	return &snapshotStore{
+		entries:    make(map[string]*snapshotEntry),
+		maxEntries: maxEntries,
+	}
+}
+
+func hashInitQueries(initQueries []string) string {
+	sum := sha256.Sum256([]byte(strings.Join(initQueries, ";\n")))
+	return hex.EncodeToString(sum[:])
+}
+
+// get returns the snapshot for the given init queries, building it on first
+// use. Concurrent callers for the same key wait for a single build. A nil
+// result means the caller has to replay the init queries itself.
+func (s *snapshotStore) get(initQueries []string, req *QueryRequest) *schemaSnapshot {
+	if s.maxEntries <= 0 {
+		return nil
+	}
+	initQuery := strings.Join(initQueries, ";\n")
+	if strings.TrimSpace(initQuery) == "" || unsnapshottablePattern.MatchString(initQuery) {
+		return nil
+	}
+
+	hash := hashInitQueries(initQueries)
+	key := "hash:" + hash
+	if req != nil && req.ChallengeID != "" {
+		key = "challenge:" + req.ChallengeID
+	}
+
+	s.mu.Lock()
+	entry, ok := s.entries[key]
+	if !ok || entry.hash != hash {
+		// A changed init_query for the same challenge replaces the stale snapshot
+		entry = &snapshotEntry{hash: hash, ready: make(chan struct{}), lastUsed: time.Now()}
+		s.entries[key] = entry
+		s.evictLocked()
+		s.mu.Unlock()
+
+		entry.snapshot, entry.err = buildSnapshot(initQueries, req)
+		if entry.err != nil {
+			log.Printf("Snapshot build failed for %s, init query will be replayed: %v", key, entry.err)
+		} else {
+			log.Printf("Snapshot built for %s (%d tables)", key, len(entry.snapshot.tables))
+		}
+		close(entry.ready)
+	} else {
+		entry.lastUsed = time.Now()
+		s.mu.Unlock()
+		<-entry.ready
+	}
+
+	if entry.err != nil {
+		return nil
+	}
+	return entry.snapshot
+}
+
+func (s *snapshotStore) invalidate(challengeID string) {
+	s.mu.Lock()
+	defer s.mu.Unlock()
+	delete(s.entries, "challenge:"+challengeID)
+}
+
+func (s *snapshotStore) evictLocked() {
+	for len(s.entries) > s.maxEntries {
+		var oldestKey string
+		var oldest time.Time
+		for key, entry := range s.entries {
+			if oldestKey == "" || entry.lastUsed.Before(oldest) {
+				oldestKey, oldest = key, entry.lastUsed
+			}
+		}
+		delete(s.entries, oldestKey)
+	}
+}
+
+func quoteIdentifier(name string) string {
+	return "`" + strings.ReplaceAll(name, "`", "``") + "`"
+}
+
+func queryRows(engine *sqle.Engine, ctx *sql.Context, query string) ([]sql.Row, error) {
+	_, iter, err := engine.Query(ctx, query)
+	if err != nil {
 		return nil, err
 	}
-	
+	return sql.RowIterToRows(ctx, iter)
+}
+
+// buildSnapshot executes the init queries once and captures the resulting
+// table definitions and rows
+func buildSnapshot(initQueries []string, req *QueryRequest) (*schemaSnapshot, error) {
+	engine, db, ctx, cancel := newJudgeContext(snapshotBuildTimeout)
+	defer cancel()
+
+	if err := runInitQueries(engine, ctx, initQueries, req); err != nil {
+		return nil, err
+	}
+
+	tables, err := db.GetTableNames(ctx)
+	if err != nil {
+		return nil, err
+	}
+
+	snapshot := &schemaSnapshot{
+		tables: tables,
+		rows:   make(map[string][]sql.Row, len(tables)),
+	}
+	for _, name := range tables {
+		rows, err := queryRows(engine, ctx, "SHOW CREATE TABLE "+quoteIdentifier(name))
+		if err != nil {
+			return nil, err
+		}
+		if len(rows) != 1 || len(rows[0]) < 2 {
+			return nil, fmt.Errorf("unexpected SHOW CREATE TABLE result for %s", name)
+		}
+		ddl, ok := rows[0][1].(string)
+		if !ok {
+			return nil, fmt.Errorf("unexpected SHOW CREATE TABLE result for %s", name)
+		}
+		snapshot.ddl = append(snapshot.ddl, ddl)
+
+		data, err := queryRows(engine, ctx, "SELECT * FROM "+quoteIdentifier(name))
+		if err != nil {
+			return nil, err
+		}
+		snapshot.rows[name] = data
+	}
+	return snapshot, nil
+}
+
+// restore recreates the snapshot tables in an empty database and inserts the
+// captured rows directly through the table inserters
+func (s *schemaSnapshot) restore(engine *sqle.Engine, db *memory.Database, ctx *sql.Context) error {
+	// Tables are recreated in name order, so foreign keys may reference tables
+	// that do not exist yet
+	if _, err := queryRows(engine, ctx, "SET FOREIGN_KEY_CHECKS = 0"); err != nil {
+		return err
+	}
+	for _, ddl := range s.ddl {
+		if _, err := queryRows(engine, ctx, ddl); err != nil {
+			return fmt.Errorf("snapshot ddl error: %v", err)
+		}
+	}
+
+	for _, name := range s.tables {
+		table, ok, err := db.GetTableInsensitive(ctx, name)
+		if err != nil {
+			return err
+		}
+		if !ok {
+			return fmt.Errorf("snapshot table %s was not recreated", name)
+		}
+		insertable, ok := table.(sql.InsertableTable)
+		if !ok {
+			return fmt.Errorf("snapshot table %s is not insertable", name)
+		}
+
+		inserter := insertable.Inserter(ctx)
+		inserter.StatementBegin(ctx)
+		for _, row := range s.rows[name] {
+			if err := inserter.Insert(ctx, row.Copy()); err != nil {
+				inserter.DiscardChanges(ctx, err)
+				inserter.Close(ctx)
+				return err
+			}
+		}
+		if err := inserter.StatementComplete(ctx); err != nil {
+			inserter.Close(ctx)
+			return err
+		}
+		if err := inserter.Close(ctx); err != nil {
+			return err
+		}
+	}
+
+	_, err := queryRows(engine, ctx, "SET FOREIGN_KEY_CHECKS = 1")
+	return err
+}
+
+// newJudgeContext creates an empty in-memory database and a session bound to
+// it that expires after the given timeout
+func newJudgeContext(timeout time.Duration) (*sqle.Engine, *memory.Database, *sql.Context, context.CancelFunc) {
 	dbName := "ctfd_sql_challenge"
 	db := memory.NewDatabase(dbName)
 	db.EnablePrimaryKeyIndexes()  // Enable primary key indexes
@@ -233,11 +468,14 @@ func executeQuery(initQueries []string, query string, req *QueryRequest) (*Query
 	session.SetSessionVariable(ctx, "collation_database", "utf8mb4_unicode_ci")
 
 	// Set timeout for query execution
-	timeoutCtx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
-	defer cancel()
+	timeoutCtx, cancel := context.WithTimeout(context.Background(), timeout)
 	ctx = sql.NewContext(timeoutCtx, sql.WithSession(session))
 	ctx.SetCurrentDatabase(dbName)
-	
+
+	return engine, db, ctx, cancel
+}
+
+func runInitQueries(engine *sqle.Engine, ctx *sql.Context, initQueries []string, req *QueryRequest) error {
 	// Execute initialization queries
 	for _, initQuery := range initQueries {
 		if strings.TrimSpace(initQuery) == "" {
@@ -250,7 +488,7 @@ func executeQuery(initQueries []string, query string, req *QueryRequest) (*Query
 			// For init queries, we might want to be slightly more permissive
 			// but still block file operations
 			if strings.Contains(err.Error(), "file") || strings.Contains(err.Error(), "system") {
-				return nil, fmt.Errorf("security violation in init query: %v", err)
+				return fmt.Errorf("security violation in init query: %v", err)
 			}
 		}
 
@@ -275,18 +513,45 @@ func executeQuery(initQueries []string, query string, req *QueryRequest) (*Query
 			if err != nil {
 				log.Printf("Failed to execute: %s", stmt)
 				log.Printf("Original was: %s", originalStmt)
-				return nil, fmt.Errorf("init query error: %v", err)
+				return fmt.Errorf("init query error: %v", err)
 			}
 
 			// Consume the iterator
 			if iter != nil {
 				_, err = sql.RowIterToRows(ctx, iter)
 				if err != nil {
-					return nil, fmt.Errorf("init query iteration error: %v", err)
+					return fmt.Errorf("init query iteration error: %v", err)
 				}
 			}
 		}
 	}
+	return nil
+}
+
+func executeQuery(initQueries []string, query string, req *QueryRequest) (*QueryResult, error) {
+	// Security: Validate the user query before execution
+	if err := validateSQLQuery(query, req); err != nil {
+		return nil, err
+	}
+
+	snapshot := snapshots.get(initQueries, req)
+
+	engine, db, ctx, cancel := newJudgeContext(queryTimeout)
+	defer func() { cancel() }()
+
+	if snapshot != nil {
+		if err := snapshot.restore(engine, db, ctx); err != nil {
+			log.Printf("Snapshot restore failed, replaying init query: %v", err)
+			snapshot = nil
+			cancel()
+			engine, db, ctx, cancel = newJudgeContext(queryTimeout)
+		}
+	}
+	if snapshot == nil {
+		if err := runInitQueries(engine, ctx, initQueries, req); err != nil {
+			return nil, err
+		}
+	}
 
 	// Execute the main query
 	schema, iter, err := engine.Query(ctx, query)
@@ -347,16 +612,20 @@ func handleJudge(w http.ResponseWriter, r *http.Request) {
 	// Prepare init queries
 	initQueries := []string{req.InitQuery}
 
-	// Execute expected result
-	expectedResult, err := executeQuery(initQueries, req.SolutionQuery, &req)
-	if err != nil {
-		resp := QueryResponse{
-			Success: false,
-			Error:   fmt.Sprintf("Failed to execute solution query: %v", err),
+	// Execute expected result unless the caller already has it cached
+	expectedResult := req.ExpectedResult
+	if expectedResult == nil {
+		var err error
+		expectedResult, err = executeQuery(initQueries, req.SolutionQuery, &req)
+		if err != nil {
+			resp := QueryResponse{
+				Success: false,
+				Error:   fmt.Sprintf("Failed to execute solution query: %v", err),
+			}
+			w.Header().Set("Content-Type", "application/json")
+			json.NewEncoder(w).Encode(resp)
+			return
 		}
-		w.Header().Set("Content-Type", "application/json")
-		json.NewEncoder(w).Encode(resp)
-		return
 	}
 
 	// Execute user query
@@ -385,6 +654,35 @@ func handleJudge(w http.ResponseWriter, r *http.Request) {
 	json.NewEncoder(w).Encode(resp)
 }
 
+// handleExecute runs a single query against the initialized database. It is
+// used for previews, admin test queries and computing expected results.
+func handleExecute(w http.ResponseWriter, r *http.Request) {
+	if r.Method != http.MethodPost {
+		http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
+		return
+	}
+
+	var req QueryRequest
+	if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
+		http.Error(w, "Invalid request body", http.StatusBadRequest)
+		return
+	}
+
+	logSecurityEvent("REQUEST", "Query execution for challenge", &req)
+
+	var resp ExecuteResponse
+	result, err := executeQuery([]string{req.InitQuery}, req.UserQuery, &req)
+	if err != nil {
+		resp.Error = fmt.Sprintf("Failed to execute query: %v", err)
+	} else {
+		resp.Success = true
+		resp.Result = *result
+	}
+
+	w.Header().Set("Content-Type", "application/json")
+	json.NewEncoder(w).Encode(resp)
+}
+
 func compareResults(expected, actual *QueryResult) bool {
 	// Compare row count
 	if expected.RowCount != actual.RowCount {
@@ -415,6 +713,24 @@ func compareResults(expected, actual *QueryResult) bool {
 	return true
 }
 
+// handleSnapshotInvalidate drops the cached snapshot of a challenge, e.g. after
+// its init_query was edited
+func handleSnapshotInvalidate(w http.ResponseWriter, r *http.Request) {
+	if r.Method != http.MethodPost {
+		http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
+		return
+	}
+
+	var req QueryRequest
+	if err := json.NewDecoder(r.Body).Decode(&req); err != nil || req.ChallengeID == "" {
+		http.Error(w, "Invalid request body", http.StatusBadRequest)
+		return
+	}
+
+	snapshots.invalidate(req.ChallengeID)
+	w.WriteHeader(http.StatusNoContent)
+}
+
 func handleHealth(w http.ResponseWriter, r *http.Request) {
 	w.WriteHeader(http.StatusOK)
 	w.Write([]byte("OK"))
@@ -422,6 +738,8 @@ func handleHealth(w http.ResponseWriter, r *http.Request) {
 
 func main() {
 	http.HandleFunc("/judge", handleJudge)
+	http.HandleFunc("/execute", handleExecute)
+	http.HandleFunc("/snapshots/invalidate", handleSnapshotInvalidate)
 	http.HandleFunc("/health", handleHealth)
 
 	port := "8080"
@@ -1,9 +1,11 @@
 import json
 from enum import Enum
+from uuid import uuid4
 
 import cmarkgfm
 from cmarkgfm.cmark import Options
 from flask import current_app as app
+from flask import g, has_request_context
 
 # isort:imports-firstparty
 from CTFd.cache import cache
@@ -41,27 +43,72 @@ def get_asset_json(path):
     return _get_asset_json(path)
 
 
-@cache.memoize()
-def _get_config(key):
-    config = db.session.execute(
-        Configs.__table__.select().where(Configs.key == key)
-    ).fetchone()
-    if config and config.value:
-        value = config.value
-        if value and value.isdigit():
+# Every config is kept in each process and reloaded once another process
+# changes one, which it announces by changing the generation in the cache
+CONFIG_GENERATION_KEY = "config:generation"
+
+
+def _parse_config(value):
+    if value:
+        if value.isdigit():
             return int(value)
-        elif value and isinstance(value, string_types):
+        elif isinstance(value, string_types):
             if value.lower() == "true":
                 return True
             elif value.lower() == "false":
                 return False
             else:
                 return value
-    # Flask-Caching is unable to roundtrip a value of None.
-    # Return an exception so that we can still cache and avoid the db hit
+    # Return an exception so that missing and empty configs can be told apart
+    # from configs set to None
     return KeyError
 
 
+def _get_config(key):
+    """
+    Read a config from the database, bypassing the cached configs
+    """
+    config = db.session.execute(
+        Configs.__table__.select().where(Configs.key == key)
+    ).fetchone()
+    return _parse_config(config.value if config else None)
+
+
+def get_config_generation():
+    generation = cache.get(CONFIG_GENERATION_KEY)
+    if generation is None:
+        # The generation was never set or was evicted so start a new one
+        cache.add(CONFIG_GENERATION_KEY, uuid4().hex, timeout=0)
+        generation = cache.get(CONFIG_GENERATION_KEY)
+    return generation
+
+
+def bump_config_generation():
+    """
+    Make every process reload its configs
+    """
+    cache.set(CONFIG_GENERATION_KEY, uuid4().hex, timeout=0)
+    app.extensions.pop("configs", None)
+
+
+def get_configs():
+    """
+    Get every config as a dict. The generation is checked once per app context
+    (i.e. request) and all configs are loaded in one query when it changed.
+    """
+    generation, configs = app.extensions.get("configs", (None, None))
+    if configs is not None and g.get("config_generation") == generation:
+        return configs
+
+    latest = get_config_generation()
+    if configs is None or generation != latest:
+        rows = db.session.query(Configs.key, Configs.value)
+        configs = {key: _parse_config(value) for key, value in rows}
+        app.extensions["configs"] = (latest, configs)
+    g.config_generation = latest
+    return configs
+
+
 def get_config(key, default=None):
     # Look up the config in the local PRESET_CONFIGS store first
     preset_configs = app.config.get("PRESET_CONFIGS")
@@ -72,7 +119,11 @@ def get_config(key, default=None):
     if isinstance(key, Enum):
         key = str(key)
 
-    value = _get_config(key)
+    configs = get_configs()
+    value = configs.get(key)
+    if value is None:
+        # Configs added since the configs were loaded (or that don't exist)
+        value = configs[key] = _get_config(key)
     if value is KeyError:
         # These defaults are used in situations where setup was skipped or partially completed
         if default is None and key in DEFAULTS:
@@ -95,13 +146,20 @@ def set_config(key, value):
     if isinstance(key, Enum):
         key = str(key)
 
-    cache.delete_memoized(_get_config, key)
+    bump_config_generation()
     return config
 
 
 def import_in_progress():
-    import_status = cache.get(key="import_status")
-    import_error = cache.get(key="import_error")
+    if has_request_context():
+        from CTFd.utils.user import get_identity
+
+        return get_identity().import_in_progress
+    return get_import_in_progress()
+
+
+def get_import_in_progress():
+    import_status, import_error = cache.get_many("import_status", "import_error")
     if import_error:
         return False
     elif import_status:
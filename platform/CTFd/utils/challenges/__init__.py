@@ -4,7 +4,7 @@ from collections import namedtuple
 from sqlalchemy import func as sa_func
 from sqlalchemy.sql import and_, false, true
 
-from CTFd.cache import cache
+from CTFd.cache import cache, local_memoize, namespaced, stale_memoize
 from CTFd.models import Challenges, Ratings, Solves, Submissions, Users, db
 from CTFd.schemas.submissions import SubmissionSchema
 from CTFd.schemas.tags import TagSchema
@@ -20,7 +20,9 @@ Challenge = namedtuple(
 Rating = namedtuple("Rating", ["average", "count"])
 
 
-@cache.memoize(timeout=60)
+@local_memoize()
+@namespaced("challenges")
+@stale_memoize(timeout=60)
 def get_all_challenges(admin=False, field=None, q=None, **query_args):
     filters = build_model_filters(model=Challenges, query=q, field=field)
     chal_q = Challenges.query
@@ -51,6 +53,7 @@ def get_all_challenges(admin=False, field=None, q=None, **query_args):
     return results
 
 
+@namespaced("challenges")
 @cache.memoize(timeout=60)
 def get_solves_for_challenge_id(challenge_id, freeze=False):
     Model = get_model()
@@ -89,6 +92,7 @@ def get_solves_for_challenge_id(challenge_id, freeze=False):
     return results
 
 
+@namespaced("challenges")
 @cache.memoize(timeout=60)
 def get_submissions_for_user_id_for_challenge_id(user_id, challenge_id):
     user = Users.query.filter_by(id=user_id).first()
@@ -104,6 +108,8 @@ def get_submissions_for_user_id_for_challenge_id(user_id, challenge_id):
     return response
 
 
+@local_memoize()
+@namespaced("challenges")
 @cache.memoize(timeout=60)
 def get_solve_ids_for_user_id(user_id):
     user = Users.query.filter_by(id=user_id).first()
@@ -116,7 +122,8 @@ def get_solve_ids_for_user_id(user_id):
     return solve_ids
 
 
-@cache.memoize(timeout=60)
+@namespaced("challenges")
+@stale_memoize(timeout=60)
 def get_solve_counts_for_challenges(challenge_id=None, admin=False):
     if challenge_id is None:
         challenge_id_filter = ()
@@ -148,6 +155,7 @@ def get_solve_counts_for_challenges(challenge_id=None, admin=False):
     return solve_counts
 
 
+@namespaced("challenges")
 @cache.memoize(timeout=60)
 def get_rating_average_for_challenge_id(challenge_id):
     ratings = Ratings.query.filter_by(challenge_id=challenge_id).all()
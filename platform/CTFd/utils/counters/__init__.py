@@ -0,0 +1,273 @@
+import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from CTFd.cache import cache
+from CTFd.models import Fails, Teams, Users
+
+# Fail counters are sorted sets of fail IDs scored by the time of the fail. A
+# sentinel member marks a counter that holds every fail of its account (and
+# challenge) so that a missing counter is loaded from the database instead
+# of being read as zero. A placeholder member is added before a counter is
+# loaded so that fails committed while the database is read are still added.
+SEED = "seed"
+LOADING = "loading"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Counters of whole accounts only answer how many fails were in the last
+# minute so they don't need to outlive it
+ACCOUNT_WINDOW = 60
+ACCOUNT_TIMEOUT = 2 * ACCOUNT_WINDOW
+CHALLENGE_TIMEOUT = 24 * 60 * 60
+
+# Only add to counters that have been or are being loaded. A counter that
+# doesn't exist yet will be loaded with this fail from the database. Fails
+# that fell out of the window of an account counter are dropped from it.
+ADD_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("zadd", KEYS[1], ARGV[1], ARGV[2])
+    redis.call("expire", KEYS[1], ARGV[3])
+    if ARGV[4] ~= "" then
+        redis.call("zremrangebyscore", KEYS[1], "(0", ARGV[4])
+    end
+end
+"""
+
+
+def to_score(date):
+    return (date - EPOCH).total_seconds()
+
+
+def from_score(score):
+    return EPOCH + datetime.timedelta(seconds=score)
+
+
+class FailCounters(object):
+    """
+    Sliding window counters of Fails per account and per account and challenge
+    kept in Redis. Both user and team accounts are counted so that switching
+    the user mode doesn't need the counters to be rebuilt.
+    """
+
+    def __init__(self, client, prefix=""):
+        self.client = client
+        self.prefix = prefix + "fails:"
+        self.add_script = client.register_script(ADD_SCRIPT)
+
+    def key(self, mode, account_id, challenge_id=None):
+        key = "{prefix}{mode}:{account_id}".format(
+            prefix=self.prefix, mode=mode, account_id=account_id
+        )
+        if challenge_id is not None:
+            key += ":{challenge_id}".format(challenge_id=challenge_id)
+        return key
+
+    def add(self, fails):
+        """
+        Add fails given as (id, date, user_id, team_id, challenge_id) tuples
+        """
+        cutoff = to_score(
+            datetime.datetime.utcnow() - datetime.timedelta(seconds=ACCOUNT_WINDOW)
+        )
+        pipe = self.client.pipeline(transaction=False)
+        for fail_id, date, user_id, team_id, challenge_id in fails:
+            for mode, account_id in (("users", user_id), ("teams", team_id)):
+                if account_id is None:
+                    continue
+                self.add_script(
+                    keys=[self.key(mode, account_id)],
+                    args=[to_score(date), fail_id, ACCOUNT_TIMEOUT, cutoff],
+                    client=pipe,
+                )
+                self.add_script(
+                    keys=[self.key(mode, account_id, challenge_id)],
+                    args=[to_score(date), fail_id, CHALLENGE_TIMEOUT, ""],
+                    client=pipe,
+                )
+        pipe.execute()
+
+    def load(self, key, query, timeout):
+        # The placeholder has to exist before the database is read so that
+        # fails committed after the read are added to the counter
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {LOADING: 0}, nx=True)
+        pipe.expire(key, timeout)
+        pipe.execute()
+
+        members = {SEED: 0}
+        for fail_id, date in query.with_entities(Fails.id, Fails.date):
+            members[str(fail_id)] = to_score(date)
+        # Merged with the fails added since the placeholder was set
+        pipe = self.client.pipeline()
+        pipe.zadd(key, members)
+        pipe.zrem(key, LOADING)
+        pipe.expire(key, timeout)
+        pipe.execute()
+
+    def window(self, key, query, timeout, since=None):
+        """
+        Count the fails in a counter since a time (or ever) and get the date of
+        the earliest of them, loading the counter from `query` if needed
+        """
+        low = "(0" if since is None else to_score(since)
+        for _ in range(2):
+            pipe = self.client.pipeline()
+            pipe.zscore(key, SEED)
+            pipe.zcount(key, low, "+inf")
+            pipe.zrangebyscore(key, low, "+inf", start=0, num=1, withscores=True)
+            seeded, count, earliest = pipe.execute()
+            # Counters that are still being loaded don't hold every fail yet
+            if seeded is not None:
+                break
+            self.load(key, query, timeout)
+        if earliest:
+            return count, from_score(earliest[0][1])
+        return count, None
+
+    def clear(self, mode, account_id):
+        key = self.key(mode, account_id)
+        keys = [key] + list(self.client.scan_iter(match=key + ":*"))
+        self.client.delete(*keys)
+
+    def clear_all(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def get_fail_counters():
+    """
+    Get the Redis backed fail counters or None if Redis isn't used as the cache,
+    in which case fails are counted in the database.
+    """
+    if current_app.config.get("CACHE_TYPE") != "redis":
+        return None
+    counters = current_app.extensions.get("fail_counters")
+    if counters is None:
+        counters = FailCounters(
+            cache.cache._write_client, prefix=cache.cache.key_prefix or ""
+        )
+        current_app.extensions["fail_counters"] = counters
+    return counters
+
+
+def _account_filter(account_id):
+    from CTFd.utils import get_config
+
+    if get_config("user_mode") == "teams":
+        return "teams", Fails.team_id == account_id
+    return "users", Fails.user_id == account_id
+
+
+def count_account_fails(account_id, seconds=ACCOUNT_WINDOW):
+    """
+    Count the fails of an account in the last `seconds` seconds
+    """
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(seconds=seconds)
+    mode, account_filter = _account_filter(account_id)
+
+    counters = get_fail_counters()
+    if counters is None or seconds > ACCOUNT_WINDOW:
+        return Fails.query.filter(account_filter, Fails.date >= since).count()
+
+    window_start = now - datetime.timedelta(seconds=ACCOUNT_WINDOW)
+    query = Fails.query.filter(account_filter, Fails.date >= window_start)
+    count, _ = counters.window(
+        counters.key(mode, account_id), query, ACCOUNT_TIMEOUT, since=since
+    )
+    return count
+
+
+def get_challenge_fails(account_id, challenge_id, seconds=None):
+    """
+    Count the fails of an account on a challenge, optionally only those in the
+    last `seconds` seconds.
+
+    Returns the count and the date of the earliest counted fail.
+    """
+    since = None
+    if seconds is not None:
+        since = datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+    mode, account_filter = _account_filter(account_id)
+    query = Fails.query.filter(account_filter, Fails.challenge_id == challenge_id)
+
+    counters = get_fail_counters()
+    if counters is not None:
+        return counters.window(
+            counters.key(mode, account_id, challenge_id),
+            query,
+            CHALLENGE_TIMEOUT,
+            since=since,
+        )
+
+    if since is not None:
+        query = query.filter(Fails.date >= since)
+    count = query.count()
+    earliest = None
+    if count:
+        earliest = (
+            query.with_entities(Fails.date).order_by(Fails.date.asc()).limit(1).scalar()
+        )
+    return count, earliest
+
+
+def _pending(session):
+    return session.info.setdefault(
+        "fail_counters", {"add": [], "clear": set(), "clear_all": False}
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _track_fails(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Fails):
+            # The fail's attributes can't be loaded anymore once it's committed
+            _pending(session)["add"].append(
+                (obj.id, obj.date, obj.user_id, obj.team_id, obj.challenge_id)
+            )
+    for obj in session.deleted:
+        if isinstance(obj, Fails):
+            pending = _pending(session)
+            pending["clear"].add(("users", obj.user_id))
+            pending["clear"].add(("teams", obj.team_id))
+        elif isinstance(obj, Users):
+            # The database removes the user's fails along with it
+            pending = _pending(session)
+            pending["clear"].add(("users", obj.id))
+            pending["clear"].add(("teams", obj.team_id))
+        elif isinstance(obj, Teams):
+            _pending(session)["clear"].add(("teams", obj.id))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_fails(orm_execute_state):
+    if orm_execute_state.is_delete or orm_execute_state.is_update:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in ("submissions", "users", "teams"):
+            _pending(orm_execute_state.session)["clear_all"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _update_fail_counters(session):
+    pending = session.info.pop("fail_counters", None)
+    if pending is None or not has_app_context():
+        return
+    counters = get_fail_counters()
+    if counters is None:
+        return
+    if pending["clear_all"]:
+        counters.clear_all()
+        return
+    for mode, account_id in pending["clear"]:
+        if account_id is not None:
+            counters.clear(mode, account_id)
+    if pending["add"]:
+        counters.add(pending["add"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_fail_counters(session):
+    session.info.pop("fail_counters", None)
@@ -1,13 +1,20 @@
 import csv
+import io
 import json
+from collections import defaultdict
 from io import BytesIO, StringIO
 
+from flask import has_request_context, stream_with_context
+
 from CTFd.models import (
+    Brackets,
     Flags,
     Hints,
     Tags,
+    TeamFieldEntries,
     TeamFields,
     Teams,
+    UserFieldEntries,
     UserFields,
     Users,
     db,
@@ -17,8 +24,12 @@ from CTFd.plugins.challenges import get_chal_class
 from CTFd.schemas.challenges import ChallengeSchema
 from CTFd.schemas.teams import TeamSchema
 from CTFd.schemas.users import UserSchema
+from CTFd.utils import get_config
 from CTFd.utils.config import is_teams_mode, is_users_mode
-from CTFd.utils.scores import get_standings
+from CTFd.utils.config.visibility import scores_visible
+from CTFd.utils.dates import unix_time_to_utc
+from CTFd.utils.scores import CHUNK_SIZE, get_standings
+from CTFd.utils.scores.standings import get_aggregates
 
 
 def get_dumpable_tables():
@@ -39,12 +50,68 @@ def dump_csv(name):
         raise KeyError
 
 
-def dump_scoreboard_csv():
+class Echo(object):
+    """
+    A file that hands back what's written to it so that csv.writer returns lines
+    """
+
+    def write(self, value):
+        return value
+
+
+class CSVStream(io.RawIOBase):
+    """
+    A readable file over generated chunks of a CSV so that send_file streams
+    the CSV while it's generated
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        self.chunks.close()
+        super(CSVStream, self).close()
+
+
+def _field_values(Model, column, account_ids, field_ids):
+    entries = defaultdict(dict)
+    query = Model.query.with_entities(column, Model.field_id, Model.value).filter(
+        column.in_(account_ids)
+    )
+    for account_id, field_id, value in query:
+        entries[account_id][field_id] = value
+    return {
+        account_id: [values.get(f_id, "") for f_id in field_ids]
+        for account_id, values in entries.items()
+    }
+
+
+def iter_scoreboard_csv():
+    """
+    Generate the scoreboard CSV in encoded chunks. Accounts, their field
+    entries and the scores of team members are loaded in bulk for each chunk
+    of standings instead of with queries per row.
+    """
     # TODO: Add fields to scoreboard data
-    temp = StringIO()
-    writer = csv.writer(temp)
+    writer = csv.writer(Echo())
 
     standings = get_standings()
+    brackets = dict(Brackets.query.with_entities(Brackets.id, Brackets.name))
 
     # Get all user fields in a specific order
     user_fields = UserFields.query.all()
@@ -74,63 +141,94 @@ def dump_scoreboard_csv():
             + user_field_names
             + team_field_names
         )
-        writer.writerow(header)
-
-        for i, standing in enumerate(standings):
-            team = Teams.query.filter_by(id=standing.account_id).first()
-
-            # Build field entries using the order of the field values
-            team_field_entries = {f.field_id: f.value for f in team.field_entries}
-            team_field_values = [
-                team_field_entries.get(f_id, "") for f_id in team_field_ids
-            ]
-            user_field_values = len(user_field_names) * [""]
-            team_row = (
-                [
-                    i + 1,
-                    team.name,
-                    team.id,
-                    standing.score,
-                    "",
-                    "",
-                    "",
-                    "",
-                    team.bracket_id,
-                    team.bracket.name if team.bracket else "",
-                    "",
-                    "",
-                ]
-                + user_field_values
-                + team_field_values
+        yield writer.writerow(header).encode("utf-8")
+
+        # Member scores are only shown when scores are visible
+        show_scores = scores_visible()
+        freeze = get_config("freeze")
+        freeze = unix_time_to_utc(freeze) if freeze else None
+
+        for start in range(0, len(standings), CHUNK_SIZE):
+            chunk = standings[start : start + CHUNK_SIZE]
+            team_ids = [standing.account_id for standing in chunk]
+            teams = {
+                team.id: team
+                for team in Teams.query.with_entities(
+                    Teams.id, Teams.name, Teams.bracket_id
+                ).filter(Teams.id.in_(team_ids))
+            }
+            team_field_values = _field_values(
+                TeamFieldEntries, TeamFieldEntries.team_id, team_ids, team_field_ids
             )
 
-            writer.writerow(team_row)
-
-            for member in team.members:
-                user_field_entries = {f.field_id: f.value for f in member.field_entries}
-                user_field_values = [
-                    user_field_entries.get(f_id, "") for f_id in user_field_ids
-                ]
-                team_field_values = len(team_field_names) * [""]
-                user_row = (
+            members = defaultdict(list)
+            for member in (
+                Users.query.with_entities(
+                    Users.id, Users.name, Users.email, Users.bracket_id, Users.team_id
+                )
+                .filter(Users.team_id.in_(team_ids))
+                .order_by(Users.id)
+            ):
+                members[member.team_id].append(member)
+            member_ids = [m.id for team in members.values() for m in team]
+            user_field_values = _field_values(
+                UserFieldEntries, UserFieldEntries.user_id, member_ids, user_field_ids
+            )
+            member_scores = {}
+            if show_scores:
+                member_scores = {
+                    user_id: score
+                    for user_id, (score, _, _) in get_aggregates(
+                        "user_id", freeze=freeze, account_ids=member_ids
+                    ).items()
+                }
+
+            lines = []
+            for i, standing in enumerate(chunk, start=start):
+                team = teams.get(standing.account_id)
+                if team is None:
+                    continue
+                team_row = (
                     [
+                        i + 1,
+                        team.name,
+                        team.id,
+                        standing.score,
                         "",
                         "",
                         "",
                         "",
-                        member.name,
-                        member.id,
-                        member.email,
-                        member.score,
+                        team.bracket_id,
+                        brackets.get(team.bracket_id, ""),
                         "",
                         "",
-                        member.bracket_id,
-                        member.bracket.name if member.bracket else "",
                     ]
-                    + user_field_values
-                    + team_field_values
+                    + len(user_field_names) * [""]
+                    + team_field_values.get(team.id, len(team_field_ids) * [""])
                 )
-                writer.writerow(user_row)
+                lines.append(writer.writerow(team_row))
+
+                for member in members[team.id]:
+                    user_row = (
+                        [
+                            "",
+                            "",
+                            "",
+                            "",
+                            member.name,
+                            member.id,
+                            member.email,
+                            member_scores.get(member.id, 0) if show_scores else None,
+                            "",
+                            "",
+                            member.bracket_id,
+                            brackets.get(member.bracket_id, ""),
+                        ]
+                        + user_field_values.get(member.id, len(user_field_ids) * [""])
+                        + len(team_field_names) * [""]
+                    )
+                    lines.append(writer.writerow(user_row))
+            yield "".join(lines).encode("utf-8")
     elif is_users_mode():
         header = [
             "place",
@@ -141,34 +239,45 @@ def dump_scoreboard_csv():
             "user bracket id",
             "user bracket name",
         ] + user_field_names
-        writer.writerow(header)
-
-        for i, standing in enumerate(standings):
-            user = Users.query.filter_by(id=standing.account_id).first()
+        yield writer.writerow(header).encode("utf-8")
+
+        for start in range(0, len(standings), CHUNK_SIZE):
+            chunk = standings[start : start + CHUNK_SIZE]
+            user_ids = [standing.account_id for standing in chunk]
+            users = {
+                user.id: user
+                for user in Users.query.with_entities(
+                    Users.id, Users.name, Users.email, Users.bracket_id
+                ).filter(Users.id.in_(user_ids))
+            }
+            user_field_values = _field_values(
+                UserFieldEntries, UserFieldEntries.user_id, user_ids, user_field_ids
+            )
 
-            # Build field entries using the order of the field values
-            user_field_entries = {f.field_id: f.value for f in user.field_entries}
-            user_field_values = [
-                user_field_entries.get(f_id, "") for f_id in user_field_ids
-            ]
-            user_row = [
-                i + 1,
-                user.name,
-                user.id,
-                user.email,
-                standing.score,
-                user.bracket_id,
-                user.bracket.name if user.bracket else "",
-            ] + user_field_values
-            writer.writerow(user_row)
+            lines = []
+            for i, standing in enumerate(chunk, start=start):
+                user = users.get(standing.account_id)
+                if user is None:
+                    continue
+                user_row = [
+                    i + 1,
+                    user.name,
+                    user.id,
+                    user.email,
+                    standing.score,
+                    user.bracket_id,
+                    brackets.get(user.bracket_id, ""),
+                ] + user_field_values.get(user.id, len(user_field_ids) * [""])
+                lines.append(writer.writerow(user_row))
+            yield "".join(lines).encode("utf-8")
 
-    # In Python 3 send_file requires bytes
-    output = BytesIO()
-    output.write(temp.getvalue().encode("utf-8"))
-    output.seek(0)
-    temp.close()
 
-    return output
+def dump_scoreboard_csv():
+    chunks = iter_scoreboard_csv()
+    # Keep the request around while the response generates the CSV
+    if has_request_context():
+        chunks = stream_with_context(chunks)
+    return io.BufferedReader(CSVStream(chunks))
 
 
 def dump_users_with_fields_csv():
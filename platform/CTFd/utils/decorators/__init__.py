@@ -3,11 +3,11 @@ import functools
 from flask import abort, jsonify, redirect, request, url_for
 from flask_babel import gettext
 
-from CTFd.cache import cache
 from CTFd.utils import config, get_config
 from CTFd.utils import user as current_user
 from CTFd.utils.config import is_teams_mode
 from CTFd.utils.dates import ctf_ended, ctf_started, ctftime, view_after_ctf
+from CTFd.utils.ratelimit import FIXED_WINDOW, get_rate_limiter
 from CTFd.utils.user import authed, get_current_team, get_current_user, is_admin
 
 
@@ -165,18 +165,17 @@ def require_team(f):
     return require_team_wrapper
 
 
-def ratelimit(method="POST", limit=50, interval=300, key_prefix="rl"):
+def ratelimit(
+    method="POST", limit=50, interval=300, key_prefix="rl", algorithm=FIXED_WINDOW
+):
     def ratelimit_decorator(f):
         @functools.wraps(f)
         def ratelimit_function(*args, **kwargs):
-            ip_address = current_user.get_ip()
-            key = "{}:{}:{}".format(key_prefix, ip_address, request.endpoint)
-            current = cache.get(key)
-
             if request.method == method:
-                if (
-                    current and int(current) > limit - 1
-                ):  # -1 in order to align expected limit with the real value
+                ip_address = current_user.get_ip()
+                key = "{}:{}:{}".format(key_prefix, ip_address, request.endpoint)
+                limiter = get_rate_limiter()
+                if limiter.hit(key, limit, interval, algorithm=algorithm) is False:
                     resp = jsonify(
                         {
                             "code": 429,
@@ -186,11 +185,6 @@ def ratelimit(method="POST", limit=50, interval=300, key_prefix="rl"):
                     )
                     resp.status_code = 429
                     return resp
-                else:
-                    if current is None:
-                        cache.set(key, 1, timeout=interval)
-                    else:
-                        cache.set(key, int(current) + 1, timeout=interval)
             return f(*args, **kwargs)
 
         return ratelimit_function
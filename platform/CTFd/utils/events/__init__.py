@@ -1,13 +1,44 @@
+import itertools
 import json
+import logging
+import os
+import threading
+import time
 from collections import defaultdict
-from queue import Queue
 
-from gevent import Timeout, spawn
+from gevent import spawn
 from tenacity import retry, wait_exponential
 
 from CTFd.cache import cache
 from CTFd.utils import string_types
 
+# Events kept in each worker's buffer for subscribers to catch up on
+BUFFER_SIZE = 1024
+# Events kept in the Redis Stream to replay to clients that were away longer
+# than a worker's buffer covers
+STREAM_SIZE = 10000
+# Idle connections are sent a ping this often so that proxies keep them open
+# and closed connections are noticed
+KEEPALIVE_INTERVAL = 5
+
+
+def parse_event_id(event_id):
+    """
+    Event IDs look like Redis Stream IDs (`<milliseconds>-<sequence>`) so that
+    they can be compared whichever manager assigned them
+    """
+    try:
+        milliseconds, sequence = event_id.split("-")
+        return int(milliseconds), int(sequence)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
 
 class ServerSentEvent(object):
     def __init__(self, data, type=None, id=None):
@@ -36,81 +67,367 @@ class ServerSentEvent(object):
         return d
 
 
+class EventBuffer(object):
+    """
+    A bounded ring buffer of the latest events of a channel. It is shared by
+    every subscriber of the channel, who only keep the position of the next
+    event they'll read. A slow subscriber can't make it grow and skips the
+    events that were overwritten before it read them.
+    """
+
+    def __init__(self, size=BUFFER_SIZE, complete=True):
+        self.size = size
+        self.slots = [None] * size
+        self.position = 0
+        # Whether the buffer started with the first event of the channel, so
+        # that nothing is missing from it until it overwrites events
+        self.complete = complete
+        # The ID of the latest event that was overwritten
+        self.dropped = None
+        self.lock = threading.Lock()
+
+    def append(self, event_id, message, user_id=None, team_id=None):
+        with self.lock:
+            if self.position >= self.size:
+                self.dropped = self.slots[self.position % self.size][0]
+            self.slots[self.position % self.size] = (
+                event_id,
+                message,
+                user_id,
+                team_id,
+            )
+            self.position += 1
+
+    def read(self, cursor):
+        """
+        Get the buffered events from `cursor` on and the cursor to read from next
+        """
+        with self.lock:
+            position = self.position
+            cursor = max(cursor, position - self.size)
+            events = [self.slots[i % self.size] for i in range(cursor, position)]
+        return events, position
+
+    def seek(self, event_id=None):
+        """
+        Get the cursor of the first event after `event_id` and whether events
+        between them may be missing from the buffer. Without an event ID only
+        new events will be read.
+        """
+        last = parse_event_id(event_id)
+        with self.lock:
+            position = self.position
+            start = max(0, position - self.size)
+            if last is None:
+                return position, False
+            for cursor in range(start, position):
+                if parse_event_id(self.slots[cursor % self.size][0]) > last:
+                    # Events before the oldest buffered one are only missing
+                    # if ones after `event_id` were overwritten or if they
+                    # were never buffered
+                    if cursor != start:
+                        return cursor, False
+                    if self.dropped is not None:
+                        return cursor, parse_event_id(self.dropped) > last
+                    return cursor, not self.complete
+        return position, False
+
+
+class Subscriber(object):
+    def __init__(self, channel, user_id=None, team_id=None):
+        self.channel = channel
+        self.user_id = user_id
+        self.team_id = team_id
+        self.cursor = 0
+        self.wakeup = threading.Event()
+        self.keepalive = False
+        self.last_sent = time.time()
+
+    def receives(self, user_id=None, team_id=None):
+        """
+        Whether an event addressed to a user or team (or to everyone if neither
+        is given) is for this subscriber
+        """
+        if user_id is None and team_id is None:
+            return True
+        if user_id is not None and user_id == self.user_id:
+            return True
+        return team_id is not None and team_id == self.team_id
+
+
 class EventManager(object):
-    def __init__(self):
+    # Events are only published through the buffers of this process
+    buffers_complete = True
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.buffers = {}
         self.clients = {}
+        # Clients are also indexed by their user and team so that events
+        # addressed to them only wake up their connections
+        self.user_clients = defaultdict(dict)
+        self.team_clients = defaultdict(dict)
+        # Events are numbered from the time the manager started so that their
+        # IDs keep increasing across restarts
+        self.epoch = int(time.time() * 1000)
+        self.sequence = itertools.count()
+        # A single ticker wakes up idle clients to send keepalives instead of
+        # each connection waiting on its own timer
+        self.ticker = None
+        self.published = 0
+        self.delivered = 0
+        self.pings = 0
+        self.rate = 0.0
+        self.last_tick = (time.time(), 0)
 
-    def publish(self, data, type=None, id=None, channel="ctf"):
-        event = ServerSentEvent(data, type=type, id=id)
-        message = event.to_dict()
-        for client in list(self.clients.values()):
-            client[channel].put(message)
-        return len(self.clients)
+    def get_buffer(self, channel):
+        buffer = self.buffers.get(channel)
+        if buffer is None:
+            buffer = self.buffers.setdefault(
+                channel,
+                EventBuffer(self.buffer_size, complete=self.buffers_complete),
+            )
+        return buffer
+
+    def add_client(self, client):
+        self.clients[id(client)] = client
+        if client.user_id is not None:
+            self.user_clients[client.user_id][id(client)] = client
+        if client.team_id is not None:
+            self.team_clients[client.team_id][id(client)] = client
+
+    def remove_client(self, client):
+        self.clients.pop(id(client), None)
+        for index, key in (
+            (self.user_clients, client.user_id),
+            (self.team_clients, client.team_id),
+        ):
+            if key is None:
+                continue
+            index[key].pop(id(client), None)
+            if not index[key]:
+                del index[key]
+
+    def recipients(self, user_id=None, team_id=None):
+        """
+        Get the clients an event is addressed to. Events that aren't addressed
+        to a user or team go to every client.
+        """
+        if user_id is None and team_id is None:
+            return list(self.clients.values())
+        recipients = {}
+        if user_id is not None:
+            recipients.update(self.user_clients.get(user_id, {}))
+        if team_id is not None:
+            recipients.update(self.team_clients.get(team_id, {}))
+        return list(recipients.values())
+
+    def broadcast(self, channel, event_id, message, user_id=None, team_id=None):
+        """
+        Add an event to the channel's buffer and wake up its recipients
+        """
+        self.get_buffer(channel).append(
+            event_id, message, user_id=user_id, team_id=team_id
+        )
+        self.published += 1
+        recipients = self.channel_recipients(channel, user_id=user_id, team_id=team_id)
+        for client in recipients:
+            client.wakeup.set()
+        return len(recipients)
+
+    def channel_recipients(self, channel, user_id=None, team_id=None):
+        return [
+            client
+            for client in self.recipients(user_id=user_id, team_id=team_id)
+            if client.channel == channel
+        ]
+
+    def publish(
+        self, data, type=None, id=None, channel="ctf", user_id=None, team_id=None
+    ):
+        """
+        Publish an event and return the number of clients it was sent to.
+        Events are numbered by the manager so that clients can resume from
+        them, so `id` is only accepted for compatibility and is ignored.
+        """
+        event_id = "{epoch}-{sequence}".format(
+            epoch=self.epoch, sequence=next(self.sequence)
+        )
+        message = ServerSentEvent(data, type=type).to_dict()
+        return self.broadcast(
+            channel, event_id, message, user_id=user_id, team_id=team_id
+        )
 
     def listen(self):
         pass
 
-    def subscribe(self, channel="ctf"):
-        q = defaultdict(Queue)
-        self.clients[id(q)] = q
+    def start_ticker(self):
+        # A thread so that it also runs without gevent monkey patching, with
+        # which it becomes a greenlet
+        if self.ticker is None:
+            self.ticker = threading.Thread(target=self._tick_forever, daemon=True)
+            self.ticker.start()
+
+    def _tick_forever(self):
+        while True:
+            time.sleep(KEEPALIVE_INTERVAL)
+            try:
+                self.tick()
+            except Exception:
+                logging.getLogger("events").exception("Failed to send keepalives")
+
+    def tick(self, now=None):
+        """
+        Wake up the clients that haven't been sent anything for a keepalive
+        interval and update the rate of published events
+        """
+        if now is None:
+            now = time.time()
+        for client in list(self.clients.values()):
+            if now - client.last_sent >= KEEPALIVE_INTERVAL:
+                client.keepalive = True
+                client.wakeup.set()
+        last_time, last_published = self.last_tick
+        if now > last_time:
+            self.rate = (self.published - last_published) / (now - last_time)
+        self.last_tick = (now, self.published)
+
+    def stats(self):
+        """
+        Get the connections and event throughput of this worker
+        """
+        unread = [
+            min(
+                self.get_buffer(client.channel).position - client.cursor,
+                self.buffer_size,
+            )
+            for client in list(self.clients.values())
+        ]
+        return {
+            "pid": os.getpid(),
+            "clients": len(unread),
+            "users": len(self.user_clients),
+            "teams": len(self.team_clients),
+            "unread": sum(unread),
+            "max_unread": max(unread, default=0),
+            "buffer_size": self.buffer_size,
+            "published": self.published,
+            "delivered": self.delivered,
+            "pings": self.pings,
+            "messages_per_second": self.rate,
+        }
+
+    def backlog(self, channel, last_event_id, until_event_id):
+        """
+        Get the events between two event IDs that are no longer buffered
+        """
+        return []
+
+    def subscribe(self, channel="ctf", user_id=None, team_id=None, last_event_id=None):
+        buffer = self.get_buffer(channel)
+        client = Subscriber(channel, user_id=user_id, team_id=team_id)
+        client.cursor, missed = buffer.seek(last_event_id)
+        self.add_client(client)
+        self.start_ticker()
         try:
             # Immediately yield a ping event to force Response headers to be set
             # or else some reverse proxies will incorrectly buffer SSE
             yield ServerSentEvent(data="ping", type="ping")
+
+            # Replay what a reconnecting client missed while it was away
+            events, client.cursor = buffer.read(client.cursor)
+            if missed and events:
+                events = self.backlog(channel, last_event_id, events[0][0]) + events
+
             while True:
-                with Timeout(5, False):
-                    message = q[channel].get()
-                    yield ServerSentEvent(**message)
-                yield ServerSentEvent(data="ping", type="ping")
+                keepalive, client.keepalive = client.keepalive, False
+                sent = False
+                for event_id, message, to_user_id, to_team_id in events:
+                    if client.receives(user_id=to_user_id, team_id=to_team_id):
+                        self.delivered += 1
+                        sent = True
+                        yield ServerSentEvent(id=event_id, **message)
+                if sent is False and keepalive:
+                    self.pings += 1
+                    sent = True
+                    yield ServerSentEvent(data="ping", type="ping")
+                if sent:
+                    client.last_sent = time.time()
+
+                client.wakeup.wait()
+                client.wakeup.clear()
+                events, client.cursor = buffer.read(client.cursor)
         finally:
-            del self.clients[id(q)]
-            del q
+            self.remove_client(client)
 
 
 class RedisEventManager(EventManager):
-    def __init__(self):
-        super(EventManager, self).__init__()
+    # Buffers only hold the events published since the worker started
+    # listening. Older ones are read from the stream.
+    buffers_complete = False
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        super(RedisEventManager, self).__init__(buffer_size=buffer_size)
         self.client = cache.cache._write_client
-        self.clients = {}
+        self.prefix = (cache.cache.key_prefix or "") + "events:"
+
+    def entries(self, entries):
+        for event_id, fields in entries:
+            message = json.loads(fields[b"message"])
+            to = message.pop("to", None) or {}
+            yield _text(event_id), message, to.get("user_id"), to.get("team_id")
 
-    def publish(self, data, type=None, id=None, channel="ctf"):
-        event = ServerSentEvent(data, type=type, id=id)
-        message = json.dumps(event.to_dict())
-        return self.client.publish(message=message, channel=channel)
+    def publish(
+        self, data, type=None, id=None, channel="ctf", user_id=None, team_id=None
+    ):
+        """
+        Publish an event to every worker. Redis numbers the events so `id` is
+        ignored. Only the clients of this worker are counted as recipients.
+        """
+        message = ServerSentEvent(data, type=type).to_dict()
+        if user_id is not None or team_id is not None:
+            message["to"] = {"user_id": user_id, "team_id": team_id}
+        self.client.xadd(
+            self.prefix + channel,
+            {"message": json.dumps(message)},
+            maxlen=STREAM_SIZE,
+            approximate=True,
+        )
+        return len(self.channel_recipients(channel, user_id=user_id, team_id=team_id))
 
     def listen(self, channel="ctf"):
+        key = self.prefix + channel
+        # Only events published after the worker started are buffered, older
+        # ones are read from the stream when a client asks for them
+        last_id = "$"
+
         @retry(wait=wait_exponential(min=1, max=30))
         def _listen():
+            nonlocal last_id
             while True:
-                pubsub = self.client.pubsub()
-                pubsub.subscribe(channel)
-                try:
-                    while True:
-                        message = pubsub.get_message(
-                            ignore_subscribe_messages=True, timeout=5
+                response = self.client.xread({key: last_id}, count=100, block=5000)
+                for _, entries in response:
+                    for event_id, message, user_id, team_id in self.entries(entries):
+                        self.broadcast(
+                            channel,
+                            event_id,
+                            message,
+                            user_id=user_id,
+                            team_id=team_id,
                         )
-                        if message:
-                            if message["type"] == "message":
-                                event = json.loads(message["data"])
-                                for client in list(self.clients.values()):
-                                    client[channel].put(event)
-                finally:
-                    pubsub.close()
+                        last_id = event_id
 
         spawn(_listen)
 
-    def subscribe(self, channel="ctf"):
-        q = defaultdict(Queue)
-        self.clients[id(q)] = q
-        try:
-            # Immediately yield a ping event to force Response headers to be set
-            # or else some reverse proxies will incorrectly buffer SSE
-            yield ServerSentEvent(data="ping", type="ping")
-            while True:
-                with Timeout(5, False):
-                    message = q[channel].get()
-                    yield ServerSentEvent(**message)
-                yield ServerSentEvent(data="ping", type="ping")
-        finally:
-            del self.clients[id(q)]
-            del q
+    def backlog(self, channel, last_event_id, until_event_id):
+        entries = self.client.xrevrange(
+            self.prefix + channel,
+            max=until_event_id,
+            min=last_event_id,
+            count=self.buffer_size,
+        )
+        return [
+            entry
+            for entry in self.entries(reversed(entries))
+            if entry[0] not in (last_event_id, until_event_id)
+        ]
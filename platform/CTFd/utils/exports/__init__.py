@@ -6,7 +6,9 @@ import subprocess  # nosec B404
 import sys
 import tempfile
 import zipfile
-from io import BytesIO, StringIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import StringIO
 from pathlib import Path
 
 import dataset
@@ -27,6 +29,7 @@ from CTFd.utils import get_app_config, set_config, string_types
 from CTFd.utils.dates import unix_time
 from CTFd.utils.exports.databases import is_database_mariadb
 from CTFd.utils.exports.freeze import freeze_export
+from CTFd.utils.exports.loaders import BulkLoader
 from CTFd.utils.migrations import (
     create_database,
     drop_database,
@@ -37,7 +40,11 @@ from CTFd.utils.migrations import (
 from CTFd.utils.uploads import get_uploader
 
 
-def export_ctf():
+def export_ctf(compresslevel=None):
+    """
+    Export the database and uploads into a zip file. Entries are stored
+    uncompressed unless a deflate `compresslevel` (0-9) is given.
+    """
     # TODO: For some unknown reason dataset is only able to see alembic_version during tests.
     # Even using a real sqlite database. This makes this test impossible to pass in sqlite.
     db = dataset.connect(get_app_config("SQLALCHEMY_DATABASE_URI"))
@@ -45,15 +52,22 @@ def export_ctf():
     # Backup database
     backup = tempfile.NamedTemporaryFile()
 
-    backup_zip = zipfile.ZipFile(backup, "w")
+    if compresslevel is None:
+        backup_zip = zipfile.ZipFile(backup, "w")
+    else:
+        backup_zip = zipfile.ZipFile(
+            backup, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel
+        )
 
     tables = db.tables
     for table in tables:
-        result = db[table].all()
-        result_file = BytesIO()
-        freeze_export(result, fileobj=result_file)
-        result_file.seek(0)
-        backup_zip.writestr("db/{}.json".format(table), result_file.read())
+        # Rows are read from a server side cursor and written straight into
+        # the zip so that large tables aren't held in memory
+        result = db[table].all(_streamed=True)
+        with backup_zip.open(
+            "db/{}.json".format(table), "w", force_zip64=True
+        ) as result_file:
+            freeze_export(result, fileobj=result_file)
 
     # # Guarantee that alembic_version is saved into the export
     if "alembic_version" not in tables:
@@ -112,7 +126,73 @@ def set_import_end_time(value, timeout=604800, skip_print=False):
         print(value)
 
 
-def import_ctf(backup, erase=True):
+def prepare_entry(member, entry, sqlite=False, mariadb=False):
+    """
+    Convert a row of an exported table (e.g. `db/users.json`) in place into
+    values that can be inserted into this database
+    """
+    # This is a hack to get SQLite to properly accept datetime values from dataset
+    # See Issue #246
+    if sqlite:
+        direct_table = get_class_by_tablename(member[3:-5])
+        for k, v in entry.items():
+            if isinstance(v, string_types):
+                # We only want to apply this hack to columns that are expecting a datetime object
+                try:
+                    is_dt_column = (
+                        type(getattr(direct_table, k).type) == sqltypes.DateTime
+                    )
+                except AttributeError:
+                    is_dt_column = False
+
+                # If the table is expecting a datetime, we should check if the string is one and convert it
+                if is_dt_column:
+                    match = re.match(
+                        r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d",
+                        v,
+                    )
+                    if match:
+                        entry[k] = datetime.datetime.strptime(v, "%Y-%m-%dT%H:%M:%S.%f")
+                        continue
+                    match = re.match(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}", v)
+                    if match:
+                        entry[k] = datetime.datetime.strptime(v, "%Y-%m-%dT%H:%M:%S")
+                        continue
+    # From v2.0.0 to v2.1.0 requirements could have been a string or JSON because of a SQLAlchemy issue
+    # This is a hack to ensure we can still accept older exports. See #867
+    if member in (
+        "db/challenges.json",
+        "db/hints.json",
+        "db/awards.json",
+    ):
+        requirements = entry.get("requirements")
+        if requirements and isinstance(requirements, string_types):
+            entry["requirements"] = json.loads(requirements)
+
+    # From v3.1.0 to v3.5.0 FieldEntries could have been varying levels of JSON'ified strings.
+    # For example "\"test\"" vs "test". This results in issues with importing backups between
+    # databases. Specifically between MySQL and MariaDB. Because CTFd standardizes against MySQL
+    # we need to have an edge case here.
+    if member == "db/field_entries.json":
+        value = entry.get("value")
+        if value is not None:
+            try:
+                # Attempt to convert anything to its original Python value
+                entry["value"] = str(json.loads(value))
+            except (json.JSONDecodeError, TypeError):
+                pass
+            finally:
+                # Dump the value into JSON if its mariadb or skip the conversion if not mariadb
+                if mariadb:
+                    entry["value"] = json.dumps(entry["value"])
+    return entry
+
+
+def import_ctf(backup, erase=True, workers=None):
+    """
+    Import a CTF export. With `workers` tables are loaded with chunked bulk
+    inserts on up to that many parallel connections instead of row by row.
+    """
     # Reset import cache keys and don't print these values
     set_import_error(value=None, skip_print=True)
     set_import_status(value=None, skip_print=True)
@@ -280,6 +360,19 @@ def import_ctf(backup, erase=True):
 
     members.remove("db/alembic_version.json")
 
+    loader = None
+    if workers:
+        loader = BulkLoader(
+            side_db.engine,
+            backup,
+            prepare=partial(prepare_entry, sqlite=sqlite, mariadb=mariadb),
+            status=set_import_status,
+            postgres=postgres,
+        )
+        if loader.can_disable_foreign_key_checks() is False:
+            # Tables can only be loaded in order while foreign keys are checked
+            workers = 1
+
     # Combine the database insertion code into a function so that we can pause
     # insertion between official database tables and plugin tables
     def insertion(table_filenames):
@@ -301,67 +394,7 @@ def import_ctf(backup, erase=True):
                     count = len(saved["results"])
                     for i, entry in enumerate(saved["results"]):
                         set_import_status(f"inserting {member} {i}/{count}")
-                        # This is a hack to get SQLite to properly accept datetime values from dataset
-                        # See Issue #246
-                        if sqlite:
-                            direct_table = get_class_by_tablename(table.name)
-                            for k, v in entry.items():
-                                if isinstance(v, string_types):
-                                    # We only want to apply this hack to columns that are expecting a datetime object
-                                    try:
-                                        is_dt_column = (
-                                            type(getattr(direct_table, k).type)
-                                            == sqltypes.DateTime
-                                        )
-                                    except AttributeError:
-                                        is_dt_column = False
-
-                                    # If the table is expecting a datetime, we should check if the string is one and convert it
-                                    if is_dt_column:
-                                        match = re.match(
-                                            r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d",
-                                            v,
-                                        )
-                                        if match:
-                                            entry[k] = datetime.datetime.strptime(
-                                                v, "%Y-%m-%dT%H:%M:%S.%f"
-                                            )
-                                            continue
-                                        match = re.match(
-                                            r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}", v
-                                        )
-                                        if match:
-                                            entry[k] = datetime.datetime.strptime(
-                                                v, "%Y-%m-%dT%H:%M:%S"
-                                            )
-                                            continue
-                        # From v2.0.0 to v2.1.0 requirements could have been a string or JSON because of a SQLAlchemy issue
-                        # This is a hack to ensure we can still accept older exports. See #867
-                        if member in (
-                            "db/challenges.json",
-                            "db/hints.json",
-                            "db/awards.json",
-                        ):
-                            requirements = entry.get("requirements")
-                            if requirements and isinstance(requirements, string_types):
-                                entry["requirements"] = json.loads(requirements)
-
-                        # From v3.1.0 to v3.5.0 FieldEntries could have been varying levels of JSON'ified strings.
-                        # For example "\"test\"" vs "test". This results in issues with importing backups between
-                        # databases. Specifically between MySQL and MariaDB. Because CTFd standardizes against MySQL
-                        # we need to have an edge case here.
-                        if member == "db/field_entries.json":
-                            value = entry.get("value")
-                            if value is not None:
-                                try:
-                                    # Attempt to convert anything to its original Python value
-                                    entry["value"] = str(json.loads(value))
-                                except (json.JSONDecodeError, TypeError):
-                                    pass
-                                finally:
-                                    # Dump the value into JSON if its mariadb or skip the conversion if not mariadb
-                                    if mariadb:
-                                        entry["value"] = json.dumps(entry["value"])
+                        prepare_entry(member, entry, sqlite=sqlite, mariadb=mariadb)
 
                         try:
                             table.insert(entry)
@@ -407,9 +440,27 @@ def import_ctf(backup, erase=True):
                                 )
                             )
 
+    def bulk_insertion(table_filenames):
+        current = app._get_current_object()
+
+        def load(member):
+            with current.app_context():
+                set_import_status(f"inserting {member}")
+                return loader.load(member)
+
+        table_filenames = [m for m in table_filenames if m.startswith("db/")]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(load, table_filenames))
+
+        # Tables that don't match the database are created through dataset
+        insertion([m for m, ok in zip(table_filenames, loaded) if ok is False])
+
     # Insert data from official tables
     set_import_status("inserting tables")
-    insertion(first)
+    if loader:
+        bulk_insertion(first)
+    else:
+        insertion(first)
 
     # Create tables created by plugins
     # Run plugin migrations
@@ -421,7 +472,10 @@ def import_ctf(backup, erase=True):
         plugin_upgrade(plugin_name=plugin, revision=revision, lower=None)
 
     # Insert data for plugin tables
-    insertion(members)
+    if loader:
+        bulk_insertion(members)
+    else:
+        insertion(members)
 
     # Bring plugin tables up to head revision
     plugins = get_plugin_names()
@@ -0,0 +1,182 @@
+import json
+import re
+from io import TextIOWrapper
+from itertools import islice
+
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.sql import sqltypes
+
+# Rows are inserted with one executemany per chunk
+CHUNK_SIZE = 1000
+READ_SIZE = 1024 * 1024
+
+HEADER = re.compile(r'\s*\{\s*"count"\s*:\s*(\d+)\s*,\s*"results"\s*:\s*\[')
+SEPARATORS = " \t\r\n,"
+
+
+def iter_results(fileobj, read_size=READ_SIZE):
+    """
+    Parse the rows of an exported table one at a time.
+
+    Returns the count from the file's header and an iterator over its rows.
+    Files that aren't laid out like exports are parsed whole.
+    """
+    stream = TextIOWrapper(fileobj, encoding="utf-8")
+    buffer = stream.read(read_size)
+    if not buffer.strip():
+        return 0, iter([])
+    match = HEADER.match(buffer)
+    if match is None:
+        saved = json.loads(buffer + stream.read())
+        return len(saved["results"]), iter(saved["results"])
+    return int(match.group(1)), _iter_rows(stream, buffer, match.end(), read_size)
+
+
+def _iter_rows(stream, buffer, position, read_size):
+    decoder = json.JSONDecoder()
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position == len(buffer):
+                raise ValueError
+            row, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # The row continues past what has been read so far
+            more = stream.read(read_size)
+            if not more:
+                raise ValueError("The export ended in the middle of a row")
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield row
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+class BulkLoader(object):
+    """
+    Inserts the tables of an export with chunked executemany inserts. Each
+    table is loaded on its own connection with foreign key checks disabled so
+    that tables can be loaded in parallel.
+    """
+
+    def __init__(
+        self,
+        engine,
+        backup,
+        prepare,
+        status,
+        postgres=False,
+        chunk_size=CHUNK_SIZE,
+    ):
+        self.engine = engine
+        self.backup = backup
+        self.prepare = prepare
+        self.status = status
+        self.postgres = postgres
+        self.chunk_size = chunk_size
+
+    def set_foreign_key_checks(self, conn, enabled):
+        # In a transaction of its own so that a failure doesn't abort the next
+        with conn.begin():
+            if self.postgres:
+                role = "DEFAULT" if enabled else "replica"
+                conn.execute(text("SET session_replication_role={}".format(role)))
+            else:
+                conn.execute(text("SET FOREIGN_KEY_CHECKS={}".format(int(enabled))))
+
+    def can_disable_foreign_key_checks(self):
+        try:
+            with self.engine.connect() as conn:
+                self.set_foreign_key_checks(conn, False)
+                self.set_foreign_key_checks(conn, True)
+        except Exception:
+            return False
+        return True
+
+    def load(self, member):
+        """
+        Insert the rows of an exported table.
+
+        Returns False without inserting anything if the table doesn't exist or
+        lacks some of the exported columns, so that it can be imported through
+        dataset which creates them.
+        """
+        table_name = member[3:-5]
+        try:
+            fileobj = self.backup.open(member)
+        except KeyError:
+            return True
+
+        with fileobj, self.engine.connect() as conn:
+            try:
+                table = Table(table_name, MetaData(), autoload_with=conn)
+            except NoSuchTableError:
+                return False
+            columns = set(table.columns.keys())
+            # Values stored as JSON text (e.g. on MariaDB) have to be dumped first
+            json_columns = {
+                column.name
+                for column in table.columns
+                if isinstance(column.type, sqltypes.JSON)
+            }
+
+            try:
+                self.set_foreign_key_checks(conn, False)
+            except Exception:
+                pass
+            try:
+                count, rows = iter_results(fileobj)
+                inserted = 0
+                for chunk in chunks(rows, self.chunk_size):
+                    if inserted == 0 and not set(chunk[0]) <= columns:
+                        return False
+                    self.insert(conn, table, member, chunk, json_columns)
+                    inserted += len(chunk)
+                    self.status(f"inserting {member} {inserted}/{count}")
+                if self.postgres:
+                    self.reset_sequence(conn, table_name)
+            finally:
+                try:
+                    self.set_foreign_key_checks(conn, True)
+                except Exception:
+                    pass
+        return True
+
+    def insert(self, conn, table, member, chunk, json_columns):
+        batches = {}
+        for entry in chunk:
+            self.prepare(member, entry)
+            for key, value in entry.items():
+                if isinstance(value, (dict, list)) and key not in json_columns:
+                    entry[key] = json.dumps(value)
+            batches.setdefault(tuple(sorted(entry)), []).append(entry)
+
+        with conn.begin():
+            # Config keys can be set again while the import runs
+            if table.name == "config":
+                ids = [entry["id"] for entry in chunk if "id" in entry]
+                conn.execute(table.delete().where(table.c.id.in_(ids)))
+            for batch in batches.values():
+                conn.execute(table.insert(), batch)
+
+    def reset_sequence(self, conn, table_name):
+        # See the note in import_ctf about setting the next primary key in Postgres
+        if '"' in table_name or "'" in table_name:
+            raise Exception(
+                "Table name {table_name} contains quotes".format(table_name=table_name)
+            )
+        query = "SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), coalesce(max(id)+1,1), false) FROM \"{table_name}\"".format(  # nosec
+            table_name=table_name
+        )
+        conn.execute(text(query))
@@ -1,5 +1,6 @@
 import json
-from collections import OrderedDict, defaultdict
+import shutil
+import tempfile
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -16,59 +17,64 @@ class JSONEncoder(json.JSONEncoder):
 
 
 class JSONSerializer(object):
+    """
+    Writes the rows of a query as `{"count":...,"results":[...],"meta":{}}`
+    one row at a time. Rows are spooled to a temporary file while they're
+    counted because the count is written before them.
+    """
+
     def __init__(self, query, fileobj):
         self.query = query
         self.fileobj = fileobj
-        self.buckets = defaultdict(list)
+        self.encoder = JSONEncoder(separators=(",", ":"))
 
     def serialize(self):
-        for row in self.query:
-            self.write(None, row)
-        self.close()
+        mariadb = is_database_mariadb()
+        count = 0
+        with tempfile.TemporaryFile() as results:
+            for row in self.query:
+                if count:
+                    results.write(b",")
+                row = self.normalize(row, mariadb=mariadb)
+                results.write(self.encoder.encode(row).encode("utf-8"))
+                count += 1
 
-    def write(self, path, result):
-        self.buckets[path].append(result)
+            # Empty tables are exported as empty files
+            if count == 0:
+                return
+            results.seek(0)
+            self.fileobj.write(b'{"count":%d,"results":[' % count)
+            shutil.copyfileobj(results, self.fileobj)
+            self.fileobj.write(b'],"meta":{}}')
 
-    def wrap(self, result):
-        result = OrderedDict(
-            [("count", len(result)), ("results", result), ("meta", {})]
-        )
-        return result
+    def normalize(self, row, mariadb=False):
+        # Certain databases (MariaDB) store JSON as LONGTEXT.
+        # Before emitting a file we should standardize to valid JSON (i.e. a dict)
+        # See Issue #973
 
-    def close(self):
-        mariadb = is_database_mariadb()
-        for _path, result in self.buckets.items():
-            result = self.wrap(result)
+        # Handle JSON used in tables that use requirements
+        data = row.get("requirements")
+        if data:
+            try:
+                if isinstance(data, string_types):
+                    row["requirements"] = json.loads(data)
+            except ValueError:
+                pass
 
-            # Certain databases (MariaDB) store JSON as LONGTEXT.
-            # Before emitting a file we should standardize to valid JSON (i.e. a dict)
-            # See Issue #973
-            for i, r in enumerate(result["results"]):
-                # Handle JSON used in tables that use requirements
-                data = r.get("requirements")
-                if data:
+        # Handle JSON used in FieldEntries table
+        if mariadb:
+            if sorted(row.keys()) == [
+                "field_id",
+                "id",
+                "team_id",
+                "type",
+                "user_id",
+                "value",
+            ]:
+                value = row.get("value")
+                if value:
                     try:
-                        if isinstance(data, string_types):
-                            result["results"][i]["requirements"] = json.loads(data)
+                        row["value"] = json.loads(value)
                     except ValueError:
                         pass
-
-                # Handle JSON used in FieldEntries table
-                if mariadb:
-                    if sorted(r.keys()) == [
-                        "field_id",
-                        "id",
-                        "team_id",
-                        "type",
-                        "user_id",
-                        "value",
-                    ]:
-                        value = r.get("value")
-                        if value:
-                            try:
-                                result["results"][i]["value"] = json.loads(value)
-                            except ValueError:
-                                pass
-
-            data = json.dumps(result, cls=JSONEncoder, separators=(",", ":"))
-            self.fileobj.write(data.encode("utf-8"))
+        return row
@@ -39,6 +39,7 @@ from CTFd.utils.security.email import (
     generate_password_reset_token,
     verify_reset_password_token,
 )
+from CTFd.utils.tracking import TrackingBuffer
 from CTFd.utils.user import (
     authed,
     get_current_team_attrs,
@@ -201,6 +202,15 @@ def init_events(app):
     app.events_manager.listen()
 
 
+def init_tracking(app):
+    # Without a flush interval requests write their own tracking rows
+    interval = app.config.get("TRACKING_FLUSH_INTERVAL")
+    if interval:
+        app.tracking_buffer = TrackingBuffer(app, interval=interval)
+    else:
+        app.tracking_buffer = None
+
+
 def init_request_processors(app):
     @app.url_defaults
     def inject_theme(endpoint, values):
@@ -244,6 +254,19 @@ def init_request_processors(app):
             user_ips = get_current_user_recent_ips()
             ip = get_ip()
 
+            if app.tracking_buffer is not None:
+                if ip not in user_ips or request.method in (
+                    "POST",
+                    "PATCH",
+                    "DELETE",
+                ):
+                    # Deleted users are logged out here instead of by a failed commit
+                    if get_current_user_attrs() is None:
+                        logout_user()
+                        return
+                    app.tracking_buffer.record(user_id=session["id"], ip=ip)
+                return
+
             track = None
             if ip not in user_ips or request.method in (
                 "POST",
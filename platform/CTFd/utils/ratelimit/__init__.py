@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+
+from flask import current_app
+
+from CTFd.cache import cache
+
+# Rate limit state is kept apart from other cache keys as its format depends
+# on the algorithm and the engine
+KEY_PREFIX = "ratelimit:"
+
+FIXED_WINDOW = "fixed_window"
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
+
+# Each script checks and updates a limit in one atomic round trip
+FIXED_WINDOW_SCRIPT = """
+local count = tonumber(redis.call("get", KEYS[1]) or "0")
+if count >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call("incr", KEYS[1])
+redis.call("expire", KEYS[1], ARGV[2])
+return 1
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call("get", KEYS[1]) or "0")
+local previous = tonumber(redis.call("get", KEYS[2]) or "0")
+if previous * tonumber(ARGV[2]) + current >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call("incr", KEYS[1])
+redis.call("expire", KEYS[1], ARGV[3])
+return 1
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("hmget", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or limit
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - updated) * limit / interval)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("hset", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("expire", KEYS[1], math.ceil(interval))
+return allowed
+"""
+
+
+def fixed_window(state, now, limit, interval):
+    """
+    Allow `limit` hits until the window closes `interval` seconds after the
+    last allowed hit. Rejected hits don't extend the window.
+    """
+    if state is None or state[1] <= now:
+        state = (0, now)
+    count, reset = state
+    if count >= limit:
+        return False, state
+    return True, (count + 1, now + interval)
+
+
+def sliding_window(state, now, limit, interval):
+    """
+    Allow `limit` hits in any `interval` seconds, estimating the hits of the
+    last interval from the counts of the current and previous fixed windows
+    """
+    window = now - now % interval
+    if state is None:
+        state = (window, 0, 0)
+    start, previous, current = state
+    if window - start >= 2 * interval:
+        previous, current = 0, 0
+    elif window - start >= interval:
+        previous, current = current, 0
+    weight = 1 - (now - window) / interval
+    if previous * weight + current >= limit:
+        return False, (window, previous, current)
+    return True, (window, previous, current + 1)
+
+
+def token_bucket(state, now, limit, interval):
+    """
+    Allow bursts of up to `limit` hits with the bucket refilling at `limit`
+    hits per `interval` seconds
+    """
+    if state is None:
+        state = (limit, now)
+    tokens, updated = state
+    tokens = min(limit, tokens + max(0, now - updated) * limit / interval)
+    if tokens < 1:
+        return False, (tokens, now)
+    return True, (tokens - 1, now)
+
+
+ALGORITHMS = {
+    FIXED_WINDOW: fixed_window,
+    SLIDING_WINDOW: sliding_window,
+    TOKEN_BUCKET: token_bucket,
+}
+
+
+class RateLimiter(object):
+    """
+    Keeps rate limit state in process. Used when the cache isn't shared
+    between workers (e.g. the simple cache).
+    """
+
+    def __init__(self, max_keys=10000):
+        self.lock = threading.Lock()
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def hit(self, key, limit, interval, algorithm=FIXED_WINDOW):
+        """
+        Record a hit on `key` and return whether it is within the limit
+        """
+        now = time.time()
+        with self.lock:
+            state, expires = self.buckets.get(key, (None, 0))
+            if expires <= now:
+                state = None
+            allowed, state = ALGORITHMS[algorithm](state, now, limit, interval)
+            self.buckets[key] = (state, now + 2 * interval)
+            if len(self.buckets) > self.max_keys:
+                self.prune(now)
+        return allowed
+
+    def prune(self, now):
+        for key, (_, expires) in list(self.buckets.items()):
+            if expires <= now:
+                del self.buckets[key]
+
+    def reset(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+
+class CacheRateLimiter(RateLimiter):
+    """
+    Keeps rate limit state in the cache so that it is shared between workers
+    using a cache without atomic operations (e.g. the filesystem cache). Hits
+    are serialized within a worker but concurrent hits from different workers
+    can be undercounted.
+    """
+
+    def hit(self, key, limit, interval, algorithm=FIXED_WINDOW):
+        now = time.time()
+        with self.lock:
+            state = cache.get(KEY_PREFIX + key)
+            allowed, state = ALGORITHMS[algorithm](state, now, limit, interval)
+            cache.set(KEY_PREFIX + key, state, timeout=math.ceil(2 * interval))
+        return allowed
+
+    def reset(self, key):
+        cache.delete(KEY_PREFIX + key)
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Keeps rate limit state in Redis, checking and updating it with a single
+    atomic script call per hit
+    """
+
+    def __init__(self, client, prefix=""):
+        self.client = client
+        self.prefix = prefix + KEY_PREFIX
+        self.scripts = {
+            FIXED_WINDOW: client.register_script(FIXED_WINDOW_SCRIPT),
+            SLIDING_WINDOW: client.register_script(SLIDING_WINDOW_SCRIPT),
+            TOKEN_BUCKET: client.register_script(TOKEN_BUCKET_SCRIPT),
+        }
+
+    def hit(self, key, limit, interval, algorithm=FIXED_WINDOW):
+        key = self.prefix + key
+        script = self.scripts[algorithm]
+        if algorithm == FIXED_WINDOW:
+            allowed = script(keys=[key], args=[limit, math.ceil(interval)])
+        elif algorithm == SLIDING_WINDOW:
+            now = time.time()
+            window = int(now // interval)
+            weight = 1 - (now - window * interval) / interval
+            allowed = script(
+                keys=["{}:{}".format(key, window), "{}:{}".format(key, window - 1)],
+                args=[limit, weight, math.ceil(2 * interval)],
+            )
+        else:
+            allowed = script(keys=[key], args=[limit, interval, time.time()])
+        return bool(allowed)
+
+    def reset(self, key):
+        key = self.prefix + key
+        keys = [key] + list(self.client.scan_iter(match=key + ":*"))
+        self.client.delete(*keys)
+
+
+def get_rate_limiter():
+    """
+    Get the rate limiter for the current app's cache
+    """
+    limiter = current_app.extensions.get("rate_limiter")
+    if limiter is None:
+        cache_type = current_app.config.get("CACHE_TYPE")
+        if cache_type == "redis":
+            limiter = RedisRateLimiter(
+                cache.cache._write_client, prefix=cache.cache.key_prefix or ""
+            )
+        elif cache_type == "filesystem":
+            limiter = CacheRateLimiter()
+        else:
+            limiter = RateLimiter()
+        current_app.extensions["rate_limiter"] = limiter
+    return limiter
@@ -1,6 +1,6 @@
 from collections import defaultdict
 
-from CTFd.cache import cache
+from CTFd.cache import namespaced, stale_memoize
 from CTFd.models import Awards, Solves
 from CTFd.utils import get_config
 from CTFd.utils.dates import isoformat, unix_time_to_utc
@@ -8,7 +8,8 @@ from CTFd.utils.modes import generate_account_url
 from CTFd.utils.scores import get_standings
 
 
-@cache.memoize(timeout=60)
+@namespaced("standings")
+@stale_memoize(timeout=60)
 def get_scoreboard_detail(count, bracket_id=None):
     response = {}
 
@@ -1,333 +1,150 @@
-from sqlalchemy.sql.expression import union_all
-
-from CTFd.cache import cache
-from CTFd.models import Awards, Brackets, Challenges, Solves, Teams, Users, db
+from CTFd.cache import cache, namespaced, stale_memoize
+from CTFd.models import Brackets, Teams, Users, db
 from CTFd.utils import get_config
 from CTFd.utils.dates import unix_time_to_utc
 from CTFd.utils.modes import get_model
+from CTFd.utils.scores.standings import Standing, standings_index
 
+# Number of accounts whose details are loaded per query while building standings
+CHUNK_SIZE = 500
 
-@cache.memoize(timeout=60)
-def get_standings(count=None, bracket_id=None, admin=False, fields=None):
-    """
-    Get standings as a list of tuples containing account_id, name, and score e.g. [(account_id, team_name, score)].
-
-    Ties are broken by who reached a given score first based on the solve ID. Two users can have the same score but one
-    user will have a solve ID that is before the others. That user will be considered the tie-winner.
 
-    Challenges & Awards with a value of zero are filtered out of the calculations to avoid incorrect tie breaks.
+def _build_standings(Model, column, columns, count, bracket_id, admin, fields):
     """
-    if fields is None:
-        fields = []
-    Model = get_model()
-
-    scores = (
-        db.session.query(
-            Solves.account_id.label("account_id"),
-            db.func.sum(Challenges.value).label("score"),
-            db.func.max(Solves.id).label("id"),
-            db.func.max(Solves.date).label("date"),
-        )
-        .join(Challenges)
-        .filter(Challenges.value != 0)
-        .group_by(Solves.account_id)
-    )
-
-    awards = (
-        db.session.query(
-            Awards.account_id.label("account_id"),
-            db.func.sum(Awards.value).label("score"),
-            db.func.max(Awards.id).label("id"),
-            db.func.max(Awards.date).label("date"),
-        )
-        .filter(Awards.value != 0)
-        .group_by(Awards.account_id)
-    )
-
-    """
-    Filter out solves and awards that are before a specific time point.
+    Join the ranked scores kept by the standings index with the account details
+    in `columns`, skipping accounts that shouldn't be listed.
     """
     freeze = get_config("freeze")
     if not admin and freeze:
-        scores = scores.filter(Solves.date < unix_time_to_utc(freeze))
-        awards = awards.filter(Awards.date < unix_time_to_utc(freeze))
+        ranked = standings_index.ranked(column, freeze=unix_time_to_utc(freeze))
+    else:
+        ranked = standings_index.ranked(column)
 
-    """
-    Combine awards and solves with a union. They should have the same amount of columns
-    """
-    results = union_all(scores, awards).alias("results")
+    if admin:
+        columns = columns + [Model.hidden, Model.banned]
 
-    """
-    Sum each of the results by the team id to get their score.
-    """
-    sumscores = (
-        db.session.query(
-            results.columns.account_id,
-            db.func.sum(results.columns.score).label("score"),
-            db.func.max(results.columns.id).label("id"),
-            db.func.max(results.columns.date).label("date"),
-        )
-        .group_by(results.columns.account_id)
-        .subquery()
+    standings_query = (
+        db.session.query(*columns, *fields)
+        .select_from(Model)
+        .join(Brackets, isouter=True)
     )
 
-    """
-    Admins can see scores for all users but the public cannot see banned users.
-
-    Filters out banned users.
-    Properly resolves value ties by ID.
-
-    Different databases treat time precision differently so resolve by the row ID instead.
-    """
-    if admin:
-        standings_query = (
-            db.session.query(
-                Model.id.label("account_id"),
-                Model.oauth_id.label("oauth_id"),
-                Model.name.label("name"),
-                Model.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                Model.hidden,
-                Model.banned,
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Model.id == sumscores.columns.account_id)
-            .join(Brackets, isouter=True)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
-        )
-    else:
-        standings_query = (
-            db.session.query(
-                Model.id.label("account_id"),
-                Model.oauth_id.label("oauth_id"),
-                Model.name.label("name"),
-                Model.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Model.id == sumscores.columns.account_id)
-            .join(Brackets, isouter=True)
-            .filter(Model.banned == False, Model.hidden == False)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
+    if not admin:
+        standings_query = standings_query.filter(
+            Model.banned == False, Model.hidden == False
         )
 
     # Filter on a bracket if asked
     if bracket_id is not None:
         standings_query = standings_query.filter(Model.bracket_id == bracket_id)
 
-    # Only select a certain amount of users if asked.
-    if count is None:
-        standings = standings_query.all()
-    else:
-        standings = standings_query.limit(count).all()
+    standings = []
+    for start in range(0, len(ranked), CHUNK_SIZE):
+        chunk = ranked[start : start + CHUNK_SIZE]
+        rows = {
+            row[0]: row
+            for row in standings_query.filter(
+                Model.id.in_([account_id for account_id, _ in chunk])
+            )
+        }
+        for account_id, score in chunk:
+            # Only select a certain amount of accounts if asked.
+            if count is not None and len(standings) >= count:
+                return standings
+            row = rows.get(account_id)
+            if row is None:
+                continue
+            keys = tuple(row._fields)
+            standings.append(
+                Standing(
+                    keys[: len(columns)] + ("score",) + keys[len(columns) :],
+                    tuple(row[: len(columns)]) + (score,) + tuple(row[len(columns) :]),
+                )
+            )
 
     return standings
 
 
-@cache.memoize(timeout=60)
-def get_team_standings(count=None, bracket_id=None, admin=False, fields=None):
-    if fields is None:
-        fields = []
-    scores = (
-        db.session.query(
-            Solves.team_id.label("team_id"),
-            db.func.sum(Challenges.value).label("score"),
-            db.func.max(Solves.id).label("id"),
-            db.func.max(Solves.date).label("date"),
-        )
-        .join(Challenges)
-        .filter(Challenges.value != 0)
-        .group_by(Solves.team_id)
-    )
-
-    awards = (
-        db.session.query(
-            Awards.team_id.label("team_id"),
-            db.func.sum(Awards.value).label("score"),
-            db.func.max(Awards.id).label("id"),
-            db.func.max(Awards.date).label("date"),
-        )
-        .filter(Awards.value != 0)
-        .group_by(Awards.team_id)
-    )
-
-    freeze = get_config("freeze")
-    if not admin and freeze:
-        scores = scores.filter(Solves.date < unix_time_to_utc(freeze))
-        awards = awards.filter(Awards.date < unix_time_to_utc(freeze))
+@namespaced("standings")
+@stale_memoize(timeout=60)
+def get_standings(count=None, bracket_id=None, admin=False, fields=None):
+    """
+    Get standings as a list of tuples containing account_id, name, and score e.g. [(account_id, team_name, score)].
 
-    results = union_all(scores, awards).alias("results")
+    Ties are broken by who reached a given score first based on the solve ID. Two users can have the same score but one
+    user will have a solve ID that is before the others. That user will be considered the tie-winner.
 
-    sumscores = (
-        db.session.query(
-            results.columns.team_id,
-            db.func.sum(results.columns.score).label("score"),
-            db.func.max(results.columns.id).label("id"),
-            db.func.max(results.columns.date).label("date"),
-        )
-        .group_by(results.columns.team_id)
-        .subquery()
-    )
+    Challenges & Awards with a value of zero are filtered out of the calculations to avoid incorrect tie breaks.
 
-    if admin:
-        standings_query = (
-            db.session.query(
-                Teams.id.label("team_id"),
-                Teams.oauth_id.label("oauth_id"),
-                Teams.name.label("name"),
-                Teams.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                Teams.hidden,
-                Teams.banned,
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Teams.id == sumscores.columns.team_id)
-            .join(Brackets, isouter=True)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
-        )
-    else:
-        standings_query = (
-            db.session.query(
-                Teams.id.label("team_id"),
-                Teams.oauth_id.label("oauth_id"),
-                Teams.name.label("name"),
-                Teams.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Teams.id == sumscores.columns.team_id)
-            .join(Brackets, isouter=True)
-            .filter(Teams.banned == False)
-            .filter(Teams.hidden == False)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
-        )
+    Scores are kept up to date by the standings index as solves and awards change so only the details of the listed
+    accounts are read from the database here.
+    """
+    if fields is None:
+        fields = []
+    Model = get_model()
+    column = "team_id" if Model == Teams else "user_id"
 
-    if bracket_id is not None:
-        standings_query = standings_query.filter(Teams.bracket_id == bracket_id)
+    """
+    Admins can see scores for all users but the public cannot see banned users.
+    """
+    columns = [
+        Model.id.label("account_id"),
+        Model.oauth_id.label("oauth_id"),
+        Model.name.label("name"),
+        Model.bracket_id.label("bracket_id"),
+        Brackets.name.label("bracket_name"),
+    ]
+    return _build_standings(Model, column, columns, count, bracket_id, admin, fields)
 
-    if count is None:
-        standings = standings_query.all()
-    else:
-        standings = standings_query.limit(count).all()
 
-    return standings
+@namespaced("standings")
+@cache.memoize(timeout=60)
+def get_team_standings(count=None, bracket_id=None, admin=False, fields=None):
+    if fields is None:
+        fields = []
+    columns = [
+        Teams.id.label("team_id"),
+        Teams.oauth_id.label("oauth_id"),
+        Teams.name.label("name"),
+        Teams.bracket_id.label("bracket_id"),
+        Brackets.name.label("bracket_name"),
+    ]
+    return _build_standings(Teams, "team_id", columns, count, bracket_id, admin, fields)
 
 
+@namespaced("standings")
 @cache.memoize(timeout=60)
 def get_user_standings(count=None, bracket_id=None, admin=False, fields=None):
     if fields is None:
         fields = []
-    scores = (
-        db.session.query(
-            Solves.user_id.label("user_id"),
-            db.func.sum(Challenges.value).label("score"),
-            db.func.max(Solves.id).label("id"),
-            db.func.max(Solves.date).label("date"),
-        )
-        .join(Challenges)
-        .filter(Challenges.value != 0)
-        .group_by(Solves.user_id)
-    )
-
-    awards = (
-        db.session.query(
-            Awards.user_id.label("user_id"),
-            db.func.sum(Awards.value).label("score"),
-            db.func.max(Awards.id).label("id"),
-            db.func.max(Awards.date).label("date"),
-        )
-        .filter(Awards.value != 0)
-        .group_by(Awards.user_id)
-    )
-
-    freeze = get_config("freeze")
-    if not admin and freeze:
-        scores = scores.filter(Solves.date < unix_time_to_utc(freeze))
-        awards = awards.filter(Awards.date < unix_time_to_utc(freeze))
-
-    results = union_all(scores, awards).alias("results")
-
-    sumscores = (
-        db.session.query(
-            results.columns.user_id,
-            db.func.sum(results.columns.score).label("score"),
-            db.func.max(results.columns.id).label("id"),
-            db.func.max(results.columns.date).label("date"),
-        )
-        .group_by(results.columns.user_id)
-        .subquery()
-    )
-
-    if admin:
-        standings_query = (
-            db.session.query(
-                Users.id.label("user_id"),
-                Users.oauth_id.label("oauth_id"),
-                Users.name.label("name"),
-                Users.team_id.label("team_id"),
-                Users.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                Users.hidden,
-                Users.banned,
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Users.id == sumscores.columns.user_id)
-            .join(Brackets, isouter=True)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
-        )
-    else:
-        standings_query = (
-            db.session.query(
-                Users.id.label("user_id"),
-                Users.oauth_id.label("oauth_id"),
-                Users.name.label("name"),
-                Users.team_id.label("team_id"),
-                Users.bracket_id.label("bracket_id"),
-                Brackets.name.label("bracket_name"),
-                sumscores.columns.score,
-                *fields,
-            )
-            .join(sumscores, Users.id == sumscores.columns.user_id)
-            .join(Brackets, isouter=True)
-            .filter(Users.banned == False, Users.hidden == False)
-            .order_by(
-                sumscores.columns.score.desc(),
-                sumscores.columns.date.asc(),
-                sumscores.columns.id.asc(),
-            )
-        )
-
-    if bracket_id is not None:
-        standings_query = standings_query.filter(Users.bracket_id == bracket_id)
+    columns = [
+        Users.id.label("user_id"),
+        Users.oauth_id.label("oauth_id"),
+        Users.name.label("name"),
+        Users.team_id.label("team_id"),
+        Users.bracket_id.label("bracket_id"),
+        Brackets.name.label("bracket_name"),
+    ]
+    return _build_standings(Users, "user_id", columns, count, bracket_id, admin, fields)
+
+
+@namespaced("standings")
+@cache.memoize(timeout=60)
+def get_team_places(admin=False):
+    """
+    Get a dict of team IDs to their place in get_team_standings so that looking
+    up a single team's place doesn't scan the scoreboard.
+    """
+    standings = get_team_standings(admin=admin)
+    return {team.team_id: place for place, team in enumerate(standings, start=1)}
 
-    if count is None:
-        standings = standings_query.all()
-    else:
-        standings = standings_query.limit(count).all()
 
-    return standings
+@namespaced("standings")
+@cache.memoize(timeout=60)
+def get_user_places(admin=False):
+    """
+    Get a dict of user IDs to their place in get_user_standings so that looking
+    up a single user's place doesn't scan the scoreboard.
+    """
+    standings = get_user_standings(admin=admin)
+    return {user.user_id: place for place, user in enumerate(standings, start=1)}
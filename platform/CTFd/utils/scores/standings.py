@@ -0,0 +1,321 @@
+import bisect
+import threading
+import time
+import uuid
+
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import union_all
+
+from CTFd.cache import cache
+from CTFd.models import Awards, Challenges, Solves, Teams, Users, db
+
+EPOCH_KEY = "standings:epoch"
+GENERATION_KEY = "standings:generation"
+EVENT_KEY = "standings:event:%s"
+
+# Events are kept long enough for any worker that serves a request in between
+# to catch up. A worker that falls further behind rebuilds its boards instead.
+EVENT_TIMEOUT = 60 * 60
+MAX_EVENTS = 500
+
+# Boards are rebuilt from the database this often regardless of events as a
+# safety net for changes that didn't go through the ORM
+BOARD_TIMEOUT = 10 * 60
+
+# Bulk updates and deletes of these tables can change scores in ways that
+# can't be tracked per account (e.g. through cascading deletes)
+REBUILD_TABLES = {"submissions", "solves", "awards", "challenges", "users", "teams"}
+
+
+class Standing(tuple):
+    """
+    A row of the standings. Like the SQLAlchemy rows it replaces it can be
+    accessed by index or by column name.
+    """
+
+    def __new__(cls, keys, values):
+        row = super(Standing, cls).__new__(cls, values)
+        row._keys = keys
+        return row
+
+    def __getnewargs__(self):
+        return (self._keys, tuple(self))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[self._keys.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+    @property
+    def _fields(self):
+        return self._keys
+
+    def _asdict(self):
+        return dict(zip(self._keys, self))
+
+
+def _execute(statement):
+    # Boards outlive the request that builds them so they are read on their own
+    # connection, outside of a transaction that may have started before the
+    # changes we were told about were committed. SQLite has no such snapshots
+    # and in-memory databases can't have a second connection.
+    if db.engine.dialect.name == "sqlite":
+        return db.session.execute(statement).all()
+    with db.engine.connect() as conn:
+        return conn.execute(statement).all()
+
+
+def get_aggregates(column, freeze=None, account_ids=None):
+    """
+    Sum the value of an account's solves and awards and get the ID and date of
+    its latest one, which break ties. `column` is either "user_id" or "team_id".
+
+    Returns a dict of account ID to a (score, id, date) tuple.
+    """
+    solve_column = getattr(Solves, column)
+    award_column = getattr(Awards, column)
+
+    scores = (
+        db.session.query(
+            solve_column.label("account_id"),
+            db.func.sum(Challenges.value).label("score"),
+            db.func.max(Solves.id).label("id"),
+            db.func.max(Solves.date).label("date"),
+        )
+        .join(Challenges)
+        .filter(Challenges.value != 0)
+        .group_by(solve_column)
+    )
+
+    awards = (
+        db.session.query(
+            award_column.label("account_id"),
+            db.func.sum(Awards.value).label("score"),
+            db.func.max(Awards.id).label("id"),
+            db.func.max(Awards.date).label("date"),
+        )
+        .filter(Awards.value != 0)
+        .group_by(award_column)
+    )
+
+    if freeze is not None:
+        scores = scores.filter(Solves.date < freeze)
+        awards = awards.filter(Awards.date < freeze)
+
+    if account_ids is not None:
+        scores = scores.filter(solve_column.in_(account_ids))
+        awards = awards.filter(award_column.in_(account_ids))
+
+    results = union_all(scores, awards).alias("results")
+    sumscores = db.session.query(
+        results.columns.account_id,
+        db.func.sum(results.columns.score).label("score"),
+        db.func.max(results.columns.id).label("id"),
+        db.func.max(results.columns.date).label("date"),
+    ).group_by(results.columns.account_id)
+
+    return {
+        account_id: (int(score), id_, date)
+        for account_id, score, id_, date in _execute(sumscores.statement)
+        if account_id is not None
+    }
+
+
+class Board(object):
+    """
+    Accounts ordered by score (desc), date of their latest solve or award (asc)
+    and its ID (asc), which is the order of the scoreboard.
+    """
+
+    def __init__(self, column, freeze=None):
+        self.column = column
+        self.freeze = freeze
+        self.entries = {}
+        self.order = []
+        self.loaded_at = None
+
+    @staticmethod
+    def sort_key(account_id, aggregate):
+        score, id_, date = aggregate
+        return (-score, date, id_, account_id)
+
+    def load(self):
+        self.loaded_at = time.monotonic()
+        self.entries = get_aggregates(self.column, freeze=self.freeze)
+        self.order = sorted(
+            self.sort_key(account_id, aggregate)
+            for account_id, aggregate in self.entries.items()
+        )
+
+    def refresh(self, account_ids):
+        account_ids = list(account_ids)
+        if not account_ids:
+            return
+        aggregates = get_aggregates(
+            self.column, freeze=self.freeze, account_ids=account_ids
+        )
+        for account_id in account_ids:
+            self.update(account_id, aggregates.get(account_id))
+
+    def update(self, account_id, aggregate):
+        previous = self.entries.pop(account_id, None)
+        if previous is not None:
+            key = self.sort_key(account_id, previous)
+            i = bisect.bisect_left(self.order, key)
+            if i < len(self.order) and self.order[i] == key:
+                del self.order[i]
+        if aggregate is not None:
+            self.entries[account_id] = aggregate
+            bisect.insort(self.order, self.sort_key(account_id, aggregate))
+
+    def ranked(self):
+        """
+        Return a list of (account_id, score) tuples in scoreboard order
+        """
+        return [(key[3], -key[0]) for key in self.order]
+
+
+class StandingsIndex(object):
+    """
+    Per-process scoreboards kept up to date from the solve and award events
+    that every worker publishes to the shared cache. Reads only refresh the
+    accounts named by new events instead of aggregating all solves again.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.epoch = None
+        self.generation = 0
+        self.boards = {}
+
+    def reset(self, epoch, generation):
+        self.epoch = epoch
+        self.generation = generation
+        self.boards = {}
+
+    def sync(self):
+        epoch, generation = cache.get_many(EPOCH_KEY, GENERATION_KEY)
+        if epoch is None or generation is None:
+            # The cache was flushed (or never set up) so anything could have changed
+            epoch = uuid.uuid4().hex
+            generation = 0
+            cache.set_many({EPOCH_KEY: epoch, GENERATION_KEY: generation}, timeout=0)
+        generation = int(generation)
+
+        if (
+            epoch != self.epoch
+            or generation < self.generation
+            or generation - self.generation > MAX_EVENTS
+        ):
+            self.reset(epoch, generation)
+            return
+
+        if generation == self.generation:
+            return
+
+        keys = [EVENT_KEY % n for n in range(self.generation + 1, generation + 1)]
+        events = cache.get_many(*keys)
+        if any(e is None or e.get("rebuild") for e in events):
+            self.reset(epoch, generation)
+            return
+
+        accounts = {"user_id": set(), "team_id": set()}
+        for e in events:
+            for column, ids in accounts.items():
+                ids.update(e.get(column, ()))
+        for board in self.boards.values():
+            board.refresh(accounts[board.column])
+        self.generation = generation
+
+    def ranked(self, column, freeze=None):
+        with self.lock:
+            self.sync()
+            board = self.boards.get((column, freeze))
+            if board is None or time.monotonic() - board.loaded_at > BOARD_TIMEOUT:
+                board = Board(column, freeze=freeze)
+                board.load()
+                self.boards[(column, freeze)] = board
+            return board.ranked()
+
+
+standings_index = StandingsIndex()
+
+
+def publish_standings_event(user_ids=(), team_ids=(), rebuild=False):
+    """
+    Tell every worker which accounts' scores changed or that they all might have
+    """
+    if cache.get(EPOCH_KEY) is None:
+        # No worker has built its boards against the current cache yet
+        return
+    # Cache backends without an atomic increment (e.g. filesystem) may lose an
+    # event to a concurrent writer until the boards are next rebuilt
+    generation = cache.cache.inc(GENERATION_KEY)
+    if rebuild:
+        e = {"rebuild": True}
+    else:
+        e = {"user_id": sorted(set(user_ids)), "team_id": sorted(set(team_ids))}
+    cache.set(EVENT_KEY % generation, e, timeout=EVENT_TIMEOUT)
+
+
+def _pending(session):
+    return session.info.setdefault(
+        "standings_changes", {"user_id": set(), "team_id": set(), "rebuild": False}
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _track_score_changes(session, flush_context):
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, (Solves, Awards)):
+            pending = _pending(session)
+            pending["user_id"].add(obj.user_id)
+            pending["team_id"].add(obj.team_id)
+        elif isinstance(obj, Users) and obj in session.deleted:
+            # The database removes the user's solves and awards along with it
+            pending = _pending(session)
+            pending["user_id"].add(obj.id)
+            pending["team_id"].add(obj.team_id)
+        elif isinstance(obj, Teams) and obj in session.deleted:
+            _pending(session)["team_id"].add(obj.id)
+        elif isinstance(obj, Challenges):
+            if obj in session.dirty and not (
+                db.inspect(obj).attrs.value.history.has_changes()
+            ):
+                continue
+            # A challenge's value counts towards every account that solved it
+            _pending(session)["rebuild"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_delete or orm_execute_state.is_update:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in REBUILD_TABLES:
+            _pending(orm_execute_state.session)["rebuild"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_score_changes(session):
+    pending = session.info.pop("standings_changes", None)
+    if pending is None or not has_app_context():
+        return
+    if pending["rebuild"]:
+        publish_standings_event(rebuild=True)
+    else:
+        pending["user_id"].discard(None)
+        pending["team_id"].discard(None)
+        if pending["user_id"] or pending["team_id"]:
+            publish_standings_event(
+                user_ids=pending["user_id"], team_ids=pending["team_id"]
+            )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_score_changes(session):
+    session.info.pop("standings_changes", None)
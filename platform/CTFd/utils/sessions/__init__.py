@@ -1,5 +1,6 @@
 from uuid import uuid4
 
+from flask import has_request_context, request
 from flask.json.tag import TaggedJSONSerializer
 from flask.sessions import SessionInterface, SessionMixin
 from itsdangerous import BadSignature, want_bytes
@@ -9,6 +10,10 @@ from CTFd.cache import cache
 from CTFd.utils import text_type
 from CTFd.utils.security.signing import sign, unsign
 
+# Requests for static files don't use the session so it is neither loaded
+# from nor saved to the store for them
+STATIC_ENDPOINTS = ("views.themes", "views.themes_beta")
+
 
 def total_seconds(td):
     return td.days * 60 * 60 * 24 + td.seconds
@@ -19,115 +24,250 @@ class CachedSession(CallbackDict, SessionMixin):
     This code is mostly based off of the ServerSideSession from Flask-Session.
 
     https://github.com/fengsp/flask-session/blob/master/flask_session/sessions.py#L37
+
+    The session is only loaded from the store when it is first accessed.
     """
 
-    def __init__(self, initial=None, sid=None, permanent=None):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, initial=None, sid=None, permanent=None, store=None):
         def on_update(self):
             self.modified = True
 
         CallbackDict.__init__(self, initial, on_update)
         self.sid = sid
+        self.store = store
+        self.loaded = store is None
+        self.static = False
+        self.ttl = None
         if permanent:
             self.permanent = permanent
         self.modified = False
 
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if has_request_context() and request.endpoint in STATIC_ENDPOINTS:
+            self.static = True
+            return
+        if self.sid is None:
+            return
+        val, ttl = self.store.load(self.sid)
+        if val is None:
+            return
+        try:
+            data = self.serializer.loads(val)
+        except Exception:
+            return
+        # Loading doesn't count as a modification
+        dict.update(self, data)
+        self.ttl = ttl
+
     def regenerate(self):
-        cache.delete(self.sid)
+        self.load()
+        if self.sid is not None and self.store is not None:
+            self.store.delete(self.sid)
 
         # Empty current sid and mark modified so the interface will give it a new one.
         self.sid = None
         self.modified = True
 
 
+def _loads_first(name):
+    method = getattr(CallbackDict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in (
+    "__contains__",
+    "__delitem__",
+    "__eq__",
+    "__getitem__",
+    "__iter__",
+    "__len__",
+    "__ne__",
+    "__repr__",
+    "__setitem__",
+    "clear",
+    "copy",
+    "get",
+    "items",
+    "keys",
+    "pop",
+    "popitem",
+    "setdefault",
+    "update",
+    "values",
+):
+    setattr(CachedSession, _name, _loads_first(_name))
+
+
+class SessionStore(object):
+    """
+    Stores sessions in the cache
+    """
+
+    def __init__(self, key_prefix):
+        self.key_prefix = key_prefix
+
+    def load(self, sid):
+        """
+        Load a session and how many seconds it will be stored for, if known
+        """
+        return cache.get(self.key_prefix + sid), None
+
+    def add(self, sid, value, timeout):
+        return cache.add(self.key_prefix + sid, value, timeout=timeout)
+
+    def set(self, sid, value, timeout):
+        cache.set(self.key_prefix + sid, value, timeout=timeout)
+
+    def touch(self, sid, timeout):
+        # The cache can't change a timeout without storing the value again
+        return False
+
+    def delete(self, sid):
+        cache.delete(self.key_prefix + sid)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Stores sessions in Redis, reading them along with their remaining time in
+    one round trip and allocating session IDs with SET NX
+    """
+
+    def __init__(self, key_prefix, client, prefix=""):
+        super().__init__(key_prefix)
+        self.client = client
+        self.prefix = prefix + key_prefix
+        # Serialized the same way as the cache so that stored sessions are kept
+        self.serializer = cache.cache.serializer
+
+    def load(self, sid):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self.prefix + sid)
+        pipe.ttl(self.prefix + sid)
+        value, ttl = pipe.execute()
+        return self.serializer.loads(value), ttl if ttl >= 0 else None
+
+    def add(self, sid, value, timeout):
+        return bool(
+            self.client.set(
+                self.prefix + sid, self.serializer.dumps(value), ex=timeout, nx=True
+            )
+        )
+
+    def touch(self, sid, timeout):
+        return bool(self.client.expire(self.prefix + sid, timeout))
+
+
 class CachingSessionInterface(SessionInterface):
     """
     This code is partially based off of the RedisSessionInterface from Flask-Session with updates to properly
     interoperate with Flask-Caching and be more inline with modern Flask (i.e. doesn't use pickle).
 
     https://github.com/fengsp/flask-session/blob/master/flask_session/sessions.py#L90
+
+    Sessions are loaded lazily, new session IDs are only allocated when a session is first saved and unchanged
+    sessions only have their timeout refreshed once half of it has passed.
     """
 
-    serializer = TaggedJSONSerializer()
     session_class = CachedSession
 
-    def _generate_sid(self):
-        sid = str(uuid4())
-        v = cache.get(key=self.key_prefix + sid)
-        while v:
-            sid = str(uuid4())
-            v = cache.get(key=self.key_prefix + sid)
-        return sid
-
     def __init__(self, key_prefix, use_signer=True, permanent=False):
         self.key_prefix = key_prefix
         self.use_signer = use_signer
         self.permanent = permanent
 
+    def get_store(self, app):
+        store = app.extensions.get("session_store")
+        if store is None:
+            if app.config.get("CACHE_TYPE") == "redis":
+                store = RedisSessionStore(
+                    self.key_prefix,
+                    cache.cache._write_client,
+                    prefix=cache.cache.key_prefix or "",
+                )
+            else:
+                store = SessionStore(self.key_prefix)
+            app.extensions["session_store"] = store
+        return store
+
     def open_session(self, app, request):
+        store = self.get_store(app)
         sid = request.cookies.get(app.session_cookie_name)
         if not sid:
-            sid = self._generate_sid()
-            return self.session_class(sid=sid, permanent=self.permanent)
+            return self.session_class(permanent=self.permanent, store=store)
 
         if self.use_signer:
             try:
                 sid_as_bytes = unsign(sid)
                 sid = sid_as_bytes.decode()
             except BadSignature:
-                sid = self._generate_sid()
-                return self.session_class(sid=sid, permanent=self.permanent)
+                return self.session_class(permanent=self.permanent, store=store)
 
         if isinstance(sid, text_type) is False:
             sid = sid.decode("utf-8", "strict")
-        val = cache.get(self.key_prefix + sid)
-        if val is not None:
-            try:
-                data = self.serializer.loads(val)
-                return self.session_class(data, sid=sid)
-            except Exception:
-                return self.session_class(sid=sid, permanent=self.permanent)
-        return self.session_class(sid=sid, permanent=self.permanent)
+        return self.session_class(sid=sid, permanent=self.permanent, store=store)
 
     def save_session(self, app, session, response):
+        # Sessions that were never accessed can't have changed
+        if not session.loaded or session.static:
+            return
+
         domain = self.get_cookie_domain(app)
         path = self.get_cookie_path(app)
+        store = self.get_store(app)
+        timeout = total_seconds(app.permanent_session_lifetime)
 
         if not session:
             if session.modified:
-                cache.delete(self.key_prefix + session.sid)
+                if session.sid is not None:
+                    store.delete(session.sid)
                 response.delete_cookie(
                     app.session_cookie_name, domain=domain, path=path
                 )
             return
 
         if session.modified:
-            httponly = self.get_cookie_httponly(app)
-            secure = self.get_cookie_secure(app)
-            expires = self.get_expiration_time(app, session)
-            samesite = self.get_cookie_samesite(app)
-            val = self.serializer.dumps(dict(session))
-
+            val = session.serializer.dumps(dict(session))
             if session.sid is None:
-                session.sid = self._generate_sid()
+                session.sid = str(uuid4())
+                while not store.add(session.sid, val, timeout):
+                    session.sid = str(uuid4())
+            else:
+                store.set(session.sid, val, timeout)
+        # Unchanged sessions only have their timeout refreshed, without being
+        # stored again, once it is half over
+        elif session.ttl is None or session.ttl > timeout / 2:
+            return
+        elif not store.touch(session.sid, timeout):
+            return
 
-            cache.set(
-                key=self.key_prefix + session.sid,
-                value=val,
-                timeout=total_seconds(app.permanent_session_lifetime),
-            )
+        httponly = self.get_cookie_httponly(app)
+        secure = self.get_cookie_secure(app)
+        expires = self.get_expiration_time(app, session)
+        samesite = self.get_cookie_samesite(app)
 
-            if self.use_signer:
-                session_id = sign(want_bytes(session.sid))
-            else:
-                session_id = session.sid
-
-            response.set_cookie(
-                app.session_cookie_name,
-                session_id,
-                expires=expires,
-                httponly=httponly,
-                domain=domain,
-                path=path,
-                secure=secure,
-                samesite=samesite,
-            )
+        if self.use_signer:
+            session_id = sign(want_bytes(session.sid))
+        else:
+            session_id = session.sid
+
+        response.set_cookie(
+            app.session_cookie_name,
+            session_id,
+            expires=expires,
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
@@ -0,0 +1,103 @@
+import datetime
+import logging
+import threading
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from CTFd.cache import clear_user_recent_ips
+from CTFd.models import Tracking, Users, db
+
+
+class TrackingBuffer(object):
+    """
+    Collects the last time each user was seen from each IP and writes them to
+    the Tracking table in bulk from a background thread, so that requests
+    don't write to the database to track users.
+    """
+
+    def __init__(self, app, interval=5):
+        self.app = app
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.started = False
+        self.stopped = threading.Event()
+
+    def start(self):
+        # A thread so that it also runs without gevent monkey patching, with
+        # which it becomes a greenlet
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def record(self, user_id, ip, date=None):
+        if date is None:
+            date = datetime.datetime.utcnow()
+        with self.lock:
+            self.pending[(user_id, ip)] = date
+        self.start()
+
+    def _work(self):
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    logging.getLogger("tracking").exception(
+                        "Failed to write tracking data"
+                    )
+                finally:
+                    db.session.remove()
+
+    def flush(self):
+        """
+        Write the buffered entries, updating a user's existing row for an IP
+        and inserting the rest
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        user_ids = {user_id for user_id, _ in pending}
+        ips = {ip for _, ip in pending}
+        # Users deleted since they were seen no longer have anything to track
+        existing_users = {
+            user_id
+            for (user_id,) in Users.query.with_entities(Users.id).filter(
+                Users.id.in_(user_ids)
+            )
+        }
+        rows = {}
+        for track_id, user_id, ip in (
+            Tracking.query.with_entities(Tracking.id, Tracking.user_id, Tracking.ip)
+            .filter(Tracking.user_id.in_(user_ids), Tracking.ip.in_(ips))
+            .order_by(Tracking.id.asc())
+        ):
+            rows.setdefault((user_id, ip), track_id)
+
+        updates = []
+        inserts = []
+        for (user_id, ip), date in pending.items():
+            if user_id not in existing_users:
+                continue
+            track_id = rows.get((user_id, ip))
+            if track_id is None:
+                inserts.append({"user_id": user_id, "ip": ip, "date": date})
+            else:
+                updates.append({"id": track_id, "date": date})
+
+        try:
+            if updates:
+                db.session.bulk_update_mappings(Tracking, updates)
+            if inserts:
+                db.session.bulk_insert_mappings(Tracking, inserts)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+        for user_id in existing_users:
+            clear_user_recent_ips(user_id=user_id)
+        return len(updates) + len(inserts)
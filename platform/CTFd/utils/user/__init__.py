@@ -1,16 +1,18 @@
 import datetime  # noqa: I001
 import re
+from functools import cached_property
 
 from flask import abort
 from flask import current_app as app
-from flask import redirect, request, session, url_for
+from flask import g, redirect, request, session, url_for
 
-from CTFd.cache import cache, clear_user_session
+from CTFd.cache import cache, clear_user_session, local_memoize, namespaced
 from CTFd.constants.languages import Languages
 from CTFd.constants.teams import TeamAttrs
 from CTFd.constants.users import UserAttrs
-from CTFd.models import Fails, Teams, Tracking, Users, db
-from CTFd.utils import get_config
+from CTFd.models import Teams, Tracking, Users
+from CTFd.utils import get_config, get_import_in_progress
+from CTFd.utils.counters import count_account_fails
 from CTFd.utils.security.auth import logout_user
 from CTFd.utils.security.signing import hmac
 
@@ -35,17 +37,66 @@ def get_current_user():
         return None
 
 
-def get_current_user_attrs():
-    if authed():
+class RequestIdentity(object):
+    """
+    Who the current request is from. Each part is looked up at most once per
+    request and the identity is dropped when the user or team is cleared from
+    the cache.
+    """
+
+    def __init__(self, req, user_id):
+        self.request = req
+        self.user_id = user_id
+
+    @cached_property
+    def user(self):
+        if not self.user_id:
+            return None
         try:
-            return get_user_attrs(user_id=session["id"])
+            return get_user_attrs(user_id=self.user_id)
         except TypeError:
-            clear_user_session(user_id=session["id"])
-            return get_user_attrs(user_id=session["id"])
+            clear_user_session(user_id=self.user_id)
+            return get_user_attrs(user_id=self.user_id)
+
+    @cached_property
+    def team(self):
+        user = self.user
+        if user and user.team_id:
+            return get_team_attrs(team_id=user.team_id)
+        return None
+
+    @cached_property
+    def ip(self):
+        return get_ip(req=self.request)
+
+    @cached_property
+    def import_in_progress(self):
+        return get_import_in_progress()
+
+
+def get_identity():
+    """
+    Get the identity of the current request
+    """
+    req = request._get_current_object()
+    user_id = session.get("id")
+    identity = g.get("identity")
+    # The app context (and so g) can outlive a request and users can log in or
+    # out in the middle of one
+    if identity is None or identity.request is not req or identity.user_id != user_id:
+        identity = g.identity = RequestIdentity(req, user_id)
+    return identity
+
+
+def get_current_user_attrs():
+    if authed():
+        return get_identity().user
     else:
         return None
 
 
+@local_memoize()
+@namespaced("users")
 @cache.memoize(timeout=300)
 def get_user_attrs(user_id):
     user = Users.query.filter_by(id=user_id).first()
@@ -57,6 +108,7 @@ def get_user_attrs(user_id):
     return None
 
 
+@namespaced("standings", "users")
 @cache.memoize(timeout=300)
 def get_user_place(user_id):
     user = Users.query.filter_by(id=user_id).first()
@@ -65,6 +117,7 @@ def get_user_place(user_id):
     return None
 
 
+@namespaced("standings", "users")
 @cache.memoize(timeout=300)
 def get_user_score(user_id):
     user = Users.query.filter_by(id=user_id).first()
@@ -73,6 +126,7 @@ def get_user_score(user_id):
     return None
 
 
+@namespaced("standings", "teams")
 @cache.memoize(timeout=300)
 def get_team_place(team_id):
     team = Teams.query.filter_by(id=team_id).first()
@@ -81,6 +135,7 @@ def get_team_place(team_id):
     return None
 
 
+@namespaced("standings", "teams")
 @cache.memoize(timeout=300)
 def get_team_score(team_id):
     team = Teams.query.filter_by(id=team_id).first()
@@ -99,16 +154,12 @@ def get_current_team():
 
 def get_current_team_attrs():
     if authed():
-        try:
-            user = get_user_attrs(user_id=session["id"])
-        except TypeError:
-            clear_user_session(user_id=session["id"])
-            user = get_user_attrs(user_id=session["id"])
-        if user and user.team_id:
-            return get_team_attrs(team_id=user.team_id)
+        return get_identity().team
     return None
 
 
+@local_memoize()
+@namespaced("teams")
 @cache.memoize(timeout=300)
 def get_team_attrs(team_id):
     team = Teams.query.filter_by(id=team_id).first()
@@ -120,6 +171,15 @@ def get_team_attrs(team_id):
     return None
 
 
+def get_account_user_ids(user, team=None):
+    """
+    Return the IDs of the users sharing an account's solves and submissions
+    """
+    if team is not None:
+        return [member.id for member in team.members]
+    return [user.id]
+
+
 def get_current_user_type(fallback=None):
     if authed():
         user = get_current_user_attrs()
@@ -166,7 +226,7 @@ def get_ip(req=None):
     more than that if you do not know what you're doing.
     """
     if req is None:
-        req = request
+        return get_identity().ip
     trusted_proxies = app.config["TRUSTED_PROXIES"]
     combined = "(" + ")|(".join(trusted_proxies) + ")"
     route = req.access_route + [req.remote_addr]
@@ -205,6 +265,7 @@ def get_current_user_recent_ips():
         return None
 
 
+@namespaced("users")
 @cache.memoize(timeout=300)
 def get_user_recent_ips(user_id):
     hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
@@ -223,10 +284,4 @@ def get_wrong_submissions_per_minute(account_id):
     :param account_id:
     :return:
     """
-    one_min_ago = datetime.datetime.utcnow() + datetime.timedelta(minutes=-1)
-    fails = (
-        db.session.query(Fails)
-        .filter(Fails.account_id == account_id, Fails.date >= one_min_ago)
-        .all()
-    )
-    return len(fails)
+    return count_account_fails(account_id, seconds=60)
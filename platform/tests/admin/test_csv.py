@@ -1,8 +1,18 @@
+import csv
 import io
 
-from CTFd.models import Challenges, Flags, Hints, Teams, Users
+from CTFd.models import Challenges, Flags, Hints, Teams, UserFieldEntries, Users
 from CTFd.utils.crypto import verify_password
-from tests.helpers import create_ctfd, destroy_ctfd, gen_challenge, login_as_user
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_award,
+    gen_challenge,
+    gen_field,
+    gen_solve,
+    gen_team,
+    login_as_user,
+)
 
 
 def test_export_csv_works():
@@ -20,6 +30,34 @@ def test_export_csv_works():
     destroy_ctfd(app)
 
 
+def test_export_scoreboard_csv_streams_rows():
+    """Test that the scoreboard CSV is streamed with team members and their scores"""
+    app = create_ctfd(user_mode="teams")
+    with app.app_context():
+        gen_challenge(app.db)
+        gen_field(app.db, name="student id", type="user")
+        team = gen_team(app.db, member_count=2)
+        team_id, team_name = team.id, team.name
+        member_ids = [member.id for member in team.members]
+        app.db.session.add(
+            UserFieldEntries(user_id=member_ids[0], field_id=1, value="1234")
+        )
+        app.db.session.commit()
+        gen_solve(app.db, user_id=member_ids[1], team_id=team_id, challenge_id=1)
+        gen_award(app.db, user_id=member_ids[0], team_id=team_id, value=5)
+
+        client = login_as_user(app, name="admin", password="password")
+        r = client.get("/admin/export/csv?table=scoreboard")
+        assert r.is_streamed
+        rows = list(csv.reader(io.StringIO(r.get_data(as_text=True))))
+        assert rows[0][-1] == "student id"
+        assert rows[1][:4] == ["1", team_name, str(team_id), "105"]
+        assert [row[5] for row in rows[2:]] == [str(i) for i in member_ids]
+        assert [row[7] for row in rows[2:]] == ["5", "100"]
+        assert [row[-1] for row in rows[2:]] == ["1234", ""]
+    destroy_ctfd(app)
+
+
 def test_import_csv_works():
     """Test that CSV imports work properly"""
     USERS_CSV = b"""name,email,password
@@ -94,7 +132,6 @@ challenge1,category1,description1,100,"flag1,flag2,flag3","tag1,tag2,tag3","hint
 
 
 def test_import_challenge_csv_with_json():
-
     CHALLENGES_CSV = b'''name,category,description,value,flags,tags,hints
 challenge1,category1,description1,100,"[{""type"": ""static"", ""content"": ""flag1"", ""data"": ""case_insensitive""}, {""type"": ""regex"", ""content"": ""(.*)"", ""data"": ""case_insensitive""}, {""type"": ""static"", ""content"": ""flag3""}]","tag1,tag2,tag3","[{""content"": ""hint1"", ""cost"": 10}, {""content"": ""hint2"", ""cost"": 20}, {""content"": ""hint3"", ""cost"": 30}]"'''
 
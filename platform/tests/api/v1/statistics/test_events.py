@@ -0,0 +1,23 @@
+from tests.helpers import create_ctfd, destroy_ctfd, login_as_user, register_user
+
+
+def test_api_statistics_events():
+    """Test that admins can see the event stream statistics of a worker"""
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        events = app.events_manager.subscribe(user_id=2)
+        next(events)
+
+        with login_as_user(app) as client:
+            r = client.get("/api/v1/statistics/events")
+            assert r.status_code == 302
+
+        with login_as_user(app, name="admin", password="password") as client:
+            r = client.get("/api/v1/statistics/events")
+            data = r.get_json()["data"]
+            assert data["clients"] == 1
+            assert data["users"] == 1
+            assert data["published"] == 0
+        events.close()
+    destroy_ctfd(app)
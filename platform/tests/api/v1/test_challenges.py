@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from unittest.mock import patch
+
 from freezegun import freeze_time
 
-from CTFd.models import Challenges, Flags, Hints, Solves, Tags, Users
+from CTFd.models import Challenges, Fails, Flags, Hints, Solves, Tags, Users
+from CTFd.plugins.challenges import ChallengeResponse, CTFdStandardChallenge
 from CTFd.utils import set_config
 from tests.helpers import (
     create_ctfd,
@@ -1031,6 +1034,57 @@ def test_api_challenge_attempt_post_admin():
     destroy_ctfd(app)
 
 
+def test_api_challenge_attempt_post_plugin_ratelimited():
+    """A ratelimited challenge plugin response is returned without recording a fail"""
+    app = create_ctfd()
+    with app.app_context():
+        challenge_id = gen_challenge(app.db).id
+        gen_flag(app.db, challenge_id)
+        register_user(app)
+        busy = ChallengeResponse(status="ratelimited", message="Judge is busy")
+        with login_as_user(app) as client:
+            with patch.object(CTFdStandardChallenge, "attempt", return_value=busy):
+                r = client.post(
+                    "/api/v1/challenges/attempt",
+                    json={"challenge_id": challenge_id, "submission": "flag"},
+                )
+            assert r.status_code == 429
+            assert r.get_json()["data"] == {
+                "status": "ratelimited",
+                "message": "Judge is busy",
+            }
+            assert Fails.query.count() == 0
+            assert Solves.query.count() == 0
+    destroy_ctfd(app)
+
+
+def test_api_challenge_attempt_post_plugin_queued():
+    """A queued challenge plugin response returns 202 with the plugin's extra data"""
+    app = create_ctfd()
+    with app.app_context():
+        challenge_id = gen_challenge(app.db).id
+        gen_flag(app.db, challenge_id)
+        register_user(app)
+        queued = ChallengeResponse(
+            status="queued", message="Judging", data={"job_id": "abc"}
+        )
+        with login_as_user(app) as client:
+            with patch.object(CTFdStandardChallenge, "attempt", return_value=queued):
+                r = client.post(
+                    "/api/v1/challenges/attempt",
+                    json={"challenge_id": challenge_id, "submission": "flag"},
+                )
+            assert r.status_code == 202
+            assert r.get_json()["data"] == {
+                "status": "queued",
+                "message": "Judging",
+                "job_id": "abc",
+            }
+            assert Fails.query.count() == 0
+            assert Solves.query.count() == 0
+    destroy_ctfd(app)
+
+
 def test_api_challenge_get_solves_visibility_public():
     """Can a public user get /api/v1/challenges/<challenge_id>/solves if challenge_visibility is private/public"""
     app = create_ctfd()
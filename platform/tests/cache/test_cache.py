@@ -1,11 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from CTFd.cache import clear_all_user_sessions, clear_user_session
+from unittest.mock import patch
+
+from CTFd.cache import (
+    cache,
+    clear_all_user_sessions,
+    clear_challenges,
+    clear_namespace,
+    clear_user_session,
+    get_local_cache,
+    get_memoize_stats,
+    get_namespace_generations,
+    local_memoize,
+    namespaced,
+    stale_memoize,
+)
 from CTFd.models import Users
-from CTFd.utils.security.auth import login_user
-from CTFd.utils.user import get_current_user, is_admin
-from tests.helpers import create_ctfd, destroy_ctfd, register_user
+from CTFd.utils import import_in_progress
+from CTFd.utils.security.auth import login_user, logout_user
+from CTFd.utils.user import (
+    get_current_user,
+    get_current_user_attrs,
+    get_identity,
+    is_admin,
+)
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_challenge,
+    login_as_user,
+    register_user,
+)
 
 
 def test_clear_user_session():
@@ -64,3 +90,211 @@ def test_clear_all_user_sessions():
             # Should now return True after clearing cache
             assert is_admin() is True
     destroy_ctfd(app)
+
+
+def test_stale_memoize():
+    """Test that stale_memoize serves the old value while another caller recomputes it"""
+    app = create_ctfd()
+    with app.app_context():
+        calls = []
+
+        @stale_memoize(timeout=60)
+        def compute(x):
+            calls.append(x)
+            return len(calls)
+
+        assert compute(1) == 1
+        assert compute(1) == 1
+        assert compute.stats["misses"] == 1
+        assert compute.stats["hits"] == 1
+
+        # Deleting the value makes the next caller recompute it
+        cache.delete_memoized(compute, 1)
+        assert compute(1) == 2
+        cache.delete_memoized(compute)
+        assert compute(1) == 3
+        assert compute.stats["recomputes"] == 3
+
+        # Other callers get the old value while one holds the recompute lock
+        cache.delete_memoized(compute)
+        key = compute.make_cache_key(compute.uncached, 1)
+        cache.add("lock/" + key, "other", timeout=60)
+        assert compute(1) == 3
+        assert compute.stats["stale"] == 1
+        cache.delete("lock/" + key)
+        assert compute(1) == 4
+        assert len(calls) == 4
+
+        stats = get_memoize_stats()
+        assert stats[compute.__module__ + "." + compute.__qualname__]["recomputes"] == 4
+    destroy_ctfd(app)
+
+
+def test_api_statistics_cache():
+    """Test that admins can see the memoize counters of a worker"""
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        with login_as_user(app) as client:
+            r = client.get("/api/v1/statistics/cache")
+            assert r.status_code == 302
+
+        with login_as_user(app, name="admin", password="password") as client:
+            client.get("/api/v1/challenges")
+            r = client.get("/api/v1/statistics/cache")
+            data = r.get_json()["data"]
+            stats = data["CTFd.utils.challenges.get_all_challenges"]
+            assert stats["recomputes"] >= 1
+    destroy_ctfd(app)
+
+
+def test_cache_namespaces():
+    """Test that clearing a cache namespace clears every function in it"""
+    app = create_ctfd()
+    with app.app_context():
+        calls = []
+
+        @namespaced("test")
+        @cache.memoize()
+        def compute(x):
+            calls.append(x)
+            return len(calls)
+
+        @namespaced("test", "other")
+        @stale_memoize()
+        def compute_stale(x):
+            calls.append(x)
+            return len(calls)
+
+        assert compute(1) == 1
+        assert compute(2) == 2
+        assert compute_stale(1) == 3
+        assert (compute(1), compute(2), compute_stale(1)) == (1, 2, 3)
+
+        (generation,) = get_namespace_generations("test")
+        clear_namespace("test")
+        assert get_namespace_generations("test") == [generation + 1]
+        assert (compute(1), compute(2), compute_stale(1)) == (4, 5, 6)
+
+        clear_namespace("other")
+        assert (compute(1), compute(2), compute_stale(1)) == (4, 5, 7)
+
+        # Values can still be deleted one at a time
+        cache.delete_memoized(compute, 2)
+        assert (compute(1), compute(2)) == (4, 8)
+
+        # Generations that were lost don't restart from one used before
+        for _ in range(20):
+            (generation,) = get_namespace_generations("test")
+            cache.cache.clear()
+            clear_namespace("test")
+            assert get_namespace_generations("test") != [generation]
+    destroy_ctfd(app)
+
+
+def test_local_memoize():
+    """Test that local_memoize keeps values in process and drops them when they're cleared"""
+    app = create_ctfd()
+    with app.app_context():
+        calls = []
+
+        @local_memoize()
+        @namespaced("test")
+        @cache.memoize()
+        def compute(x):
+            calls.append(x)
+            return len(calls)
+
+        assert compute(1) == 1
+        assert compute(x=1) == 1
+        name = compute.local_name
+        assert get_memoize_stats()[name]["local_hit_ratio"] == 0.5
+
+        # Values are served from the process even if the shared cache lost them
+        cache.cache.clear()
+        assert compute(1) == 1
+
+        cache.delete_memoized(compute, 1)
+        assert compute(1) == 2
+        cache.delete_memoized(compute)
+        assert compute(1) == 3
+        clear_namespace("test")
+        assert compute(1) == 4
+
+        # Invalidations from other workers
+        local = get_local_cache()
+        key = local.make_key(compute.uncached, 1)
+        assert local.get(name, key) == (True, 4)
+        local.apply(function=name, key=key)
+        assert local.get(name, key) == (False, None)
+        assert compute(1) == 4
+        local.apply(namespace="test")
+        assert local.get(name, key) == (False, None)
+        assert compute(1) == 4
+        local.apply()
+        assert local.get(name, key) == (False, None)
+
+        # Values read before an invalidation aren't kept
+        version = local.version
+        local.apply(function=name)
+        local.set(name, "stale", 0, version, 30, 10)
+        assert local.get(name, "stale") == (False, None)
+    destroy_ctfd(app)
+
+
+def test_local_memoize_skips_stale_values():
+    """Test that old values served while another worker recomputes them aren't kept in process"""
+    app = create_ctfd()
+    with app.app_context():
+        from CTFd.utils.challenges import get_all_challenges
+
+        gen_challenge(app.db)
+        assert len(get_all_challenges()) == 1
+        gen_challenge(app.db)
+        clear_challenges()
+
+        add = cache.add
+
+        def add_without_locks(key, *args, **kwargs):
+            # Another worker holds every recompute lock
+            if key.startswith("lock/"):
+                return False
+            return add(key, *args, **kwargs)
+
+        with patch.object(cache, "add", side_effect=add_without_locks):
+            assert len(get_all_challenges()) == 1
+        assert len(get_all_challenges()) == 2
+    destroy_ctfd(app)
+
+
+def test_request_identity():
+    """Test that the current user and team are looked up once per request"""
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        user = Users.query.filter_by(id=2).first()
+        with app.test_request_context("/"):
+            login_user(user)
+            identity = get_identity()
+            assert get_current_user_attrs() is identity.user
+            assert is_admin() is False
+            assert get_identity() is identity
+
+            # The import status is only checked once per request
+            assert import_in_progress() is False
+            cache.set("import_status", "started")
+            assert import_in_progress() is False
+
+            # Clearing the user drops the identity
+            clear_user_session(user_id=2)
+            assert get_identity() is not identity
+            assert import_in_progress() is True
+            cache.delete("import_status")
+
+            logout_user()
+            assert get_current_user_attrs() is None
+            assert get_identity().user is None
+
+        with app.test_request_context("/"):
+            assert get_identity() is not identity
+    destroy_ctfd(app)
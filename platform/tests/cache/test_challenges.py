@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from unittest.mock import patch
+
 from CTFd.models import Users
+from CTFd.utils import set_config
 from tests.helpers import (
     create_ctfd,
     destroy_ctfd,
+    gen_challenge,
+    gen_flag,
     login_as_user,
     register_user,
     simulate_user_activity,
@@ -126,3 +131,66 @@ def test_deleting_solve_clears_cache():
             assert len(solves) == 0
             assert solve_counts.get(1) is None
     destroy_ctfd(app)
+
+
+def test_wrong_submission_only_clears_submitter_history():
+    """
+    Test that a wrong answer refreshes the submitter's submission history
+    without clearing the standings or challenge caches
+    """
+    app = create_ctfd()
+    with app.app_context():
+        set_config("view_self_submissions", True)
+        chal_id = gen_challenge(app.db).id
+        gen_flag(app.db, challenge_id=chal_id, content="flag")
+        register_user(app)
+        with login_as_user(app) as client:
+            r = client.get(f"/api/v1/users/me/submissions?challenge_id={chal_id}")
+            assert r.get_json()["meta"]["count"] == 0
+
+            with patch("CTFd.api.v1.challenges.clear_standings") as standings, patch(
+                "CTFd.api.v1.challenges.clear_challenges"
+            ) as challenges:
+                r = client.post(
+                    "/api/v1/challenges/attempt",
+                    json={"challenge_id": chal_id, "submission": "wrong"},
+                )
+                assert r.get_json()["data"]["status"] == "incorrect"
+            standings.assert_not_called()
+            challenges.assert_not_called()
+
+            r = client.get(f"/api/v1/users/me/submissions?challenge_id={chal_id}")
+            assert r.get_json()["meta"]["count"] == 1
+    destroy_ctfd(app)
+
+
+def test_correct_submission_clears_affected_solve_caches():
+    """
+    Test that a solve refreshes solve counts and the solver's solved challenges
+    """
+    app = create_ctfd()
+    with app.app_context():
+        chal_id = gen_challenge(app.db).id
+        gen_flag(app.db, challenge_id=chal_id, content="flag")
+        register_user(app)
+        with login_as_user(app) as client:
+            challenge = client.get("/api/v1/challenges").get_json()["data"][0]
+            assert challenge["solves"] == 0
+            assert challenge["solved_by_me"] is False
+            r = client.get(f"/api/v1/challenges/{chal_id}/solves")
+            assert r.get_json()["data"] == []
+
+            r = client.post(
+                "/api/v1/challenges/attempt",
+                json={"challenge_id": chal_id, "submission": "flag"},
+            )
+            assert r.get_json()["data"]["status"] == "correct"
+
+            challenge = client.get("/api/v1/challenges").get_json()["data"][0]
+            assert challenge["solves"] == 1
+            assert challenge["solved_by_me"] is True
+            r = client.get(f"/api/v1/challenges/{chal_id}/solves")
+            assert len(r.get_json()["data"]) == 1
+            r = client.get(f"/api/v1/challenges/{chal_id}")
+            assert r.get_json()["data"]["solves"] == 1
+    destroy_ctfd(app)
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from freezegun import freeze_time
+
+from CTFd.plugins.challenges import CHALLENGE_CLASSES
+from CTFd.plugins.sql_challenges import SQLChallenge, SQLChallengeType, get_deadlines
+from tests.helpers import create_ctfd, destroy_ctfd, login_as_user, register_user
+
+
+def gen_sql_challenge(db, name="sql", deadline=None):
+    challenge = SQLChallenge(
+        name=name,
+        description="description",
+        value=100,
+        category="sql",
+        type="sql",
+        state="visible",
+        init_query="CREATE TABLE t (a INT)",
+        solution_query="SELECT * FROM t",
+        deadline=deadline,
+    )
+    db.session.add(challenge)
+    db.session.commit()
+    return challenge
+
+
+def test_get_deadlines_formats_kst_and_status():
+    """
+    Test that get_deadlines converts deadlines to KST and computes their status
+    """
+    app = create_ctfd()
+    with app.app_context():
+        expired = gen_sql_challenge(app.db, "expired", datetime(2025, 3, 9, 3, 0))
+        today = gen_sql_challenge(app.db, "today", datetime(2025, 3, 10, 14, 0))
+        active = gen_sql_challenge(app.db, "active", datetime(2025, 3, 20, 0, 0))
+        none = gen_sql_challenge(app.db, "none")
+
+        with freeze_time("2025-03-10 03:00:00"):
+            deadlines = get_deadlines([expired.id, today.id, active.id, none.id])
+        assert deadlines == {
+            expired.id: ("2025-03-09 12:00", "expired"),
+            today.id: ("2025-03-10 23:00", "today"),
+            active.id: ("2025-03-20 09:00", "active"),
+        }
+        assert get_deadlines([]) == {}
+    destroy_ctfd(app)
+
+
+def test_challenge_list_loads_deadlines_in_one_query():
+    """
+    Test that the challenge listing includes SQL deadlines without a query per challenge
+    """
+    app = create_ctfd()
+    with app.app_context():
+        deadline = datetime.utcnow() + timedelta(days=3)
+        for i in range(5):
+            gen_sql_challenge(app.db, f"sql{i}", deadline)
+        register_user(app)
+        with patch.dict(CHALLENGE_CLASSES, {"sql": SQLChallengeType}):
+            with login_as_user(app) as client, patch(
+                "CTFd.plugins.sql_challenges.get_deadlines", wraps=get_deadlines
+            ) as fake_get_deadlines:
+                data = client.get("/api/v1/challenges").get_json()["data"]
+
+        assert fake_get_deadlines.call_count == 1
+        assert len(data) == 5
+        for challenge in data:
+            assert challenge["deadline_status"] == "active"
+            assert challenge["deadline"] is not None
+    destroy_ctfd(app)
@@ -0,0 +1,179 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from flask import request
+
+from CTFd.models import Challenges, Fails, Solves, Users
+from CTFd.plugins.challenges import ChallengeResponse
+from CTFd.plugins.sql_challenges import SQLChallengeType
+from CTFd.plugins.sql_challenges.jobs import JobPending, JudgeJobQueue, get_job
+from CTFd.plugins.sql_challenges.judge import JudgeBusy
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_challenge,
+    gen_fail,
+    register_user,
+)
+
+
+def submit_job(app, jobs, submission="SELECT 1", challenge_id=1):
+    with app.test_request_context(
+        "/api/v1/challenges/attempt",
+        method="POST",
+        environ_base={"REMOTE_ADDR": "127.0.0.1"},
+    ):
+        challenge = Challenges.query.filter_by(id=challenge_id).first()
+        user = Users.query.filter_by(id=2).first()
+        return jobs.submit(
+            challenge, user=user, team=None, submission=submission, request=request
+        )
+
+
+def test_judge_job_records_solve_and_publishes_result():
+    """
+    Test that a queued job is judged, recorded as a Solve and announced to the user
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        gen_challenge(app.db)
+        jobs = JudgeJobQueue(app)
+        # Keep the workers from taking the job during the test
+        jobs.started = True
+        job_id = submit_job(app, jobs)
+        assert get_job(job_id)["status"] == "queued"
+
+        correct = ChallengeResponse(status="correct", message="Correct")
+        with patch.object(
+            SQLChallengeType, "judge", return_value=correct
+        ), patch.object(app.events_manager, "publish") as fake_publish:
+            result = jobs.run(jobs.queue.get_nowait())
+
+        assert result == {"status": "correct", "message": "Correct"}
+        assert Solves.query.filter_by(user_id=2, challenge_id=1).count() == 1
+        job = get_job(job_id)
+        assert job["status"] == "done"
+        assert job["user_id"] == 2
+        assert job["result"]["status"] == "correct"
+        event = fake_publish.call_args.kwargs
+        assert event["type"] == "sql_judge_result"
+        assert event["data"]["job_id"] == job_id
+        assert event["data"]["user_id"] == 2
+        assert event["user_id"] == 2
+        assert "message" not in event["data"]
+    destroy_ctfd(app)
+
+
+def test_judge_job_records_fail():
+    """
+    Test that an incorrect queued job is recorded as a Fail
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        gen_challenge(app.db)
+        jobs = JudgeJobQueue(app)
+        # Keep the workers from taking the job during the test
+        jobs.started = True
+        job_id = submit_job(app, jobs, submission="SELECT 2")
+
+        incorrect = ChallengeResponse(status="incorrect", message="Incorrect")
+        with patch.object(SQLChallengeType, "judge", return_value=incorrect):
+            jobs.run(jobs.queue.get_nowait())
+
+        fail = Fails.query.filter_by(user_id=2, challenge_id=1).one()
+        assert fail.provided == "SELECT 2"
+        assert Solves.query.count() == 0
+        assert get_job(job_id)["result"]["status"] == "incorrect"
+    destroy_ctfd(app)
+
+
+def test_judge_job_queue_rejects_when_full():
+    """
+    Test that submitting to a full job queue raises JudgeBusy
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        gen_challenge(app.db)
+        gen_challenge(app.db)
+        jobs = JudgeJobQueue(app, max_pending=1)
+        # Keep the workers from draining the queue during the test
+        jobs.started = True
+        submit_job(app, jobs)
+        with pytest.raises(JudgeBusy):
+            submit_job(app, jobs, challenge_id=2)
+        assert jobs.queue.qsize() == 1
+    destroy_ctfd(app)
+
+
+def test_judge_job_queue_allows_one_pending_job_per_challenge():
+    """
+    Test that an account can't queue another job for a challenge until its pending one is judged
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        gen_challenge(app.db)
+        jobs = JudgeJobQueue(app)
+        jobs.started = True
+        submit_job(app, jobs)
+        with pytest.raises(JobPending):
+            submit_job(app, jobs)
+        assert jobs.queue.qsize() == 1
+
+        incorrect = ChallengeResponse(status="incorrect", message="Incorrect")
+        with patch.object(SQLChallengeType, "judge", return_value=incorrect):
+            jobs.run(jobs.queue.get_nowait())
+        submit_job(app, jobs)
+        assert jobs.queue.qsize() == 1
+    destroy_ctfd(app)
+
+
+def test_judge_job_rechecks_max_attempts():
+    """
+    Test that a job is not judged or recorded once the account is out of attempts
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        chal = gen_challenge(app.db)
+        chal.max_attempts = 1
+        app.db.session.commit()
+        jobs = JudgeJobQueue(app)
+        # Keep the workers from taking the job during the test
+        jobs.started = True
+        job_id = submit_job(app, jobs)
+        gen_fail(app.db, user_id=2, challenge_id=1)
+
+        with patch.object(SQLChallengeType, "judge") as fake_judge:
+            result = jobs.run(jobs.queue.get_nowait())
+
+        fake_judge.assert_not_called()
+        assert result["status"] == "ratelimited"
+        assert Fails.query.count() == 1
+        assert get_job(job_id)["result"]["status"] == "ratelimited"
+    destroy_ctfd(app)
+
+
+def test_judge_job_queue_judges_in_the_background():
+    """
+    Test that queued jobs are judged by the worker threads without gevent monkey patching
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        gen_challenge(app.db)
+        jobs = JudgeJobQueue(app, workers=1)
+        correct = ChallengeResponse(status="correct", message="Correct")
+        with patch.object(SQLChallengeType, "judge", return_value=correct):
+            job_id = submit_job(app, jobs)
+            deadline = time.time() + 5
+            while get_job(job_id)["status"] != "done" and time.time() < deadline:
+                time.sleep(0.05)
+        assert get_job(job_id)["result"]["status"] == "correct"
+        app.db.session.remove()
+        assert Solves.query.filter_by(user_id=2, challenge_id=1).count() == 1
+    destroy_ctfd(app)
@@ -0,0 +1,262 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from flask import request
+
+from CTFd.plugins.sql_challenges import SQLChallengeType
+from CTFd.plugins.sql_challenges.judge import (
+    JudgeAdmission,
+    JudgeBusy,
+    JudgeClient,
+    JudgeMemo,
+    JudgeMetrics,
+    normalize_query,
+)
+from tests.helpers import create_ctfd, destroy_ctfd
+
+
+def test_judge_metrics_snapshot():
+    """
+    Test that JudgeMetrics aggregates latency and errors per endpoint
+    """
+    metrics = JudgeMetrics()
+    metrics.record("/judge", 0.2)
+    metrics.record("/judge", 0.4, error=True)
+    metrics.record("/execute", 0.1)
+
+    data = metrics.snapshot()
+    assert data["/judge"]["count"] == 2
+    assert data["/judge"]["errors"] == 1
+    assert data["/judge"]["max_seconds"] == 0.4
+    assert data["/judge"]["avg_seconds"] == pytest.approx(0.3)
+    assert data["/execute"]["count"] == 1
+    assert data["/execute"]["errors"] == 0
+
+
+def test_judge_client_reuses_session_and_records_metrics():
+    """
+    Test that JudgeClient posts through its pooled session and records latency
+    """
+    client = JudgeClient("http://judge:8080/", connect_timeout=1, read_timeout=5)
+    response = Mock(status_code=200)
+    with patch.object(client.session, "post", return_value=response) as fake_post:
+        assert client.post("/judge", {"user_query": "SELECT 1"}) is response
+        assert client.post("/judge", {"user_query": "SELECT 2"}) is response
+
+    assert fake_post.call_count == 2
+    args, kwargs = fake_post.call_args
+    assert args == ("http://judge:8080/judge",)
+    assert kwargs["json"] == {"user_query": "SELECT 2"}
+    assert kwargs["timeout"] == (1, 5)
+    assert client.metrics.snapshot()["/judge"]["count"] == 2
+
+
+def test_judge_client_records_connection_errors():
+    """
+    Test that JudgeClient counts failed requests and re-raises the error
+    """
+    client = JudgeClient("http://judge:8080")
+    with patch.object(
+        client.session, "post", side_effect=requests.ConnectionError("refused")
+    ):
+        with pytest.raises(requests.ConnectionError):
+            client.post("/execute", {})
+
+    stats = client.metrics.snapshot()["/execute"]
+    assert stats["count"] == 1
+    assert stats["errors"] == 1
+
+
+def test_judge_client_only_retries_connection_errors():
+    """
+    Test that the pooled adapter retries connection errors but not reads
+    """
+    client = JudgeClient("http://judge:8080", pool_size=7, retries=3)
+    adapter = client.session.get_adapter("http://judge:8080")
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.connect == 3
+    assert adapter.max_retries.read == 0
+
+
+def test_judge_admission_rejects_when_queue_is_full():
+    """
+    Test that JudgeAdmission rejects callers once in-flight and queue slots are used up
+    """
+    admission = JudgeAdmission(max_in_flight=1, max_queued=0, queue_timeout=0)
+    with admission.slot():
+        assert admission.snapshot()["in_flight"] == 1
+        with pytest.raises(JudgeBusy):
+            with admission.slot():
+                pass
+    assert admission.snapshot()["rejected"] == 1
+
+    # The slot is released again after use
+    with admission.slot():
+        pass
+    assert admission.snapshot()["in_flight"] == 0
+
+
+def test_judge_admission_times_out_queued_callers():
+    """
+    Test that queued callers give up after the queue timeout
+    """
+    admission = JudgeAdmission(max_in_flight=1, max_queued=1, queue_timeout=0.01)
+    with admission.slot():
+        with pytest.raises(JudgeBusy):
+            with admission.slot():
+                pass
+    stats = admission.snapshot()
+    assert stats["queued"] == 0
+    assert stats["rejected"] == 1
+
+
+def test_normalize_query_keeps_quoted_text_and_comments():
+    """
+    Test that normalize_query only collapses whitespace that does not matter
+    """
+    assert normalize_query("  SELECT  *   FROM t ;  ") == "SELECT * FROM t"
+    assert normalize_query("SELECT * FROM t WHERE a = 'x  y';") == (
+        "SELECT * FROM t WHERE a = 'x  y'"
+    )
+    # A line break ends a comment so it must not be turned into a space
+    assert normalize_query("SELECT 1 -- one\n  , 2") == "SELECT 1 -- one\n, 2"
+    assert normalize_query("SELECT 1 -- one , 2") != normalize_query(
+        "SELECT 1 -- one\n, 2"
+    )
+    # Quotes inside comments don't start strings
+    for comment in ("-- don't", "# don't", "/* don't */"):
+        query = "SELECT 1 {}\n; SELECT 'a  b'".format(comment)
+        assert normalize_query(query) != normalize_query(query.replace("  ", " "))
+    assert normalize_query("SELECT  1 /* a  \n b */") == "SELECT 1 /* a  \n b */"
+    # Unclosed strings are left as they are
+    assert normalize_query("SELECT  'a  b") == "SELECT  'a  b"
+
+
+def test_judge_memo_serves_recent_results_from_cache():
+    """
+    Test that JudgeMemo returns a cached result instead of judging again
+    """
+    app = create_ctfd()
+    with app.app_context():
+        memo = JudgeMemo(ttl=30)
+        func = Mock(return_value="correct")
+        assert memo.run("key", func) == "correct"
+        assert memo.run("key", func) == "correct"
+        assert func.call_count == 1
+        stats = memo.snapshot()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+    destroy_ctfd(app)
+
+
+def test_judge_memo_coalesces_concurrent_calls():
+    """
+    Test that concurrent JudgeMemo calls with the same key share one judge call
+    """
+    memo = JudgeMemo(ttl=0)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def judge():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "correct"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(memo.run("key", judge)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(memo.run("key", judge)))
+    follower.start()
+    for _ in range(500):
+        if memo.snapshot()["coalesced"]:
+            break
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["correct", "correct"]
+    assert len(calls) == 1
+    assert memo.snapshot()["in_flight"] == 0
+
+
+def test_judge_memo_does_not_keep_errors():
+    """
+    Test that a failed judge call is raised and retried by the next caller
+    """
+    memo = JudgeMemo(ttl=0)
+    with pytest.raises(JudgeBusy):
+        memo.run("key", Mock(side_effect=JudgeBusy))
+    assert memo.run("key", Mock(return_value="incorrect")) == "incorrect"
+
+
+def test_sql_challenge_judge_shares_results_of_identical_submissions():
+    """
+    Test that resubmitting the same query only reaches the judge server once
+    and that judge server errors are not remembered
+    """
+    app = create_ctfd()
+    with app.app_context():
+        challenge = Mock(id=1, init_query="CREATE TABLE t (a INT)", solution_query="")
+        client = Mock()
+        client.post.return_value = Mock(
+            status_code=200,
+            json=Mock(
+                return_value={
+                    "success": True,
+                    "result": {"columns": ["a"], "rows": [], "row_count": 0},
+                }
+            ),
+        )
+        with patch(
+            "CTFd.plugins.sql_challenges.get_judge_client", return_value=client
+        ), patch(
+            "CTFd.plugins.sql_challenges.get_judge_memo", return_value=JudgeMemo(30)
+        ):
+            first = SQLChallengeType.judge(challenge, "SELECT * FROM t", True)
+            second = SQLChallengeType.judge(challenge, "SELECT *  FROM t;", True)
+            assert first == second
+            assert client.post.call_count == 1
+
+            client.post.return_value = Mock(status_code=500)
+            error = SQLChallengeType.judge(challenge, "SELECT a FROM t", True)
+            assert error.message == "[PREVIEW]\nSQL judge server error: HTTP 500"
+            SQLChallengeType.judge(challenge, "SELECT a FROM t", True)
+            assert client.post.call_count == 3
+    destroy_ctfd(app)
+
+
+def test_saving_sql_challenges_does_not_call_the_judge():
+    """
+    Test that creating and updating a SQL challenge doesn't wait for the judge server
+    """
+    app = create_ctfd()
+    with app.app_context():
+        data = {
+            "name": "sql",
+            "category": "sql",
+            "description": "description",
+            "value": 100,
+            "state": "visible",
+            "type": "sql",
+            "init_query": "CREATE TABLE t (a INT)",
+            "solution_query": "SELECT * FROM t",
+        }
+        client = Mock()
+        client.post.side_effect = requests.ConnectionError
+        with patch("CTFd.plugins.sql_challenges.get_judge_client", return_value=client):
+            with app.test_request_context(method="POST", json=dict(data)):
+                challenge = SQLChallengeType.create(request)
+            data["init_query"] = "CREATE TABLE t (a INT, b INT)"
+            with app.test_request_context(method="PATCH", json=data):
+                challenge = SQLChallengeType.update(challenge, request)
+        assert challenge.init_query == "CREATE TABLE t (a INT, b INT)"
+        paths = [call.args[0] for call in client.post.call_args_list]
+        assert "/execute" not in paths
+    destroy_ctfd(app)
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from CTFd.utils import get_config, set_config
+from flask import g
+from sqlalchemy import event
+
+from CTFd.cache import cache
+from CTFd.models import Configs, db
+from CTFd.utils import CONFIG_GENERATION_KEY, get_config, set_config
 from tests.helpers import create_ctfd, destroy_ctfd
 
 
@@ -22,3 +27,37 @@ def test_get_config_and_set_config():
         assert config.value == "test_config_entry"
         assert get_config("TEST_CONFIG_ENTRY") == "test_config_entry"
     destroy_ctfd(app)
+
+
+def test_get_config_loads_every_config_at_once():
+    """Does get_config load every config in one query and reload them once another process changes one"""
+    app = create_ctfd()
+    with app.app_context():
+        set_config("TEST_CONFIG_ENTRY", "test_config_entry")
+        queries = []
+
+        def listener(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            g.pop("config_generation", None)
+            assert get_config("TEST_CONFIG_ENTRY") == "test_config_entry"
+            assert get_config("setup")
+            assert get_config("user_mode") == "users"
+            assert len(queries) == 1
+
+            # Another process changing a config only changes the generation
+            db.session.execute(
+                Configs.__table__.update()
+                .where(Configs.key == "TEST_CONFIG_ENTRY")
+                .values(value="changed")
+            )
+            db.session.commit()
+            assert get_config("TEST_CONFIG_ENTRY") == "test_config_entry"
+            cache.set(CONFIG_GENERATION_KEY, "other", timeout=0)
+            g.pop("config_generation", None)
+            assert get_config("TEST_CONFIG_ENTRY") == "changed"
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+    destroy_ctfd(app)
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from redis.exceptions import ConnectionError
+
+from CTFd.config import TestingConfig
+from CTFd.models import Fails
+from CTFd.utils.counters import (
+    count_account_fails,
+    get_challenge_fails,
+    get_fail_counters,
+)
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_challenge,
+    gen_fail,
+    gen_user,
+)
+
+
+def check_fail_counts(app):
+    gen_user(app.db, name="user1", email="user1@examplectf.com")
+    gen_challenge(app.db)
+    gen_challenge(app.db)
+
+    old = gen_fail(app.db, user_id=2, challenge_id=1)
+    old.date = datetime.utcnow() - timedelta(minutes=10)
+    app.db.session.commit()
+    assert count_account_fails(2) == 0
+    assert get_challenge_fails(2, 1) == (1, old.date)
+    assert get_challenge_fails(2, 1, seconds=300) == (0, None)
+
+    gen_fail(app.db, user_id=2, challenge_id=1)
+    recent = gen_fail(app.db, user_id=2, challenge_id=2)
+    assert count_account_fails(2) == 2
+    assert get_challenge_fails(2, 1)[0] == 2
+    count, earliest = get_challenge_fails(2, 2, seconds=300)
+    assert count == 1
+    assert abs((earliest - recent.date).total_seconds()) < 0.001
+
+    # Deleted fails stop counting
+    app.db.session.delete(Fails.query.filter_by(id=recent.id).first())
+    app.db.session.commit()
+    assert count_account_fails(2) == 1
+    assert get_challenge_fails(2, 2) == (0, None)
+
+    Fails.query.delete()
+    app.db.session.commit()
+    assert count_account_fails(2) == 0
+    assert get_challenge_fails(2, 1) == (0, None)
+
+
+def test_fail_counts_from_database():
+    """
+    Test that fails are counted in the database without Redis
+    """
+    app = create_ctfd()
+    with app.app_context():
+        assert get_fail_counters() is None
+        check_fail_counts(app)
+    destroy_ctfd(app)
+
+
+def test_fail_counts_from_redis():
+    """
+    Test that fails are counted with Redis sliding window counters
+    """
+
+    class RedisConfig(TestingConfig):
+        REDIS_URL = "redis://localhost:6379/3"
+        CACHE_REDIS_URL = "redis://localhost:6379/3"
+        CACHE_TYPE = "redis"
+
+    try:
+        app = create_ctfd(config=RedisConfig)
+    except ConnectionError:
+        print("Failed to connect to redis. Skipping test.")
+    else:
+        with app.app_context():
+            assert get_fail_counters() is not None
+            check_fail_counts(app)
+        destroy_ctfd(app)
+
+
+def test_fail_counts_from_redis_keep_fails_committed_while_loading():
+    """
+    Test that a fail committed while a Redis counter is loaded is counted
+    """
+
+    class RedisConfig(TestingConfig):
+        REDIS_URL = "redis://localhost:6379/3"
+        CACHE_REDIS_URL = "redis://localhost:6379/3"
+        CACHE_TYPE = "redis"
+
+    try:
+        app = create_ctfd(config=RedisConfig)
+    except ConnectionError:
+        print("Failed to connect to redis. Skipping test.")
+    else:
+        with app.app_context():
+            gen_user(app.db, name="user1", email="user1@examplectf.com")
+            gen_challenge(app.db)
+            gen_fail(app.db, user_id=2, challenge_id=1)
+            counters = get_fail_counters()
+            counters.clear_all()
+
+            class CommitAfterRead(object):
+                def __init__(self, query):
+                    self.query = query
+
+                def with_entities(self, *entities):
+                    rows = self.query.with_entities(*entities).all()
+                    # Committed after the read but before the counter is stored
+                    gen_fail(app.db, user_id=2, challenge_id=1)
+                    return rows
+
+            key = counters.key("users", 2, 1)
+            query = CommitAfterRead(Fails.query.filter_by(user_id=2, challenge_id=1))
+            count, _ = counters.window(key, query, 60)
+            assert count == 2
+            assert get_challenge_fails(2, 1)[0] == 2
+        destroy_ctfd(app)
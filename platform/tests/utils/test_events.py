@@ -1,11 +1,16 @@
-from collections import defaultdict
-from queue import Queue
-from unittest.mock import patch
+import time
 
 from redis.exceptions import ConnectionError
 
 from CTFd.config import TestingConfig
-from CTFd.utils.events import EventManager, RedisEventManager, ServerSentEvent
+from CTFd.utils.events import (
+    KEEPALIVE_INTERVAL,
+    EventBuffer,
+    EventManager,
+    RedisEventManager,
+    ServerSentEvent,
+    Subscriber,
+)
 from tests.helpers import create_ctfd, destroy_ctfd, login_as_user, register_user
 
 
@@ -18,33 +23,36 @@ def test_event_manager_installed():
 
 def test_event_manager_subscription():
     """Test that EventManager subscribing works"""
-    with patch.object(Queue, "get") as fake_queue:
-        saved_data = {
-            "user_id": None,
-            "title": "asdf",
-            "content": "asdf",
-            "team_id": None,
-            "user": None,
-            "team": None,
-            "date": "2019-01-28T01:20:46.017649+00:00",
-            "id": 10,
-        }
-        saved_event = {"type": "notification", "data": saved_data}
-
-        fake_queue.return_value = saved_event
-        event_manager = EventManager()
-        events = event_manager.subscribe()
-        message = next(events)
-        assert isinstance(message, ServerSentEvent)
-        assert message.to_dict() == {"data": "ping", "type": "ping"}
-        assert message.__str__().startswith("event:ping")
-        assert len(event_manager.clients) == 1
-
-        message = next(events)
-        assert isinstance(message, ServerSentEvent)
-        assert message.to_dict() == saved_event
-        assert message.__str__().startswith("event:notification\ndata:")
-        assert len(event_manager.clients) == 1
+    saved_data = {
+        "user_id": None,
+        "title": "asdf",
+        "content": "asdf",
+        "team_id": None,
+        "user": None,
+        "team": None,
+        "date": "2019-01-28T01:20:46.017649+00:00",
+        "id": 10,
+    }
+    saved_event = {"type": "notification", "data": saved_data}
+
+    event_manager = EventManager()
+    events = event_manager.subscribe()
+    message = next(events)
+    assert isinstance(message, ServerSentEvent)
+    assert message.to_dict() == {"data": "ping", "type": "ping"}
+    assert message.__str__().startswith("event:ping")
+    assert len(event_manager.clients) == 1
+
+    event_manager.publish(**saved_event)
+    message = next(events)
+    assert isinstance(message, ServerSentEvent)
+    assert message.to_dict() == dict(saved_event, id=message.id)
+    assert message.__str__().startswith("event:notification\ndata:")
+    assert message.__str__().endswith("id:{}\n\n".format(message.id))
+    assert len(event_manager.clients) == 1
+
+    events.close()
+    assert len(event_manager.clients) == 0
 
 
 def test_event_manager_publish():
@@ -61,37 +69,148 @@ def test_event_manager_publish():
     }
 
     event_manager = EventManager()
-    q = defaultdict(Queue)
-    event_manager.clients[id(q)] = q
-    event_manager.publish(data=saved_data, type="notification", channel="ctf")
-
-    event = event_manager.clients[id(q)]["ctf"].get()
-    event = ServerSentEvent(**event)
+    client = Subscriber("ctf")
+    event_manager.add_client(client)
+    assert (
+        event_manager.publish(data=saved_data, type="notification", channel="ctf") == 1
+    )
+    assert client.wakeup.is_set()
+
+    events, cursor = event_manager.get_buffer("ctf").read(client.cursor)
+    assert cursor == 1
+    event_id, message, user_id, team_id = events[0]
+    event = ServerSentEvent(id=event_id, **message)
     assert event.data == saved_data
+    assert user_id is None and team_id is None
+
+    # Event IDs given by callers are ignored
+    assert event_manager.publish(data=saved_data, type="notification", id=5) == 1
+    events, cursor = event_manager.get_buffer("ctf").read(cursor)
+    assert events[0][0] != 5
+
+
+def test_event_manager_publish_to_user_and_team():
+    """Test that EventManager only delivers addressed events to their recipients"""
+    event_manager = EventManager()
+    subscriptions = {}
+    for user_id, team_id in ((2, 1), (3, 1), (4, None)):
+        events = event_manager.subscribe(user_id=user_id, team_id=team_id)
+        next(events)
+        subscriptions[user_id] = events
+
+    assert event_manager.publish(data="user", type="notification", user_id=2) == 1
+    assert event_manager.publish(data="team", type="notification", team_id=1) == 2
+    assert event_manager.publish(data="all", type="notification") == 3
+
+    assert len(event_manager.get_buffer("ctf").slots) == event_manager.buffer_size
+    for user_id, expected in ((2, ["user", "team", "all"]), (3, ["team", "all"])):
+        received = [next(subscriptions[user_id]).data for _ in expected]
+        assert received == expected
+    assert next(subscriptions[4]).data == "all"
+
+    for events in subscriptions.values():
+        events.close()
+    assert event_manager.clients == {}
+    assert event_manager.user_clients == {}
+    assert event_manager.team_clients == {}
+
+
+def test_event_manager_replays_missed_events():
+    """Test that EventManager replays buffered events after Last-Event-ID"""
+    event_manager = EventManager(buffer_size=3)
+    for i in range(2):
+        event_manager.publish(data=i, type="notification")
+    buffered, _ = event_manager.get_buffer("ctf").read(0)
+    first_id = buffered[0][0]
+
+    # New clients only get new events
+    events = event_manager.subscribe()
+    next(events)
+    event_manager.publish(data=2, type="notification")
+    assert next(events).data == 2
+    events.close()
+
+    events = event_manager.subscribe(last_event_id=first_id)
+    next(events)
+    assert [next(events).data for _ in range(2)] == [1, 2]
+    events.close()
+
+    # Slow clients skip events that were overwritten in the buffer
+    event_manager.publish(data=3, type="notification")
+    event_manager.publish(data=4, type="notification")
+    events = event_manager.subscribe(last_event_id=first_id)
+    next(events)
+    assert [next(events).data for _ in range(3)] == [2, 3, 4]
+    events.close()
+
+
+def test_event_buffer_seek():
+    """Test that EventBuffer only reports missed events once it has dropped some"""
+    buffer = EventBuffer(size=3)
+    for i in range(1, 3):
+        buffer.append("1-{}".format(i), {"data": i})
+    assert buffer.seek() == (2, False)
+    assert buffer.seek("1-1") == (1, False)
+    # The first buffered event follows the last one seen but nothing was dropped
+    assert buffer.seek("1-0") == (0, False)
+    assert buffer.seek("1-2") == (2, False)
+
+    for i in range(3, 5):
+        buffer.append("1-{}".format(i), {"data": i})
+    assert buffer.seek("1-0") == (1, True)
+    # Only the last event seen was overwritten
+    assert buffer.seek("1-1") == (1, False)
+    assert buffer.seek("1-2") == (2, False)
+
+    # Buffers that didn't start with the channel's first event may miss older ones
+    buffer = EventBuffer(size=3, complete=False)
+    buffer.append("1-1", {"data": 1})
+    assert buffer.seek("1-0") == (0, True)
+    assert buffer.seek("1-1") == (1, False)
+
+
+def test_event_manager_keepalives():
+    """Test that the EventManager ticker only pings idle clients"""
+    event_manager = EventManager()
+    idle = event_manager.subscribe()
+    busy = event_manager.subscribe(user_id=2)
+    next(idle)
+    next(busy)
+    idle_client, busy_client = event_manager.clients.values()
+
+    now = time.time() + KEEPALIVE_INTERVAL
+    busy_client.last_sent = now
+    event_manager.tick(now)
+    assert idle_client.wakeup.is_set()
+    assert busy_client.wakeup.is_set() is False
+    assert next(idle).to_dict() == {"data": "ping", "type": "ping"}
+
+    event_manager.publish(data="hello", type="notification", user_id=2)
+    assert next(busy).data == "hello"
+    event_manager.tick(now + 2)
+    assert event_manager.rate == 0.5
+
+    stats = event_manager.stats()
+    assert stats["clients"] == 2
+    assert stats["users"] == 1
+    assert stats["published"] == 1
+    assert stats["delivered"] == 1
+    assert stats["pings"] == 1
+    # The idle client hasn't read the event that wasn't for it yet
+    assert stats["unread"] == 1
+    idle.close()
+    busy.close()
+    assert event_manager.stats()["clients"] == 0
 
 
 def test_event_endpoint_is_event_stream():
     """Test that the /events endpoint is text/event-stream"""
     app = create_ctfd()
-    with patch.object(Queue, "get") as fake_queue:
-        saved_data = {
-            "user_id": None,
-            "title": "asdf",
-            "content": "asdf",
-            "team_id": None,
-            "user": None,
-            "team": None,
-            "date": "2019-01-28T01:20:46.017649+00:00",
-            "id": 10,
-        }
-        saved_event = {"type": "notification", "data": saved_data}
-
-        fake_queue.return_value = saved_event
-        with app.app_context():
-            register_user(app)
-            with login_as_user(app) as client:
-                r = client.get("/events")
-                assert "text/event-stream" in r.headers["Content-Type"]
+    with app.app_context():
+        register_user(app)
+        with login_as_user(app) as client:
+            r = client.get("/events")
+            assert "text/event-stream" in r.headers["Content-Type"]
     destroy_ctfd(app)
 
 
@@ -139,20 +258,21 @@ def test_redis_event_manager_subscription():
             }
             saved_event = {"type": "notification", "data": saved_data}
 
-            with patch.object(Queue, "get") as fake_queue:
-                fake_queue.return_value = saved_event
-                event_manager = RedisEventManager()
-
-                events = event_manager.subscribe()
-                message = next(events)
-                assert isinstance(message, ServerSentEvent)
-                assert message.to_dict() == {"data": "ping", "type": "ping"}
-                assert message.__str__().startswith("event:ping")
+            event_manager = RedisEventManager()
 
-                message = next(events)
-                assert isinstance(message, ServerSentEvent)
-                assert message.to_dict() == saved_event
-                assert message.__str__().startswith("event:notification\ndata:")
+            events = event_manager.subscribe()
+            message = next(events)
+            assert isinstance(message, ServerSentEvent)
+            assert message.to_dict() == {"data": "ping", "type": "ping"}
+            assert message.__str__().startswith("event:ping")
+
+            # Events read from the stream are broadcast to local clients
+            event_manager.broadcast("ctf", "1-0", saved_event)
+            message = next(events)
+            assert isinstance(message, ServerSentEvent)
+            assert message.to_dict() == dict(saved_event, id="1-0")
+            assert message.__str__().startswith("event:notification\ndata:")
+            events.close()
         destroy_ctfd(app)
 
 
@@ -182,7 +302,12 @@ def test_redis_event_manager_publish():
             }
 
             event_manager = RedisEventManager()
-            event_manager.publish(data=saved_data, type="notification", channel="ctf")
+            assert (
+                event_manager.publish(
+                    data=saved_data, type="notification", id=5, channel="ctf"
+                )
+                == 0
+            )
         destroy_ctfd(app)
 
 
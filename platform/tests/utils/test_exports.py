@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
+import datetime
 import json
 import os
 import zipfile
+from collections import OrderedDict
+from io import BytesIO
+from unittest.mock import patch
 
-from CTFd.models import Challenges, Flags, Teams, Users
+from sqlalchemy import text
+
+from CTFd.models import Challenges, Flags, Tags, Teams, Users
 from CTFd.utils import text_type
-from CTFd.utils.exports import export_ctf, import_ctf
+from CTFd.utils.exports import export_ctf, import_ctf, prepare_entry
+from CTFd.utils.exports.loaders import BulkLoader, iter_results
+from CTFd.utils.exports.serializers import JSONEncoder, JSONSerializer
 from tests.helpers import (
     create_ctfd,
     destroy_ctfd,
@@ -52,6 +60,83 @@ def test_export_ctf():
     destroy_ctfd(app)
 
 
+def test_json_serializer_streams_export_format():
+    """Test that JSONSerializer writes rows in the export format one at a time"""
+    app = create_ctfd()
+    with app.app_context():
+        rows = [
+            OrderedDict(
+                [
+                    ("id", 1),
+                    ("name", text_type("🐺")),
+                    ("date", datetime.datetime(2020, 1, 2, 3, 4, 5)),
+                    ("requirements", '{"prerequisites": [2]}'),
+                ]
+            ),
+            OrderedDict([("id", 2), ("name", "b"), ("date", None)]),
+        ]
+        fileobj = BytesIO()
+        JSONSerializer(iter(rows), fileobj).serialize()
+        expected = OrderedDict([("count", 2), ("results", rows), ("meta", {})])
+        assert fileobj.getvalue() == json.dumps(
+            expected, cls=JSONEncoder, separators=(",", ":")
+        ).encode("utf-8")
+        assert rows[0]["requirements"] == {"prerequisites": [2]}
+
+        # Empty tables are written as empty files
+        fileobj = BytesIO()
+        JSONSerializer(iter([]), fileobj).serialize()
+        assert fileobj.getvalue() == b""
+    destroy_ctfd(app)
+
+
+def test_bulk_loader_inserts_exported_tables():
+    """Test that BulkLoader parses exported tables incrementally and inserts them"""
+    app = create_ctfd()
+    with app.app_context():
+        gen_challenge(app.db)
+        rows = [
+            OrderedDict([("id", i), ("challenge_id", 1), ("value", "tag{}".format(i))])
+            for i in range(1, 8)
+        ]
+        tags = BytesIO()
+        JSONSerializer(iter(rows), tags).serialize()
+
+        # Rows that span reads are parsed once the rest of them is read
+        count, parsed = iter_results(BytesIO(tags.getvalue()), read_size=16)
+        assert count == 7
+        assert list(parsed) == rows
+        count, parsed = iter_results(BytesIO(json.dumps({"results": rows}).encode()))
+        assert (count, list(parsed)) == (7, rows)
+
+        backup = BytesIO()
+        with zipfile.ZipFile(backup, "w") as export:
+            export.writestr("db/tags.json", tags.getvalue())
+            export.writestr("db/plugin_table.json", tags.getvalue())
+        statuses = []
+        loader = BulkLoader(
+            app.db.engine,
+            zipfile.ZipFile(backup),
+            prepare=prepare_entry,
+            status=statuses.append,
+            chunk_size=3,
+        )
+        assert loader.load("db/tags.json") is True
+        assert loader.load("db/missing.json") is True
+        # Tables that don't exist are left to dataset
+        assert loader.load("db/plugin_table.json") is False
+
+        assert statuses == [
+            "inserting db/tags.json 3/7",
+            "inserting db/tags.json 6/7",
+            "inserting db/tags.json 7/7",
+        ]
+        assert [(t.id, t.value) for t in Tags.query.order_by(Tags.id)] == [
+            (i, "tag{}".format(i)) for i in range(1, 8)
+        ]
+    destroy_ctfd(app)
+
+
 def test_import_ctf():
     """Test that CTFd can import a CTF"""
     app = create_ctfd()
@@ -102,3 +187,84 @@ def test_import_ctf():
                 chal = Challenges.query.filter_by(name="chal_name10").first()
                 assert chal.requirements == {"prerequisites": [1]}
     destroy_ctfd(app)
+
+
+def test_import_ctf_with_workers():
+    """Test that CTFd can import a CTF with bulk inserts on parallel connections"""
+    app = create_ctfd()
+    if not app.config.get("SQLALCHEMY_DATABASE_URI").startswith("sqlite"):
+        with app.app_context():
+            for x in range(5):
+                gen_user(
+                    app.db,
+                    name="user{}".format(x),
+                    email="user{}@examplectf.com".format(x),
+                )
+            for x in range(3):
+                gen_team(
+                    app.db,
+                    name="team{}".format(x),
+                    email="team{}@examplectf.com".format(x),
+                )
+            for x in range(4):
+                chal = gen_challenge(app.db, name="chal_name{}".format(x))
+                gen_flag(app.db, challenge_id=chal.id, content="flag")
+            chal = gen_challenge(
+                app.db, name="chal_name4", requirements={"prerequisites": [1]}
+            )
+            gen_flag(app.db, challenge_id=chal.id, content="flag")
+            app.db.session.commit()
+            counts = (Users.query.count(), Teams.query.count())
+
+            backup = zipfile.ZipFile(export_ctf())
+            with zipfile.ZipFile("export.test_import_ctf_with_workers.zip", "w") as f:
+                for member in backup.namelist():
+                    f.writestr(member, backup.read(member))
+                # Tables that aren't in the database are created through dataset
+                rows = [{"id": 1, "value": "a"}, {"id": 2, "value": "b"}]
+                f.writestr(
+                    "db/import_extra.json",
+                    json.dumps({"count": 2, "results": rows, "meta": {}}),
+                )
+    destroy_ctfd(app)
+
+    def check_import(app):
+        if not app.config.get("SQLALCHEMY_DATABASE_URI").startswith("postgres"):
+            # TODO: Dig deeper into why Postgres fails here
+            assert (Users.query.count(), Teams.query.count()) == counts
+            assert Challenges.query.count() == 5
+            assert Flags.query.count() == 5
+
+            chal = Challenges.query.filter_by(name="chal_name4").first()
+            assert chal.requirements == {"prerequisites": [1]}
+            values = app.db.session.execute(
+                text("SELECT value FROM import_extra ORDER BY id")
+            ).fetchall()
+            assert [value for value, in values] == ["a", "b"]
+
+    app = create_ctfd()
+    if not app.config.get("SQLALCHEMY_DATABASE_URI").startswith("sqlite"):
+        with app.app_context():
+            import_ctf("export.test_import_ctf_with_workers.zip", workers=2)
+            check_import(app)
+    destroy_ctfd(app)
+
+    app = create_ctfd()
+    if not app.config.get("SQLALCHEMY_DATABASE_URI").startswith("sqlite"):
+        with app.app_context():
+            runner = app.test_cli_runner()
+            with patch("CTFd.cli.import_ctf_util", wraps=import_ctf) as fake_import:
+                result = runner.invoke(
+                    args=[
+                        "import_ctf",
+                        "export.test_import_ctf_with_workers.zip",
+                        "--workers",
+                        "2",
+                        "--delete_import_on_finish",
+                    ]
+                )
+            assert result.exit_code == 0
+            assert fake_import.call_args.kwargs["workers"] == 2
+            check_import(app)
+            assert not os.path.exists("export.test_import_ctf_with_workers.zip")
+    destroy_ctfd(app)
@@ -1,4 +1,26 @@
-from tests.helpers import create_ctfd, destroy_ctfd, register_user
+from redis.exceptions import ConnectionError
+
+from CTFd.config import TestingConfig
+from CTFd.utils import set_config
+from CTFd.utils.ratelimit import (
+    FIXED_WINDOW,
+    SLIDING_WINDOW,
+    TOKEN_BUCKET,
+    RateLimiter,
+    RedisRateLimiter,
+    fixed_window,
+    get_rate_limiter,
+    sliding_window,
+    token_bucket,
+)
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_challenge,
+    gen_flag,
+    login_as_user,
+    register_user,
+)
 
 
 def test_ratelimit_on_auth():
@@ -22,3 +44,154 @@ def test_ratelimit_on_auth():
                 r = client.post("/login", data=data)
                 assert r.status_code == 429
     destroy_ctfd(app)
+
+
+def hits(algorithm, times, limit=3, interval=10):
+    state = None
+    results = []
+    for now in times:
+        allowed, state = algorithm(state, now, limit, interval)
+        results.append(allowed)
+    return results
+
+
+def test_fixed_window():
+    """
+    Test that the fixed window resets an interval after the last allowed hit
+    """
+    assert hits(fixed_window, [0, 1, 2, 3, 11]) == [True, True, True, False, False]
+    assert hits(fixed_window, [0, 1, 2, 3, 12]) == [True, True, True, False, True]
+
+
+def test_sliding_window():
+    """
+    Test that the sliding window weighs in the hits of the previous window
+    """
+    assert hits(sliding_window, [0, 1, 2, 3]) == [True, True, True, False]
+    # Halfway through the next window half of the previous hits still count
+    assert hits(sliding_window, [7, 8, 9, 15, 15, 15]) == [
+        True,
+        True,
+        True,
+        True,
+        True,
+        False,
+    ]
+    assert hits(sliding_window, [0, 1, 2, 25]) == [True, True, True, True]
+
+
+def test_token_bucket():
+    """
+    Test that the token bucket allows bursts and refills over time
+    """
+    assert hits(token_bucket, [0, 0, 0, 0]) == [True, True, True, False]
+    # A token comes back every interval / limit seconds
+    assert hits(token_bucket, [0, 0, 0, 1, 3.4, 3.4]) == [
+        True,
+        True,
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def check_rate_limiter(limiter):
+    for algorithm in (FIXED_WINDOW, SLIDING_WINDOW, TOKEN_BUCKET):
+        key = "test:" + algorithm
+        limiter.reset(key)
+        assert [limiter.hit(key, 2, 60, algorithm=algorithm) for _ in range(3)] == [
+            True,
+            True,
+            False,
+        ]
+        assert limiter.hit("other:" + algorithm, 2, 60, algorithm=algorithm)
+        limiter.reset(key)
+        assert limiter.hit(key, 2, 60, algorithm=algorithm)
+        limiter.reset(key)
+        limiter.reset("other:" + algorithm)
+
+
+def test_rate_limiter():
+    """
+    Test that the in process rate limiter limits each key separately
+    """
+    app = create_ctfd()
+    with app.app_context():
+        limiter = get_rate_limiter()
+        assert type(limiter) is RateLimiter
+        assert get_rate_limiter() is limiter
+        check_rate_limiter(limiter)
+    destroy_ctfd(app)
+
+
+def test_redis_rate_limiter():
+    """
+    Test that the Redis rate limiter limits each key separately
+    """
+
+    class RedisConfig(TestingConfig):
+        REDIS_URL = "redis://localhost:6379/3"
+        CACHE_REDIS_URL = "redis://localhost:6379/3"
+        CACHE_TYPE = "redis"
+
+    try:
+        app = create_ctfd(config=RedisConfig)
+    except ConnectionError:
+        print("Failed to connect to redis. Skipping test.")
+    else:
+        with app.app_context():
+            limiter = get_rate_limiter()
+            assert isinstance(limiter, RedisRateLimiter)
+            check_rate_limiter(limiter)
+        destroy_ctfd(app)
+
+
+def test_challenge_attempts_are_ratelimited():
+    """
+    Test that users can't submit attempts faster than submissions_per_min
+    """
+    app = create_ctfd()
+    with app.app_context():
+        set_config("submissions_per_min", 3)
+        register_user(app)
+        client = login_as_user(app)
+        gen_challenge(app.db)
+        data = {"submission": "wrong", "challenge_id": 1}
+        for _ in range(3):
+            r = client.post("/api/v1/challenges/attempt", json=data)
+            assert r.status_code == 200
+        r = client.post("/api/v1/challenges/attempt", json=data)
+        assert r.status_code == 429
+        assert r.get_json()["data"]["status"] == "ratelimited"
+
+        # Admins aren't limited
+        admin = login_as_user(app, name="admin", password="password")
+        for _ in range(4):
+            r = admin.post("/api/v1/challenges/attempt", json=data)
+            assert r.status_code == 200
+    destroy_ctfd(app)
+
+
+def test_challenge_attempts_are_not_ratelimited_by_default():
+    """
+    Test that attempts are only limited by submissions_per_min once it is set
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        client = login_as_user(app)
+        gen_challenge(app.db)
+        gen_flag(app.db, challenge_id=1, content="flag")
+        set_config("incorrect_submissions_per_min", 100)
+        data = {"submission": "wrong", "challenge_id": 1}
+        for _ in range(40):
+            r = client.post("/api/v1/challenges/attempt", json=data)
+            assert r.status_code == 200
+            assert r.get_json()["data"]["status"] == "incorrect"
+        r = client.post(
+            "/api/v1/challenges/attempt", json={"submission": "flag", "challenge_id": 1}
+        )
+        assert r.status_code == 200
+        assert r.get_json()["data"]["status"] == "correct"
+    destroy_ctfd(app)
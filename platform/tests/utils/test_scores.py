@@ -0,0 +1,222 @@
+import pickle
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from CTFd.cache import clear_standings
+from CTFd.models import Awards, Challenges, Solves, Users
+from CTFd.utils import set_config
+from CTFd.utils.dates import unix_time
+from CTFd.utils.scores import get_standings, get_user_places, get_user_standings
+from CTFd.utils.scores.standings import (
+    Board,
+    Standing,
+    StandingsIndex,
+    get_aggregates,
+    standings_index,
+)
+from tests.helpers import (
+    create_ctfd,
+    destroy_ctfd,
+    gen_award,
+    gen_challenge,
+    gen_solve,
+    gen_user,
+)
+
+
+def expected_order(column="user_id", freeze=None):
+    board = Board(column, freeze=freeze)
+    board.load()
+    return board.ranked()
+
+
+def test_standings_order_and_tie_break():
+    """
+    Test that standings are ordered by score and then by who reached it first
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(3):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_challenge(app.db, value=200)
+
+        gen_solve(app.db, user_id=3, challenge_id=1)
+        gen_solve(app.db, user_id=2, challenge_id=1)
+        gen_solve(app.db, user_id=4, challenge_id=2)
+
+        standings = get_standings()
+        assert [s.account_id for s in standings] == [4, 3, 2]
+        assert [s.score for s in standings] == [200, 100, 100]
+        assert standings[0].name == "user2"
+        assert standings[0][-1] == 200
+        assert standings[0]._asdict()["bracket_name"] is None
+        assert [s.account_id for s in get_standings(count=2)] == [4, 3]
+        assert get_standings(count=0) == []
+
+        admin_standings = get_standings(admin=True)
+        assert admin_standings[0].hidden is False
+        assert admin_standings[0].banned is False
+    destroy_ctfd(app)
+
+
+def test_standings_follow_solve_and_award_changes():
+    """
+    Test that the standings index follows created and deleted solves and awards
+    without aggregating every account again
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(2):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_solve(app.db, user_id=2, challenge_id=1)
+        gen_solve(app.db, user_id=3, challenge_id=1)
+        assert [s.account_id for s in get_standings()] == [2, 3]
+
+        with patch.object(Board, "load", autospec=True) as fake_load:
+            award = gen_award(app.db, user_id=3, value=50)
+            assert [s.account_id for s in get_standings()] == [3, 2]
+            assert get_standings()[0].score == 150
+
+            app.db.session.delete(award)
+            app.db.session.commit()
+            clear_standings()
+            assert [(s.account_id, s.score) for s in get_standings()] == [
+                (2, 100),
+                (3, 100),
+            ]
+
+            solve = Solves.query.filter_by(user_id=2).first()
+            app.db.session.delete(solve)
+            app.db.session.commit()
+            clear_standings()
+            assert [s.account_id for s in get_standings()] == [3]
+        assert fake_load.call_count == 0
+        assert standings_index.ranked("user_id") == expected_order()
+
+        # Bulk deletes can't be tracked per account and rebuild the boards
+        Awards.query.delete()
+        Solves.query.delete()
+        app.db.session.commit()
+        clear_standings()
+        assert get_standings() == []
+    destroy_ctfd(app)
+
+
+def test_standings_index_catches_up_from_other_workers():
+    """
+    Test that a worker's standings index applies the changes committed by others
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(3):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_challenge(app.db, value=300)
+        gen_solve(app.db, user_id=2, challenge_id=1)
+
+        other = StandingsIndex()
+        assert other.ranked("user_id") == [(2, 100)]
+
+        gen_solve(app.db, user_id=3, challenge_id=2)
+        gen_award(app.db, user_id=4, value=150)
+        with patch.object(
+            Board, "load", autospec=True, side_effect=Board.load
+        ) as fake_load:
+            assert other.ranked("user_id") == [(3, 300), (4, 150), (2, 100)]
+        assert fake_load.call_count == 0
+        assert other.ranked("user_id") == expected_order()
+
+        # Changing a challenge's value touches every account that solved it
+        challenge = Challenges.query.filter_by(id=1).first()
+        challenge.value = 500
+        app.db.session.commit()
+        assert other.ranked("user_id") == [(2, 500), (3, 300), (4, 150)]
+    destroy_ctfd(app)
+
+
+def test_standings_freeze():
+    """
+    Test that solves after the freeze are only shown to admins
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(2):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_solve(app.db, user_id=2, challenge_id=1)
+        set_config("freeze", unix_time(datetime.utcnow() + timedelta(seconds=1)))
+
+        solve = gen_solve(app.db, user_id=3, challenge_id=1)
+        solve.date = datetime.utcnow() + timedelta(days=1)
+        app.db.session.commit()
+        clear_standings()
+
+        assert [s.account_id for s in get_standings()] == [2]
+        assert [s.user_id for s in get_user_standings()] == [2]
+        assert [s.account_id for s in get_standings(admin=True)] == [2, 3]
+    destroy_ctfd(app)
+
+
+def test_get_place_uses_place_map():
+    """
+    Test that places are looked up from a place map built once from the standings
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(3):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_challenge(app.db, value=200)
+        gen_solve(app.db, user_id=3, challenge_id=1)
+        gen_solve(app.db, user_id=4, challenge_id=2)
+        user = Users.query.filter_by(id=4).first()
+        user.hidden = True
+        app.db.session.commit()
+
+        with patch(
+            "CTFd.utils.scores.get_user_standings", wraps=get_user_standings
+        ) as fake_standings:
+            for _ in range(3):
+                assert Users.query.filter_by(id=3).first().get_place() == "1st"
+                assert Users.query.filter_by(id=2).first().get_place() is None
+        # The standings are read once to build the place map for every lookup
+        assert fake_standings.call_count == 1
+        assert get_user_places() == {3: 1}
+        assert get_user_places(admin=True) == {4: 1, 3: 2}
+        assert Users.query.filter_by(id=3).first().get_place(admin=True) == "2nd"
+        assert Users.query.filter_by(id=4).first().get_place(numeric=True) is None
+
+        gen_award(app.db, user_id=2, value=500)
+        assert Users.query.filter_by(id=2).first().get_place() == "1st"
+        assert Users.query.filter_by(id=3).first().get_place(numeric=True) == 2
+    destroy_ctfd(app)
+
+
+def test_standing_rows_can_be_pickled():
+    """
+    Test that standings rows survive the cache's serialization
+    """
+    row = Standing(("account_id", "name", "score"), (1, "user", 100))
+    loaded = pickle.loads(pickle.dumps(row))
+    assert loaded == (1, "user", 100)
+    assert loaded.name == "user"
+    assert loaded._fields == ("account_id", "name", "score")
+
+
+def test_get_aggregates_filters_accounts():
+    """
+    Test that aggregates can be limited to some accounts
+    """
+    app = create_ctfd()
+    with app.app_context():
+        for i in range(2):
+            gen_user(app.db, name=f"user{i}", email=f"user{i}@examplectf.com")
+        gen_challenge(app.db, value=100)
+        gen_solve(app.db, user_id=2, challenge_id=1)
+        gen_solve(app.db, user_id=3, challenge_id=1)
+        aggregates = get_aggregates("user_id", account_ids=[3])
+        assert list(aggregates) == [3]
+        assert aggregates[3][0] == 100
+    destroy_ctfd(app)
@@ -1,6 +1,10 @@
 from unittest.mock import Mock, patch
 from uuid import UUID
 
+from redis.exceptions import ConnectionError
+
+from CTFd.config import TestingConfig
+from CTFd.utils.sessions import SessionStore
 from tests.helpers import create_ctfd, destroy_ctfd, login_as_user, register_user
 
 
@@ -29,7 +33,6 @@ def test_session_invalidation_on_admin_password_change():
     with app.app_context():
         register_user(app)
         with login_as_user(app, name="admin") as admin, login_as_user(app) as user:
-
             r = user.get("/settings")
             assert r.status_code == 200
 
@@ -49,7 +52,6 @@ def test_session_invalidation_on_user_password_change():
     with app.app_context():
         register_user(app)
         with login_as_user(app) as user:
-
             r = user.get("/settings")
             assert r.status_code == 200
 
@@ -95,3 +97,55 @@ def test_session_with_duplicate_session_id():
         with patch(target="CTFd.utils.sessions.uuid4", new=uuid_mock):
             login_as_user(app, name="user1")
     destroy_ctfd(app)
+
+
+def test_sessions_are_not_loaded_for_static_files():
+    """Test that the session store isn't used for theme files and unchanged sessions aren't saved"""
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        with login_as_user(app) as client:
+            with patch.object(
+                SessionStore, "load", autospec=True, side_effect=SessionStore.load
+            ) as load, patch.object(SessionStore, "set", autospec=True) as save:
+                r = client.get("/themes/core/static/img/favicon.ico")
+                assert r.status_code == 200
+                assert "Set-Cookie" not in r.headers
+                assert load.call_count == 0
+
+                r = client.get("/settings")
+                assert r.status_code == 200
+                assert load.call_count == 1
+                assert save.call_count == 0
+    destroy_ctfd(app)
+
+
+def test_redis_sessions_refresh_their_timeout():
+    """Test that unchanged sessions have their timeout refreshed in Redis once half of it passed"""
+
+    class RedisConfig(TestingConfig):
+        REDIS_URL = "redis://localhost:6379/4"
+        CACHE_REDIS_URL = "redis://localhost:6379/4"
+        CACHE_TYPE = "redis"
+
+    try:
+        app = create_ctfd(config=RedisConfig)
+    except ConnectionError:
+        print("Failed to connect to redis. Skipping test.")
+    else:
+        with app.app_context():
+            register_user(app)
+            with login_as_user(app) as client:
+                store = app.session_interface.get_store(app)
+                (key,) = store.client.keys(store.prefix + "*")
+                timeout = store.client.ttl(key)
+
+                r = client.get("/settings")
+                assert "Set-Cookie" not in r.headers
+                assert store.client.ttl(key) <= timeout
+
+                store.client.expire(key, timeout // 4)
+                r = client.get("/settings")
+                assert "Set-Cookie" in r.headers
+                assert store.client.ttl(key) > timeout // 2
+        destroy_ctfd(app)
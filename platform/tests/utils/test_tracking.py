@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta
+
+from CTFd.models import Tracking, Users
+from CTFd.utils.tracking import TrackingBuffer
+from tests.helpers import create_ctfd, destroy_ctfd, login_as_user, register_user
+
+
+def test_tracking_buffer_defers_request_writes():
+    """
+    Test that requests only buffer tracking data until it is flushed
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        client = login_as_user(app)
+        app.tracking_buffer = TrackingBuffer(app)
+        # Keep the background thread from flushing during the test
+        app.tracking_buffer.started = True
+        Tracking.query.filter_by(user_id=2).delete()
+        app.db.session.commit()
+
+        client.post("/api/v1/tokens", json={})
+        assert Tracking.query.filter_by(user_id=2).count() == 0
+        assert list(app.tracking_buffer.pending) == [(2, "127.0.0.1")]
+
+        assert app.tracking_buffer.flush() == 1
+        track = Tracking.query.filter_by(user_id=2).one()
+        assert track.ip == "127.0.0.1"
+        assert app.tracking_buffer.flush() == 0
+
+        # Seeing the user again updates their row instead of adding one
+        later = datetime.utcnow() + timedelta(minutes=1)
+        app.tracking_buffer.record(user_id=2, ip="127.0.0.1", date=later)
+        app.tracking_buffer.record(user_id=2, ip="10.0.0.1")
+        assert app.tracking_buffer.flush() == 2
+        assert Tracking.query.filter_by(user_id=2).count() == 2
+        track = Tracking.query.filter_by(user_id=2, ip="127.0.0.1").one()
+        assert track.date == later
+    destroy_ctfd(app)
+
+
+def test_tracking_buffer_skips_deleted_users():
+    """
+    Test that buffered tracking data of deleted users is dropped
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        buffer = TrackingBuffer(app)
+        buffer.started = True
+        buffer.record(user_id=2, ip="127.0.0.1")
+        buffer.record(user_id=3, ip="127.0.0.1")
+        assert buffer.flush() == 1
+        assert Tracking.query.filter_by(user_id=3).count() == 0
+        assert Users.query.filter_by(id=3).first() is None
+    destroy_ctfd(app)
+
+
+def test_tracking_buffer_flushes_in_the_background():
+    """
+    Test that buffered tracking data is written without gevent monkey patching
+    """
+    app = create_ctfd()
+    with app.app_context():
+        register_user(app)
+        Tracking.query.filter_by(user_id=2).delete()
+        app.db.session.commit()
+        buffer = TrackingBuffer(app, interval=0.05)
+        buffer.record(user_id=2, ip="10.0.0.1")
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            app.db.session.remove()
+            if Tracking.query.filter_by(user_id=2, ip="10.0.0.1").count():
+                break
+            time.sleep(0.05)
+        buffer.stopped.set()
+        assert Tracking.query.filter_by(user_id=2, ip="10.0.0.1").count() == 1
+    destroy_ctfd(app)